@@ -0,0 +1,66 @@
+import sys
+import time
+import random
+
+from src.event_log import quiet
+from src.server import Server
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import DispatchMode, create_dispatcher
+from src.arrivals import PoissonArrivals, OpenLoopGenerator
+
+
+class CountingSink:
+    """
+    Takes requests and does nothing else, so only the generator is measured
+    """
+    def __init__(self):
+        self.routed = 0
+
+    def route_request(self, request_id, key=None):
+        self.routed += 1
+        return True
+
+
+def run_open_loop(rate, seconds=3.0, load_balancer=None):
+    """
+    Send Poisson arrivals at rate for seconds and measure how closely they kept to time
+
+    Returns a dict with the asked and achieved rate and the lateness percentiles
+    """
+
+    with quiet():
+        generator = OpenLoopGenerator(load_balancer or CountingSink(), PoissonArrivals(rate, random.Random(0)))
+        generator.start()
+        time.sleep(seconds)
+        stats = generator.get_stats()
+        generator.stop()
+
+    return {
+        "rate": rate,
+        "send_rate": stats["send_rate"],
+        "p50_lateness": stats["p50_lateness"],
+        "p99_lateness": stats["p99_lateness"]
+    }
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+
+    print(f"Open loop Poisson arrivals, {seconds:.0f}s per rate\n")
+    print(f"{'target':<22}{'req/s':>10}{'sent/s':>10}{'p50 late':>11}{'p99 late':>11}")
+    for rate in (100, 1_000, 10_000, 50_000):
+        result = run_open_loop(rate, seconds)
+        print(f"{'generator only':<22}{rate:>10}{result['send_rate']:>10.0f}"
+              f"{result['p50_lateness'] * 1000:>9.2f}ms{result['p99_lateness'] * 1000:>9.2f}ms")
+
+    # same through a real load balancer that finishes requests instantly
+    with quiet():
+        lb = LoadBalancer(RoutingAlgo.ROTATING, dispatcher=create_dispatcher(DispatchMode.INLINE), queue_size=0)
+        for i in range(4):
+            lb.add_server(Server(f"bench-{i+1}", max_capacity=1_000_000, base_response_time=0.0))
+
+    for rate in (1_000, 5_000):
+        result = run_open_loop(rate, seconds, lb)
+        print(f"{'load balancer':<22}{rate:>10}{result['send_rate']:>10.0f}"
+              f"{result['p50_lateness'] * 1000:>9.2f}ms{result['p99_lateness'] * 1000:>9.2f}ms")
+    lb.shutdown()
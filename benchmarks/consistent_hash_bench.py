@@ -0,0 +1,45 @@
+
+from src.server import Server
+from src.event_log import quiet
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import create_dispatcher, DispatchMode
+
+
+def scale_events(server_count=10, vnodes=100):
+    """
+    Add one server then remove one, report how many keys moved each time
+
+    The ideal is 1/n of the keys for each change
+    """
+
+    with quiet():
+        lb = LoadBalancer(RoutingAlgo.CONSISTENT_HASH, dispatcher=create_dispatcher(DispatchMode.THREAD_PER_REQUEST), vnodes=vnodes)
+        for i in range(server_count):
+            lb.add_server(Server(f"node-{i+1}", max_capacity=10, base_response_time=0.1))
+
+        key_imbalance = lb.hash_ring.get_stats()["key_imbalance"]
+
+        lb.add_server(Server("node-new", max_capacity=10, base_response_time=0.1))
+        added = lb.hash_ring.last_remap_fraction
+
+        lb.remove_server("node-1")
+        removed = lb.hash_ring.last_remap_fraction
+
+    return {
+        "servers": server_count,
+        "vnodes": vnodes,
+        "key_imbalance": key_imbalance,
+        "remap_on_add": added,
+        "ideal_on_add": 1 / (server_count + 1),
+        "remap_on_remove": removed,
+        "ideal_on_remove": 1 / (server_count + 1)
+    }
+
+
+if __name__ == "__main__":
+    print(f"{'servers':>8}{'vnodes':>8}{'key imbalance':>15}{'moved on add':>14}{'moved on remove':>17}{'ideal':>8}")
+    for server_count in (4, 10, 50):
+        for vnodes in (10, 100, 400):
+            row = scale_events(server_count, vnodes)
+            print(f"{row['servers']:>8}{row['vnodes']:>8}{row['key_imbalance']:>14.2f}x"
+                  f"{row['remap_on_add'] * 100:>13.1f}%{row['remap_on_remove'] * 100:>16.1f}%{row['ideal_on_add'] * 100:>7.1f}%")
@@ -0,0 +1,68 @@
+import sys
+import time
+import threading
+import tracemalloc
+
+from src.server import Server
+from src.event_log import quiet
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import DispatchMode, create_dispatcher
+
+
+def run_dispatch(mode, requests=5000, servers=4, capacity=50, response_time=0.002, workers=32):
+    """
+    Route a burst of requests through one dispatch mode and measure it
+
+    Returns a dict with throughput, threads created and peak traced memory
+    """
+
+    with quiet():
+        # no admission queue, only the dispatch cost is measured
+        lb = LoadBalancer(RoutingAlgo.ROTATING, dispatcher=create_dispatcher(mode, workers=workers), queue_size=0)
+        for i in range(servers):
+            lb.add_server(Server(f"bench-{i+1}", max_capacity=capacity, base_response_time=response_time))
+
+        tracemalloc.start()
+        peak_threads = threading.active_count()
+        start = time.perf_counter()
+
+        routed = 0
+        for i in range(requests):
+            if lb.route_request(f"bench-req-{i}"):
+                routed += 1
+            if i % 100 == 0:
+                peak_threads = max(peak_threads, threading.active_count())
+
+        # wait for every routed request to finish
+        while sum(s.total_requests_handled for s in lb.servers) < routed or lb.get_stats()["current_load"] > 0:
+            peak_threads = max(peak_threads, threading.active_count())
+            time.sleep(0.001)
+
+        elapsed = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        dispatch_stats = lb.dispatcher.get_stats()
+        lb.shutdown()
+
+    return {
+        "mode": mode.value,
+        "requests": requests,
+        "routed": routed,
+        "elapsed_s": elapsed,
+        "throughput_rps": routed / elapsed,
+        "threads_created": dispatch_stats["threads_created"],
+        "peak_threads": peak_threads,
+        "peak_traced_memory_kb": peak_memory / 1024
+    }
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    print(f"Dispatch comparison with {requests} requests\n")
+    print(f"{'mode':<22}{'routed':>8}{'req/s':>10}{'threads made':>14}{'peak threads':>14}{'peak mem KB':>13}")
+    for mode in (DispatchMode.THREAD_PER_REQUEST, DispatchMode.SHARED_POOL, DispatchMode.PER_SERVER_POOL):
+        result = run_dispatch(mode, requests=requests)
+        print(f"{result['mode']:<22}{result['routed']:>8}{result['throughput_rps']:>10.0f}"
+              f"{result['threads_created']:>14}{result['peak_threads']:>14}{result['peak_traced_memory_kb']:>13.0f}")
@@ -0,0 +1,49 @@
+import sys
+import random
+
+from src.simulation import Simulation
+from src.load_balancer import RoutingAlgo, DrainChoice
+from src.arrivals import PoissonArrivals
+from src.scaling_policy import ScalingMode
+
+# big servers under steady load, every one of them always has requests running
+SERVERS = [(f"web-{i+1}", 20, 0.5) for i in range(10)]
+
+
+def run(rate=40, drain_choice=DrainChoice.LEAST_LOADED, scaling=ScalingMode.THRESHOLD, duration=1800, seeds=range(3)):
+    """
+    Poisson traffic at rate on 10 servers that need far fewer, so the scaler has to scale down under load
+
+    Returns the results averaged over the seeds
+    """
+
+    runs = []
+    for seed in seeds:
+        sim = Simulation(duration=duration, seed=seed, rounting_algo=RoutingAlgo.LEAST_CONNECTIONS, initial_servers=SERVERS,
+                         min_servers=2, max_servers=10, scaling=scaling, arrivals=PoissonArrivals(rate, random.Random(f"arrivals-{seed}")))
+        sim.auto_scaler.drain_choice = drain_choice
+        sim.auto_scaler.server_capacity = 20
+        sim.auto_scaler.server_response_time = 0.5
+        runs.append(sim.run())
+
+    return {
+        "success_rate": sum(r["success_rate"] for r in runs) / len(runs),
+        "p99_latency": sum(r["p99_latency"] for r in runs) / len(runs),
+        "server_hours": sum(r["server_seconds"] for r in runs) / len(runs) / 3600,
+        "final_servers": sum(r["final_servers"] for r in runs) / len(runs),
+        "drained": sum(r["drained"] for r in runs) / len(runs),
+        "drain_timeouts": sum(r["drain_timeouts"] for r in runs) / len(runs)
+    }
+
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 1800
+
+    print(f"Poisson traffic, {duration:.0f}s simulated, 3 seeds, starting on 10 servers of 20 slots\n")
+    print(f"{'rate':>6}  {'policy':<12}{'drain':<14}{'success %':>10}{'p99 s':>8}{'server h':>10}{'final':>7}{'drained':>9}{'timeouts':>10}")
+    for rate in (20, 40):
+        for scaling in ScalingMode:
+            for choice in DrainChoice:
+                row = run(rate, choice, scaling, duration)
+                print(f"{rate:>6}  {scaling.value:<12}{choice.value:<14}{row['success_rate']:>10.1f}{row['p99_latency']:>8.3f}{row['server_hours']:>10.2f}"
+                      f"{row['final_servers']:>7.1f}{row['drained']:>9.1f}{row['drain_timeouts']:>10.1f}")
@@ -0,0 +1,50 @@
+import sys
+
+from src.simulation import Simulation
+from src.load_balancer import RoutingAlgo
+from src.traffic_generator import TrafficPattern
+
+SERVERS = [
+    ("web-1", 4, 0.4),
+    ("web-2", 4, 0.4),
+    ("web-3", 4, 0.4),
+    ("web-4", 4, 0.4)
+]
+
+
+def run(health_checks, slowdown=10.0, error_rate=0.0, algo=RoutingAlgo.ROTATING, duration=3600, seeds=range(5)):
+    """
+    BURST traffic with web-1 degraded from the start, with and without health checks
+
+    Returns the results averaged over the seeds
+    """
+
+    runs = []
+    for seed in seeds:
+        sim = Simulation(TrafficPattern.BURST, duration=duration, seed=seed, rounting_algo=algo, initial_servers=SERVERS,
+                         auto_scale=False, health_checks=health_checks)
+        sim.load_balancer.servers[0].degrade(slowdown=slowdown, error_rate=error_rate)
+        results = sim.run()
+        results["errors"] = sum(server.errors for server in sim.load_balancer.servers)
+        runs.append(results)
+
+    return {
+        "success_rate": sum(r["success_rate"] for r in runs) / len(runs),
+        "p50_latency": sum(r["p50_latency"] for r in runs) / len(runs),
+        "p99_latency": sum(r["p99_latency"] for r in runs) / len(runs),
+        "errors": sum(r["errors"] for r in runs) / len(runs),
+        "ejections": sum(r["ejections"] for r in runs) / len(runs)
+    }
+
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3600
+
+    print(f"BURST traffic, {duration:.0f}s simulated, 5 seeds, 4 servers with web-1 degraded\n")
+    print(f"{'algorithm':<20}{'fault':<12}{'health':<8}{'success %':>10}{'p50 s':>8}{'p99 s':>8}{'errors':>8}{'ejections':>11}")
+    for algo in (RoutingAlgo.ROTATING, RoutingAlgo.LEAST_CONNECTIONS, RoutingAlgo.POWER_OF_TWO):
+        for fault, options in (("10x slow", {"slowdown": 10.0}), ("50% errors", {"slowdown": 1.0, "error_rate": 0.5})):
+            for health_checks in (False, True):
+                row = run(health_checks, algo=algo, duration=duration, **options)
+                print(f"{algo.value:<20}{fault:<12}{'on' if health_checks else 'off':<8}{row['success_rate']:>10.1f}"
+                      f"{row['p50_latency']:>8.3f}{row['p99_latency']:>8.3f}{row['errors']:>8.0f}{row['ejections']:>11.1f}")
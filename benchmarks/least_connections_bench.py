@@ -0,0 +1,93 @@
+import sys
+import time
+import random
+
+from src.server import Server
+from src.event_log import quiet
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import create_dispatcher, DispatchMode
+
+
+def build_balancer(server_count, seed=0):
+    """
+    Load balancer with server_count servers already partly loaded
+    """
+
+    rng = random.Random(seed)
+    with quiet():
+        lb = LoadBalancer(RoutingAlgo.LEAST_CONNECTIONS, dispatcher=create_dispatcher(DispatchMode.THREAD_PER_REQUEST))
+        for i in range(server_count):
+            server = Server(f"bench-{i+1}", max_capacity=100, base_response_time=0.1)
+            lb.add_server(server)
+            server.current_requests = rng.randint(0, 50)
+            server._notify()
+    return lb
+
+
+def time_selection(lb, select, requests=20000):
+    """
+    Seconds per request for select() plus the load going up and back down
+
+    The load changes go through _notify so the heap pays for its updates
+    """
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        server = select()
+        server.current_requests += 1
+        server._notify()
+        server.current_requests -= 1
+        server._notify()
+    return (time.perf_counter() - start) / requests
+
+
+def time_scan(lb, requests=20000):
+    """
+    Same as time_selection for the O(n) scan, with no heap to keep up to date
+    """
+
+    for server in lb.servers:
+        server.listeners = []
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        server = lb._least_connections_scan()
+        server.current_requests += 1
+        server.current_requests -= 1
+    return (time.perf_counter() - start) / requests
+
+
+def run_crossover(server_counts=(2, 4, 8, 16, 32, 64, 128, 256, 512, 1024), requests=20000):
+    """
+    Compare heap and scan cost for each server count
+
+    Returns a list of dicts and the first server count where the heap wins
+    """
+
+    results = []
+    crossover = None
+    for count in server_counts:
+        lb = build_balancer(count)
+        heap_cost = time_selection(lb, lb._least_connections_selection, requests)
+        scan_cost = time_scan(build_balancer(count), requests)
+
+        results.append({"servers": count, "heap_us": heap_cost * 1e6, "scan_us": scan_cost * 1e6})
+        if crossover is None and heap_cost < scan_cost:
+            crossover = count
+
+    return results, crossover
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    results, crossover = run_crossover(requests=requests)
+
+    print(f"{'servers':>8}{'heap us/req':>14}{'scan us/req':>14}")
+    for row in results:
+        print(f"{row['servers']:>8}{row['heap_us']:>14.2f}{row['scan_us']:>14.2f}")
+
+    if crossover:
+        print(f"\nHeap is faster from {crossover} servers up")
+    else:
+        print("\nScan was faster for every server count tested")
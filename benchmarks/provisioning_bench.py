@@ -0,0 +1,54 @@
+import sys
+import random
+
+from src.simulation import Simulation
+from src.load_balancer import RoutingAlgo
+from src.arrivals import MMPPArrivals
+from src.scaling_policy import ScalingMode
+
+# quiet spells that two servers handle and busy ones that need four or five
+SERVERS = [(f"web-{i+1}", 5, 0.5) for i in range(2)]
+
+# (label, boot seconds, warm-up seconds, standby servers)
+SETUPS = [
+    ("instant", 0, 0, 0),
+    ("cold", 30, 60, 0),
+    ("standby 1", 30, 60, 1),
+    ("standby 2", 30, 60, 2)
+]
+
+
+def run(boot_time=30, warmup_time=60, standby=0, scaling=ScalingMode.THRESHOLD, duration=1800, seeds=range(3)):
+    """
+    Bursty traffic where the scaler keeps having to add servers, each one booting and warming up first
+
+    Returns the results averaged over the seeds
+    """
+
+    runs = []
+    for seed in seeds:
+        arrivals = MMPPArrivals(rates=(5, 20), mean_dwell=(240, 120), rng=random.Random(f"arrivals-{seed}"))
+        runs.append(Simulation(duration=duration, seed=seed, rounting_algo=RoutingAlgo.LEAST_CONNECTIONS, initial_servers=SERVERS,
+                               min_servers=2, max_servers=8, scaling=scaling, arrivals=arrivals, boot_time=boot_time, warmup_time=warmup_time,
+                               standby=standby, server_capacity=5, server_response_time=0.5).run())
+
+    return {
+        "success_rate": sum(r["success_rate"] for r in runs) / len(runs),
+        "p99_latency": sum(r["p99_latency"] for r in runs) / len(runs),
+        "server_hours": sum(r["server_seconds"] for r in runs) / len(runs) / 3600,
+        "promotions": sum(r["promotions"] for r in runs) / len(runs),
+        "cold_starts": sum(r["cold_starts"] for r in runs) / len(runs),
+        "p99_time_to_capacity": sum(r["p99_time_to_capacity"] for r in runs) / len(runs)
+    }
+
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 1800
+
+    print(f"Bursty traffic (5/s quiet, 20/s busy), {duration:.0f}s simulated, 3 seeds, servers of 5 slots booting in 30s and warming up over 60s\n")
+    print(f"{'policy':<12}{'setup':<12}{'success %':>10}{'p99 s':>8}{'server h':>10}{'promoted':>10}{'cold':>7}{'p99 ready s':>13}")
+    for scaling in ScalingMode:
+        for label, boot_time, warmup_time, standby in SETUPS:
+            row = run(boot_time, warmup_time, standby, scaling, duration)
+            print(f"{scaling.value:<12}{label:<12}{row['success_rate']:>10.1f}{row['p99_latency']:>8.3f}{row['server_hours']:>10.2f}"
+                  f"{row['promotions']:>10.1f}{row['cold_starts']:>7.1f}{row['p99_time_to_capacity']:>13.1f}")
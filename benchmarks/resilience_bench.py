@@ -0,0 +1,69 @@
+import sys
+import random
+
+from src.simulation import Simulation
+from src.load_balancer import RoutingAlgo
+from src.traffic_generator import TrafficPattern
+
+SERVERS = [
+    ("web-1", 4, 0.4),
+    ("web-2", 4, 0.4),
+    ("web-3", 4, 0.4),
+    ("web-4", 4, 0.4)
+]
+
+# (label, servers degraded, degrade options)
+FAULTS = [
+    ("10x slow", 1, {"slowdown": 10.0}),
+    ("50% errors", 1, {"error_rate": 0.5}),
+    ("all failing", 4, {"error_rate": 0.5})
+]
+
+# (label, retries, hedge percentile)
+SETUPS = [
+    ("off", 0, None),
+    ("retry", 2, None),
+    ("hedge", 0, 75),
+    ("both", 2, 75)
+]
+
+
+def run(retries=0, hedge_percentile=None, degraded=1, fault=None, duration=3600, seeds=range(5)):
+    """
+    BURST traffic with the first degraded servers faulty from the start, health checks off so only retries and hedges help
+
+    Returns the results averaged over the seeds
+    """
+
+    runs = []
+    for seed in seeds:
+        sim = Simulation(TrafficPattern.BURST, duration=duration, seed=seed, rounting_algo=RoutingAlgo.LEAST_CONNECTIONS,
+                         initial_servers=SERVERS, auto_scale=False, retries=retries, hedge_percentile=hedge_percentile)
+        for server in sim.load_balancer.servers[:degraded]:
+            server.degrade(rng=random.Random(f"faults-{seed}-{server.server_id}"), **(fault or {}))
+        results = sim.run()
+        results["extra"] = (results["retries"] + results["hedges"]) / max(1, results["total_requests"]) * 100
+        runs.append(results)
+
+    return {
+        "success_rate": sum(r["success_rate"] for r in runs) / len(runs),
+        "p50_latency": sum(r["p50_latency"] for r in runs) / len(runs),
+        "p99_latency": sum(r["p99_latency"] for r in runs) / len(runs),
+        "extra": sum(r["extra"] for r in runs) / len(runs),
+        "hedges_won": sum(r["hedges_won"] for r in runs) / len(runs),
+        "denied": sum(r["retry_budget_denied"] for r in runs) / len(runs)
+    }
+
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3600
+
+    # about a quarter of the requests land on web-1, so hedging waits for p75 of service time
+    print(f"BURST traffic, {duration:.0f}s simulated, 5 seeds, 4 servers, least connections, up to 2 retries, hedge after p75\n")
+    print("Retries and hedges share a budget of 20% of requests plus 0.1 a second\n")
+    print(f"{'fault':<13}{'setup':<8}{'success %':>10}{'p50 s':>8}{'p99 s':>8}{'extra %':>9}{'hedges won':>12}{'denied':>8}")
+    for fault_label, degraded, fault in FAULTS:
+        for label, retries, hedge_percentile in SETUPS:
+            row = run(retries, hedge_percentile, degraded, fault, duration)
+            print(f"{fault_label:<13}{label:<8}{row['success_rate']:>10.1f}{row['p50_latency']:>8.3f}{row['p99_latency']:>8.3f}"
+                  f"{row['extra']:>9.1f}{row['hedges_won']:>12.1f}{row['denied']:>8.0f}")
@@ -0,0 +1,47 @@
+import sys
+
+from src.simulation import Simulation
+from src.load_balancer import RoutingAlgo
+from src.traffic_generator import TrafficPattern
+
+# mixed pool so balancing actually matters
+SERVERS = [
+    ("web-1", 2, 0.4),
+    ("web-2", 3, 0.5),
+    ("web-3", 4, 0.6),
+    ("web-4", 5, 0.8)
+]
+
+ALGOS = [RoutingAlgo.ROTATING, RoutingAlgo.LEAST_CONNECTIONS, RoutingAlgo.POWER_OF_TWO]
+
+
+def compare(pattern=TrafficPattern.BURST, duration=3600, seeds=range(5), algos=ALGOS, servers=SERVERS):
+    """
+    Run every algorithm on the same seeded traffic and average the results
+
+    Returns a list of dicts, one per algorithm
+    """
+
+    rows = []
+    for algo in algos:
+        runs = [Simulation(pattern, duration=duration, seed=seed, rounting_algo=algo,
+                           initial_servers=servers, auto_scale=False).run() for seed in seeds]
+
+        rows.append({
+            "algo": algo.value,
+            "success_rate": sum(r["success_rate"] for r in runs) / len(runs),
+            "max_server_load": max(r["max_server_load"] for r in runs),
+            "p50_latency": sum(r["p50_latency"] for r in runs) / len(runs),
+            "p99_latency": sum(r["p99_latency"] for r in runs) / len(runs)
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3600
+
+    print(f"BURST traffic, {duration:.0f}s simulated, 5 seeds, servers: {', '.join(s[0] for s in SERVERS)}\n")
+    print(f"{'algorithm':<20}{'success %':>10}{'max load':>10}{'p50 s':>8}{'p99 s':>8}")
+    for row in compare(duration=duration):
+        print(f"{row['algo']:<20}{row['success_rate']:>10.1f}{row['max_server_load']:>10}"
+              f"{row['p50_latency']:>8.3f}{row['p99_latency']:>8.3f}")
@@ -0,0 +1,41 @@
+import sys
+
+from src.simulation import Simulation
+from src.traffic_generator import TrafficPattern
+from src.scaling_policy import ScalingMode
+
+PATTERNS = [TrafficPattern.BURST, TrafficPattern.GRADUAL_INCREASE, TrafficPattern.RANDOM]
+
+
+def compare(duration=600, seeds=range(3), patterns=PATTERNS, max_servers=50):
+    """
+    Run every scaling policy on the same seeded traffic and average the results
+
+    Returns a list of dicts, one per pattern and policy
+    """
+
+    rows = []
+    for pattern in patterns:
+        for mode in ScalingMode:
+            runs = [Simulation(pattern, duration=duration, seed=seed, scaling=mode, max_servers=max_servers).run() for seed in seeds]
+
+            rows.append({
+                "pattern": pattern.name.lower(),
+                "policy": mode.value,
+                "success_rate": sum(r["success_rate"] for r in runs) / len(runs),
+                "p99_latency": sum(r["p99_latency"] for r in runs) / len(runs),
+                "server_hours": sum(r["server_seconds"] for r in runs) / len(runs) / 3600,
+                "peak_servers": max(r["peak_servers"] for r in runs),
+                "scaler_checks": sum(r["scaler_checks"] for r in runs) / len(runs)
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 600
+
+    print(f"{duration:.0f}s simulated, 3 seeds, up to 50 servers\n")
+    print(f"{'pattern':<18}{'policy':<12}{'success %':>10}{'p99 s':>8}{'server h':>10}{'peak':>6}{'checks':>8}")
+    for row in compare(duration=duration):
+        print(f"{row['pattern']:<18}{row['policy']:<12}{row['success_rate']:>10.1f}{row['p99_latency']:>8.3f}"
+              f"{row['server_hours']:>10.2f}{row['peak_servers']:>6}{row['scaler_checks']:>8.0f}")
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+
+from src.server import Server
+from src.event_log import quiet
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import DispatchMode, create_dispatcher
+from src.sharding import ShardedLoadBalancer
+
+
+def make_servers(count=64, capacity=100_000):
+    """
+    Servers that finish instantly, so routing is the only cost
+    """
+    return [(f"bench-{i+1}", capacity, 0.0) for i in range(count)]
+
+
+def run_single(requests=200_000, servers=64):
+    """
+    Baseline, every request routed by one LoadBalancer in this process
+    """
+
+    with quiet():
+        lb = LoadBalancer(RoutingAlgo.ROTATING, dispatcher=create_dispatcher(DispatchMode.INLINE), queue_size=0)
+        for server_id, capacity, response_time in make_servers(servers):
+            lb.add_server(Server(server_id, capacity, response_time))
+
+        start = time.perf_counter()
+        for i in range(requests):
+            lb.route_request(f"local-{i}")
+        elapsed = time.perf_counter() - start
+        lb.shutdown()
+
+    return {"shards": 0, "requests": requests, "elapsed_s": elapsed, "throughput_rps": requests / elapsed}
+
+
+def run_sharded(shards, requests=200_000, servers=64):
+    """
+    Split the same requests across shard processes, each routing its share itself
+    """
+
+    with quiet():
+        slb = ShardedLoadBalancer(make_servers(servers), shards=shards, dispatch_mode=DispatchMode.INLINE, queue_size=0)
+        # let every shard finish starting up before timing
+        slb.route_local(1)
+        elapsed = slb.route_local(requests // shards)
+        stats = slb.get_stats()
+        slb.shutdown()
+
+    routed = (requests // shards) * shards
+    return {"shards": shards, "requests": routed, "elapsed_s": elapsed, "throughput_rps": routed / elapsed,
+            "failed": stats["failed_requests"]}
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    cores = os.cpu_count() or 1
+
+    print(f"Routing {requests} requests on {cores} cores\n")
+    print(f"{'shards':<10}{'req/s':>12}{'speedup':>10}")
+
+    baseline = run_single(requests)
+    print(f"{'none':<10}{baseline['throughput_rps']:>12.0f}{1.0:>10.2f}")
+
+    shards = 1
+    while shards <= cores:
+        result = run_sharded(shards, requests)
+        print(f"{shards:<10}{result['throughput_rps']:>12.0f}{result['throughput_rps'] / baseline['throughput_rps']:>10.2f}")
+        shards *= 2
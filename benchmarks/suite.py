@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import threading
+import subprocess
+from datetime import datetime, timezone
+
+from src.server import Server
+from src.event_log import quiet
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import DispatchMode, create_dispatcher
+from src.simulation import Simulation
+from src.traffic_generator import TrafficPattern
+
+PATTERNS = [TrafficPattern.STEADY, TrafficPattern.BURST, TrafficPattern.GRADUAL_INCREASE, TrafficPattern.RANDOM]
+
+# metric -> True if bigger is better, used by --compare
+METRICS = {
+    "select_us": False,
+    "warmup_ms": False,
+    "build_ms": False,
+    "throughput_rps": True,
+    "route_us": False,
+    "sim_rps": True,
+    "p99_latency": False,
+    "success_rate": True
+}
+
+
+def build_balancer(server_count, seed=0):
+    """
+    Load balancer with server_count partly loaded servers that finish requests instantly
+
+    Returns the load balancer and how long adding the servers took
+    """
+
+    rng = random.Random(seed)
+    with quiet():
+        lb = LoadBalancer(RoutingAlgo.ROTATING, dispatcher=create_dispatcher(DispatchMode.INLINE), queue_size=0,
+                          rng=random.Random(f"routing-{seed}"))
+
+        start = time.perf_counter()
+        for i in range(server_count):
+            server = Server(f"bench-{i+1}", max_capacity=100, base_response_time=0.0)
+            lb.add_server(server)
+            server.current_requests = rng.randint(0, 50)
+            server._notify()
+        build_time = time.perf_counter() - start
+
+    return lb, build_time
+
+
+def bench_selection(server_counts=(10, 100, 1000, 10000), requests=20000, seed=0):
+    """
+    Cost of _select_server for every algorithm as the cluster grows
+
+    All algorithms share one load balancer per size, its heap, schedule and ring
+    are all kept up to date whatever the algorithm. The first pick of each
+    algorithm is timed on its own as warmup, it pays for lazy rebuilds.
+    """
+
+    results = []
+    keys = [f"session-{i}" for i in range(requests)]
+
+    for count in server_counts:
+        lb, build_time = build_balancer(count, seed)
+
+        for algo in RoutingAlgo:
+            lb.rounting_algo = algo
+            select = lb._select_server
+
+            start = time.perf_counter()
+            select(keys[0])
+            warmup = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for key in keys:
+                select(key)
+            elapsed = time.perf_counter() - start
+
+            results.append({
+                "servers": count,
+                "algorithm": algo.value,
+                "select_us": elapsed / requests * 1e6,
+                "warmup_ms": warmup * 1000,
+                "build_ms": build_time * 1000
+            })
+
+        lb.shutdown()
+    return results
+
+
+def bench_contention(thread_counts=(1, 2, 4, 8), requests_per_thread=20000, servers=16):
+    """
+    route_request throughput with several threads routing into one load balancer at once
+
+    Requests finish inline and no server ever fills, so the cost is routing and
+    the routing lock
+    """
+
+    results = []
+    for threads in thread_counts:
+        with quiet():
+            lb = LoadBalancer(RoutingAlgo.ROTATING, dispatcher=create_dispatcher(DispatchMode.INLINE), queue_size=0)
+            for i in range(servers):
+                lb.add_server(Server(f"bench-{i+1}", max_capacity=1_000_000, base_response_time=0.0))
+
+            ready = threading.Barrier(threads + 1)
+
+            def producer(index):
+                ready.wait()
+                for i in range(requests_per_thread):
+                    lb.route_request(f"bench-{index}-{i}")
+
+            workers = [threading.Thread(target=producer, args=(i,)) for i in range(threads)]
+            for worker in workers:
+                worker.start()
+
+            ready.wait()
+            start = time.perf_counter()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+
+            stats = lb.get_stats()
+            lb.shutdown()
+
+        total = threads * requests_per_thread
+        results.append({
+            "threads": threads,
+            "requests": total,
+            "failed": stats["failed_requests"],
+            "throughput_rps": total / elapsed,
+            "route_us": elapsed / total * 1e6
+        })
+    return results
+
+
+def bench_end_to_end(patterns=PATTERNS, duration=3600, seed=0):
+    """
+    Whole system on the virtual clock for each traffic pattern
+
+    sim_rps is requests pushed through the real routing, admission and scaling code
+    per wall clock second, latencies are on the virtual clock so they repeat exactly
+    """
+
+    results = []
+    for pattern in patterns:
+        start = time.perf_counter()
+        run = Simulation(pattern, duration=duration, seed=seed).run()
+        elapsed = time.perf_counter() - start
+
+        results.append({
+            "pattern": pattern.name.lower(),
+            "requests": run["total_requests"],
+            "sim_rps": run["total_requests"] / elapsed,
+            "success_rate": run["success_rate"],
+            "p50_latency": run["p50_latency"],
+            "p99_latency": run["p99_latency"],
+            "peak_servers": run["peak_servers"]
+        })
+    return results
+
+
+def environment():
+    """
+    Where the results came from, so runs on different machines are not compared blindly
+    """
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+
+def run_suite(quick=False, seed=0):
+    """
+    Run every benchmark, returns one dict ready to be written as JSON
+    """
+
+    if quick:
+        selection = bench_selection((10, 100, 1000), requests=5000, seed=seed)
+        contention = bench_contention((1, 4), requests_per_thread=5000)
+        end_to_end = bench_end_to_end(duration=600, seed=seed)
+    else:
+        selection = bench_selection(seed=seed)
+        contention = bench_contention()
+        end_to_end = bench_end_to_end(seed=seed)
+
+    return {
+        "environment": environment(),
+        "seed": seed,
+        "quick": quick,
+        "selection": selection,
+        "contention": contention,
+        "end_to_end": end_to_end
+    }
+
+
+def _row_key(section, row):
+    """
+    What identifies a row of a section across runs
+    """
+    if section == "selection":
+        return (row["servers"], row["algorithm"])
+    if section == "contention":
+        return (row["threads"],)
+    return (row["pattern"],)
+
+
+def compare(baseline, current, tolerance=0.10):
+    """
+    Metrics that got worse by more than tolerance since the baseline run
+
+    Returns a list of (section, row key, metric, old, new) for every regression
+    """
+
+    regressions = []
+    for section in ("selection", "contention", "end_to_end"):
+        old_rows = {_row_key(section, row): row for row in baseline.get(section, [])}
+
+        for row in current.get(section, []):
+            old = old_rows.get(_row_key(section, row))
+            if not old:
+                continue
+
+            for metric, bigger_is_better in METRICS.items():
+                if metric not in row or not old.get(metric):
+                    continue
+
+                change = (row[metric] - old[metric]) / old[metric]
+                if (change < -tolerance) if bigger_is_better else (change > tolerance):
+                    regressions.append((section, _row_key(section, row), metric, old[metric], row[metric]))
+    return regressions
+
+
+def print_results(results):
+    env = results["environment"]
+    print(f"Python {env['python']} on {env['platform']}, {env['cpus']} cpus, commit {env['commit']}\n")
+
+    print("_select_server cost")
+    print(f"{'servers':>8}  {'algorithm':<20}{'us/pick':>10}{'warmup ms':>12}{'build ms':>11}")
+    for row in results["selection"]:
+        print(f"{row['servers']:>8}  {row['algorithm']:<20}{row['select_us']:>10.2f}{row['warmup_ms']:>12.2f}{row['build_ms']:>11.0f}")
+
+    print("\nroute_request with N producer threads")
+    print(f"{'threads':>8}{'req/s':>12}{'us/req':>10}")
+    for row in results["contention"]:
+        print(f"{row['threads']:>8}{row['throughput_rps']:>12.0f}{row['route_us']:>10.2f}")
+
+    print("\nEnd to end per pattern (virtual clock)")
+    print(f"{'pattern':<18}{'requests':>10}{'sim req/s':>11}{'success %':>11}{'p50 s':>8}{'p99 s':>8}")
+    for row in results["end_to_end"]:
+        print(f"{row['pattern']:<18}{row['requests']:>10}{row['sim_rps']:>11.0f}{row['success_rate']:>11.1f}"
+              f"{row['p50_latency']:>8.3f}{row['p99_latency']:>8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Routing, dispatch and end to end benchmarks")
+    parser.add_argument("--output", default="benchmark-results.json", help="JSON file to write the results to")
+    parser.add_argument("--compare", help="earlier results JSON to check for regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="change that counts as a regression, 0.20 is 20%%")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast check")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = run_suite(quick=args.quick, seed=args.seed)
+    print_results(results)
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+        regressions = compare(baseline, results, args.tolerance)
+        print(f"\n{len(regressions)} regressions against {args.compare} (commit {baseline['environment'].get('commit')})")
+        for section, key, metric, old, new in regressions:
+            print(f" {section} {'/'.join(map(str, key))} {metric}: {old:.4g} -> {new:.4g}")
+
+        if regressions:
+            sys.exit(1)
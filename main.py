@@ -1,12 +1,22 @@
 # all imports including from src file
 import time
 import sys
+import asyncio
 from datetime import datetime
 from src.load_balancer import LoadBalancer, RoutingAlgo
 from src.traffic_generator import TrafficGenerator, TrafficPattern
 from src.auto_scaler import AutoScaler
 from src.dashboard import Dashboard
 from src.server import Server
+from src.async_engine import AsyncLoadBalancer, AsyncTrafficGenerator, AsyncAutoScaler
+from src.event_log import events, configure, LogLevel
+from src.metrics_segment import MetricsPublisher
+from src.trace_replay import TraceReplayGenerator
+from src.arrivals import ArrivalProcess, OpenLoopGenerator, create_arrivals
+from src.timeseries import MetricsHistory
+from src.http_endpoint import MetricsEndpoint
+from src.health import HealthChecker
+from src.provisioning import Provisioner
 
 def welcome():
     """
@@ -27,14 +37,32 @@ def welcome():
 
     print("=============================================================================================")
 
-def system_setup():
+def option_value(name):
+    """
+    Value given after a command line option like --event-log PATH, None if it isnt there
+    """
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return None
+
+def system_setup(metrics_path=None, trace_path=None, trace_speed=1.0, arrivals=None, retries=0, hedge_percentile=None):
     """
     Initializes all system components
+
+    Arguments:
+        metrics_path: File to publish the stats into for a dashboard in another process
+        trace_path: Trace file to replay instead of the BURST pattern
+        trace_speed: How much faster than recorded to replay the trace, 0 for as fast as possible
+        arrivals: Arrival model to send open loop traffic from instead of the BURST pattern
+        retries: Times a request that fails on its server is retried on another one
+        hedge_percentile: Send a copy of requests running longer than this percentile of service time, None for no hedging
     """
 
     print("\n Setting up system components")
 
-    lb = LoadBalancer(RoutingAlgo.ROTATING)
+    lb = LoadBalancer(RoutingAlgo.ROTATING, retries=retries, hedge_percentile=hedge_percentile)
 
     print("Adding servers:")
     initial_servers = [
@@ -45,19 +73,30 @@ def system_setup():
     for server in initial_servers:
         lb.add_server(server)
     
-    # create traffic for burst pattern
-    traffic_gen = TrafficGenerator(lb, TrafficPattern.BURST)
+    # create traffic for burst pattern, or replay a recorded trace
+    if trace_path:
+        traffic_gen = TraceReplayGenerator(lb, trace_path, speed=trace_speed or None)
+    elif arrivals:
+        traffic_gen = OpenLoopGenerator(lb, arrivals)
+    else:
+        traffic_gen = TrafficGenerator(lb, TrafficPattern.BURST)
 
     # auto scaler creator
     auto_scaler = AutoScaler(lb, min_servers=2, max_servers=8)
 
+    # sample the stats every second for trends and the final report
+    history = MetricsHistory(lb)
+
     # make dashboard
-    dashboard = Dashboard(lb, traffic_gen, auto_scaler)
+    dashboard = Dashboard(lb, traffic_gen, auto_scaler, history=history)
+
+    publisher = MetricsPublisher(lb, metrics_path) if metrics_path else None
+    events.flush()
     print("System setup is complete")
 
-    return lb, traffic_gen, auto_scaler, dashboard
+    return lb, traffic_gen, auto_scaler, dashboard, publisher
 
-def run_system(lb, traffic_gen, auto_scaler, dashboard):
+def run_system(lb, traffic_gen, auto_scaler, dashboard, publisher=None, endpoint=None, health=None, provisioner=None):
     """
     Runs the system
     """
@@ -68,41 +107,161 @@ def run_system(lb, traffic_gen, auto_scaler, dashboard):
         # start traffic and auto scaler
         traffic_gen.start()
         auto_scaler.start()
+        dashboard.history.start()
+        if publisher:
+            publisher.start()
+        if endpoint:
+            endpoint.start()
+        if health:
+            health.start()
+        if provisioner:
+            provisioner.start()
 
         print("System is running & Dashboard starting soon...\n")
         time.sleep(2)
 
-        # start live dashboard
+        # start live dashboard, returns on Ctrl-C
         dashboard.start_live_monitoring(refresh_interval=3)
 
     except KeyboardInterrupt:
+        pass
+
+    finally:
         print("\n\n\nShutting down system")
 
         # Stop everything
+        if health:
+            health.stop()
         traffic_gen.stop()
         auto_scaler.stop()
+        if provisioner:
+            provisioner.stop()
+        lb.shutdown()
+        dashboard.history.stop()
+        if publisher:
+            publisher.stop()
+        if endpoint:
+            endpoint.stop()
+        events.flush()
+
+        print_summary(lb, traffic_gen, dashboard.history)
+        print("\nSystem has now shutdown")
 
-        lb_stats = lb.get_stats()
-        traffic_stats = traffic_gen.get_stats()
+def print_summary(lb, traffic_gen, history):
+    """
+    Totals for the whole run, peaks and averages come from the sampled history
+    """
 
-        print(f"Total Requests: {traffic_stats['total_requests_sent']}")
-        print(f"Success Rate: {lb_stats['success_rate']:.1f}%")
-        print(f"Final Server Count: {lb_stats['total_servers']}")
-        print(f"Peak Util: {lb_stats['util']:.1f}%")
+    lb_stats = lb.get_stats()
+    summary = history.summary()
 
-        print("\nSystem has now shutdown")
+    print(f"Total Requests: {traffic_gen.get_stats()['total_requests_sent']}")
+    print(f"Success Rate: {lb_stats['success_rate']:.1f}%")
+    print(f"Final Server Count: {lb_stats['total_servers']} (peak {summary['peak_servers']})")
+    print(f"Peak Util: {summary['util']['peak']:.1f}%, Avg Util: {summary['util']['avg']:.1f}%")
+    print(f"Peak Request Rate: {summary['request_rate']['peak']:.1f}/s, Avg: {summary['request_rate']['avg']:.1f}/s")
+    print(f"Latency p99: {lb_stats['p99_latency'] * 1000:.0f}ms")
+
+async def run_async_system(http_port=None, retries=0, hedge_percentile=None):
+    """
+    Runs the system as tasks on one event loop instead of threads
+
+    Arguments:
+        http_port: Port to serve the metrics and controls on, None for no endpoint
+        retries: Times a request that fails on its server is retried on another one
+        hedge_percentile: Send a copy of requests running longer than this percentile of service time, None for no hedging
+    """
+
+    print("\n Setting up async system components")
+
+    lb = AsyncLoadBalancer(RoutingAlgo.ROTATING, retries=retries, hedge_percentile=hedge_percentile)
+    lb.add_server(Server("primary-1", max_capacity=3, base_response_time=0.4))
+    lb.add_server(Server("primary-2", max_capacity=4, base_response_time=0.5))
+
+    traffic_gen = AsyncTrafficGenerator(lb, TrafficPattern.BURST)
+    auto_scaler = AsyncAutoScaler(lb, min_servers=2, max_servers=8)
+    history = MetricsHistory(lb)
+    dashboard = Dashboard(lb, traffic_gen, auto_scaler, history=history)
+
+    endpoint = MetricsEndpoint(lb, traffic_gen, auto_scaler, port=http_port) if http_port is not None else None
+
+    traffic_gen.start()
+    auto_scaler.start()
+    history.start()
+    if endpoint:
+        # shares the loop with everything else, no thread needed
+        asyncio.get_running_loop().create_task(endpoint.serve())
+
+    try:
+        await dashboard.start_live_monitoring_async(refresh_interval=3)
+    finally:
+        traffic_gen.stop()
+        auto_scaler.stop()
+        lb.shutdown()
+        history.stop()
+        if endpoint:
+            endpoint.stop()
+        events.flush()
+
+        print_summary(lb, traffic_gen, history)
 
 def main():
     """
     Main point
     """
+    # --verbose shows every request, --event-log PATH also writes every event as JSON lines
+    configure(LogLevel.DEBUG if "--verbose" in sys.argv else LogLevel.INFO, jsonl_path=option_value("--event-log"))
+
+    # --metrics PATH publishes the stats into a file, python -m src.metrics_segment PATH shows them from another process
+    metrics_path = option_value("--metrics")
+
+    # --trace PATH replays a recorded trace, --speed 10 plays it ten times faster (0 as fast as possible)
+    trace_path = option_value("--trace")
+    trace_speed = float(option_value("--speed") or 1.0)
+
+    # --arrivals poisson|diurnal|mmpp sends open loop traffic at --rate requests per second on average
+    arrivals = None
+    if option_value("--arrivals"):
+        # non_homogeneous needs a rate function, only code can give it one
+        choices = [p.value for p in ArrivalProcess if p != ArrivalProcess.NON_HOMOGENEOUS]
+        if option_value("--arrivals") not in choices:
+            print(f"--arrivals must be one of {', '.join(choices)}")
+            sys.exit(1)
+        arrivals = create_arrivals(ArrivalProcess(option_value("--arrivals")), float(option_value("--rate") or 5))
+
+    # --http PORT serves the stats in Prometheus format at /metrics plus controls, see src/http_endpoint.py
+    http_port = int(option_value("--http")) if option_value("--http") else None
+
+    # --retries N retries requests that fail on their server, --hedge 95 sends a copy of requests slower than p95
+    retries = int(option_value("--retries") or 0)
+    hedge_percentile = float(option_value("--hedge")) if option_value("--hedge") else None
+
     welcome()
 
+    if "--async" in sys.argv:
+        # run everything on one asyncio event loop
+        try:
+            asyncio.run(run_async_system(http_port, retries, hedge_percentile))
+        except KeyboardInterrupt:
+            print("\nSystem has now shutdown")
+        return
+
     # setup system
-    lb, traffic_gen, auto_scaler, dashboard = system_setup()
+    lb, traffic_gen, auto_scaler, dashboard, publisher = system_setup(metrics_path, trace_path, trace_speed, arrivals, retries, hedge_percentile)
+    endpoint = MetricsEndpoint(lb, traffic_gen, auto_scaler, port=http_port) if http_port is not None else None
+
+    # --health ejects slow or failing servers
+    health = HealthChecker(lb) if "--health" in sys.argv else None
+
+    # --boot SECONDS makes added servers boot first and --warmup SECONDS open their slots slowly, --standby N keeps warm ones ready
+    provisioner = None
+    if option_value("--boot") or option_value("--warmup") or option_value("--standby"):
+        provisioner = Provisioner(lb, boot_time=float(option_value("--boot") or 0), warmup_time=float(option_value("--warmup") or 0),
+                                  standby=int(option_value("--standby") or 0))
+        auto_scaler.provisioner = provisioner
 
     # run system
-    run_system(lb, traffic_gen, auto_scaler, dashboard)
+    run_system(lb, traffic_gen, auto_scaler, dashboard, publisher, endpoint, health, provisioner)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,227 @@
+import time
+import threading
+from enum import Enum
+from collections import deque
+from .histogram import LatencyHistogram
+
+class QueueScope(Enum):
+    SHARED = "shared" # one queue, the first server with a free slot takes the oldest request
+    PER_SERVER = "per_server" # each server has its own queue, requests wait for that server
+
+
+class AdmissionQueues:
+    def __init__(self, queue_size=10, timeout=2.0, scope=QueueScope.SHARED, clock=time.perf_counter):
+        """
+        Bounded waiting queues for requests that arrive while every server is full
+
+        Instead of failing a request the moment no slot is free, it waits here until a
+        server finishes something. Waiting is bounded two ways: each queue only holds so
+        many requests (anything past that is shed right away) and a request that waited
+        longer than timeout is dropped instead of being started late.
+
+        Arguments:
+            queue_size: Requests allowed to wait per server, 0 turns queueing off
+            timeout: Longest a request may wait in seconds, None to wait forever
+            scope: One shared queue or a queue per server
+            clock: Function returning the time in seconds, the simulation passes its virtual clock
+        """
+
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.scope = scope
+        self.clock = clock
+
+        self.shared = deque() # (request_id, enqueued_at)
+        self.server_queues = {} # server_id -> deque, only used for waiting in PER_SERVER but counts servers in both
+        self.depth = 0 # requests waiting in every queue together
+
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.peak_depth = 0
+        self.wait = LatencyHistogram() # how long requests waited, admitted or timed out
+
+        self.lock = threading.Lock()
+
+    def enabled(self):
+        """
+        Is queueing turned on
+        """
+        return self.queue_size > 0
+
+    def capacity(self):
+        """
+        Most requests that can wait at once
+        """
+        if self.scope == QueueScope.SHARED:
+            return self.queue_size * max(1, len(self.server_queues))
+        return self.queue_size * len(self.server_queues)
+
+    def pressure(self):
+        """
+        How full the queues are from 0 to 1, 1 means new requests are being shed
+        """
+        capacity = self.capacity()
+        if not capacity:
+            return 0.0
+        return min(1.0, self.depth / capacity)
+
+    def add_server(self, server):
+        """
+        Make room for a new server (its own queue in PER_SERVER, more shared room otherwise)
+        """
+        with self.lock:
+            self.server_queues.setdefault(server.server_id, deque())
+
+    def remove_server(self, server):
+        """
+        Forget a server, returns the requests that were waiting for it so they can go elsewhere
+        """
+        with self.lock:
+            waiting = self.server_queues.pop(server.server_id, None) or deque()
+            self.depth -= len(waiting)
+            return list(waiting)
+
+    def enqueue(self, request_id, preferred=None, enqueued_at=None):
+        """
+        Put a request in line, returns False when there is no room and it was shed
+
+        With queueing off every request that gets here is shed
+
+        Arguments:
+            request_id: The request
+            preferred: Server whose queue it should wait in (PER_SERVER only), defaults to the shortest
+            enqueued_at: When it started waiting, for requests moved from a removed servers queue
+        """
+
+        if not self.enabled():
+            with self.lock:
+                self.shed += 1
+            return False
+
+        now = self.clock()
+        with self.lock:
+            self._expire(now)
+
+            if self.scope == QueueScope.SHARED:
+                waiting = self.shared if self.depth < self.capacity() else None
+            else:
+                waiting = self._pick_queue(preferred)
+
+            if waiting is None:
+                self.shed += 1
+                return False
+
+            if enqueued_at is None:
+                enqueued_at = now
+                self.queued += 1 # moved requests were already counted
+
+            waiting.append((request_id, enqueued_at))
+            self.depth += 1
+            if self.depth > self.peak_depth:
+                self.peak_depth = self.depth
+            return True
+
+    def _pick_queue(self, preferred):
+        """
+        Preferred servers queue if it has room, otherwise the shortest one with room
+        """
+        if preferred is not None:
+            waiting = self.server_queues.get(preferred.server_id)
+            if waiting is not None and len(waiting) < self.queue_size:
+                return waiting
+
+        best = None
+        for waiting in self.server_queues.values():
+            if len(waiting) < self.queue_size and (best is None or len(waiting) < len(best)):
+                best = waiting
+        return best
+
+    def next_for(self, server):
+        """
+        Take the oldest request that has not timed out which this server can take
+
+        Returns (request_id, seconds waited) or None if nothing is waiting. Call
+        record_admitted once it has a slot or put_back if it did not get one
+        """
+
+        if not self.depth:
+            return None
+
+        now = self.clock()
+        with self.lock:
+            self._expire(now)
+
+            waiting = self.shared if self.scope == QueueScope.SHARED else self.server_queues.get(server.server_id)
+            if not waiting:
+                return None
+
+            request_id, enqueued_at = waiting.popleft()
+            self.depth -= 1
+
+        return request_id, now - enqueued_at
+
+    def record_admitted(self, waited):
+        """
+        A request from next_for got its slot and is starting
+        """
+        with self.lock:
+            self.admitted += 1
+        self.wait.record(waited)
+
+    def put_back(self, server, request_id, waited):
+        """
+        Return a request taken by next_for to the front of its line (its server filled up first)
+        """
+        with self.lock:
+            waiting = self.shared if self.scope == QueueScope.SHARED else self.server_queues.get(server.server_id)
+            if waiting is None:
+                self.shed += 1
+                return
+
+            waiting.appendleft((request_id, self.clock() - waited))
+            self.depth += 1
+
+    def expire(self):
+        """
+        Drop every request that has waited past the timeout
+        """
+        if not self.depth:
+            return
+        with self.lock:
+            self._expire(self.clock())
+
+    def _expire(self, now):
+        """
+        Drop timed out requests from the front of each queue, lock must be held
+
+        Every request gets the same timeout so the oldest are always at the front
+        """
+        if self.timeout is None or not self.depth:
+            return
+
+        queues = (self.shared,) if self.scope == QueueScope.SHARED else self.server_queues.values()
+        for waiting in queues:
+            while waiting and now - waiting[0][1] > self.timeout:
+                _, enqueued_at = waiting.popleft()
+                self.depth -= 1
+                self.timed_out += 1
+                self.wait.record(now - enqueued_at)
+
+    def get_stats(self):
+        """
+        Get admission queue stats
+        """
+        return {
+            "queue_scope": self.scope.value,
+            "queue_depth": self.depth,
+            "peak_queue_depth": self.peak_depth,
+            "queue_capacity": self.capacity(),
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "backpressure": self.pressure(),
+            "p99_admission_wait": self.wait.percentile(99)
+        }
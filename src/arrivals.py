@@ -0,0 +1,286 @@
+import math
+import time
+import random
+from enum import Enum
+from itertools import accumulate
+from .traffic_generator import TrafficGenerator, TrafficPattern
+from .histogram import LatencyHistogram
+from .event_log import events
+
+class ArrivalProcess(Enum):
+    POISSON = "poisson" # constant rate, independent arrivals
+    NON_HOMOGENEOUS = "non_homogeneous" # rate given by a function of time
+    DIURNAL = "diurnal" # rate rises and falls once a period, like a day
+    MMPP = "mmpp" # switches between quiet and busy spells (Markov modulated Poisson)
+
+
+class PoissonArrivals:
+    def __init__(self, rate=10, rng=random):
+        """
+        Arrivals at a constant average rate with exponential gaps
+
+        Arguments:
+            rate: Requests per second
+            rng: Source of randomness, pass a seeded random.Random for repeatable arrivals
+        """
+
+        self.mode = ArrivalProcess.POISSON
+        self.rate = rate
+        self.rng = rng
+        self.last = 0.0
+
+    def next_chunk(self, size):
+        """
+        The next size arrival times in seconds from the start, carrying on from the last chunk
+        """
+        expovariate = self.rng.expovariate
+        rate = self.rate
+        times = list(accumulate([expovariate(rate) for _ in range(size)], initial=self.last))[1:]
+        self.last = times[-1]
+        return times
+
+
+class NonHomogeneousArrivals:
+    def __init__(self, rate_at, peak_rate, rng=random):
+        """
+        Arrivals whose rate changes over time, made by thinning a faster Poisson stream
+
+        Candidates come at peak_rate and each is kept with chance rate_at(t) / peak_rate,
+        which gives exactly rate_at(t) as long as it never goes above peak_rate
+
+        Arguments:
+            rate_at: Function from seconds since the start to requests per second
+            peak_rate: Highest rate rate_at ever returns
+            rng: Source of randomness
+        """
+
+        self.mode = ArrivalProcess.NON_HOMOGENEOUS
+        self.rate_at = rate_at
+        self.peak_rate = peak_rate
+        self.rng = rng
+        self.last = 0.0
+
+    def next_chunk(self, size):
+        """
+        The next size arrival times in seconds from the start, carrying on from the last chunk
+        """
+        expovariate = self.rng.expovariate
+        chance = self.rng.random
+        times = []
+        now = self.last
+        while len(times) < size:
+            now += expovariate(self.peak_rate)
+            if chance() * self.peak_rate < self.rate_at(now):
+                times.append(now)
+        self.last = now
+        return times
+
+
+class DiurnalArrivals(NonHomogeneousArrivals):
+    def __init__(self, rate=10, amplitude=0.5, period=86400, phase=0.0, rng=random):
+        """
+        Rate follows a sine wave around rate, busiest a quarter of the way through each period
+
+        Arguments:
+            rate: Average requests per second
+            amplitude: How far the rate swings as a fraction of rate, 0.5 goes from 0.5x to 1.5x
+            period: Seconds per cycle, a day by default
+            phase: Seconds into the cycle the arrivals start at
+            rng: Source of randomness
+        """
+
+        self.rate = rate
+        self.amplitude = amplitude
+        self.period = period
+        self.phase = phase
+
+        super().__init__(self._rate_at, rate * (1 + amplitude), rng)
+        self.mode = ArrivalProcess.DIURNAL
+
+    def _rate_at(self, now):
+        return self.rate * (1 + self.amplitude * math.sin(2 * math.pi * (now + self.phase) / self.period))
+
+
+class MMPPArrivals:
+    def __init__(self, rates=(5, 40), mean_dwell=(60, 10), rng=random):
+        """
+        Markov modulated Poisson arrivals, Poisson at one rate per state with random state changes
+
+        Stays in each state for an exponential time with that states mean_dwell, then
+        moves to another state at random. Good for traffic with quiet and busy spells.
+
+        Arguments:
+            rates: Requests per second in each state
+            mean_dwell: Average seconds spent in each state
+            rng: Source of randomness
+        """
+
+        self.mode = ArrivalProcess.MMPP
+        self.rates = rates
+        self.mean_dwell = mean_dwell
+        self.rng = rng
+
+        self.state = 0
+        self.state_ends = rng.expovariate(1 / mean_dwell[0])
+        self.last = 0.0
+        self.state_changes = 0
+
+    def next_chunk(self, size):
+        """
+        The next size arrival times in seconds from the start, carrying on from the last chunk
+        """
+        expovariate = self.rng.expovariate
+        times = []
+        now = self.last
+        while len(times) < size:
+            gap = expovariate(self.rates[self.state]) if self.rates[self.state] > 0 else math.inf
+            if now + gap < self.state_ends:
+                now += gap
+                times.append(now)
+                continue
+
+            # no arrival before the state ends, gaps are memoryless so start over in the next state
+            now = self.state_ends
+            self.state = self.rng.choice([s for s in range(len(self.rates)) if s != self.state])
+            self.state_ends = now + expovariate(1 / self.mean_dwell[self.state])
+            self.state_changes += 1
+        self.last = now
+        return times
+
+    def mean_rate(self):
+        """
+        Long run requests per second
+        """
+        return sum(r * d for r, d in zip(self.rates, self.mean_dwell)) / sum(self.mean_dwell)
+
+
+def create_arrivals(process=ArrivalProcess.POISSON, rate=10, rng=random, **options):
+    """
+    Build an arrival model, rate is the average requests per second
+    """
+
+    if process == ArrivalProcess.NON_HOMOGENEOUS:
+        return NonHomogeneousArrivals(rng=rng, **options)
+    elif process == ArrivalProcess.DIURNAL:
+        return DiurnalArrivals(rate, rng=rng, **options)
+    elif process == ArrivalProcess.MMPP:
+        # half the rate for 60s spells, four times it for 10s spells, averages to rate
+        options.setdefault("rates", (rate / 2, rate * 4))
+        return MMPPArrivals(rng=rng, **options)
+    else:
+        return PoissonArrivals(rate, rng=rng)
+
+
+class OpenLoopGenerator(TrafficGenerator):
+    def __init__(self, load_balancer, arrivals, sessions=None, rng=random, chunk_size=4096, spin_below=0.0005):
+        """
+        Sends requests at the times an arrival model gives, whatever the load balancer is doing
+
+        Arrival times are made a chunk at a time ahead of when they are needed and
+        each request is sent at start + its time on the monotonic clock. Deadlines are
+        absolute, so a late wake up never pushes the later requests back the way
+        sleeping between batches does, and requests that are due together go out in
+        one pass. How late each request went out is kept in a histogram.
+
+        Open loop means it does not slow down when the load balancer pushes back,
+        the rejected requests show up as shed. This is how real users arrive.
+
+        Arguments:
+            load_balancer: LoadBalancer instance to send requests to
+            arrivals: Arrival model, see create_arrivals
+            sessions: Number of user sessions, each request carries one as its routing key (None for no keys)
+            rng: Source of randomness for the session keys
+            chunk_size: Arrival times made at a time
+            spin_below: Waits shorter than this yield instead of sleeping, sleep wakes up too late for them
+        """
+
+        self.arrivals = arrivals
+        self.chunk_size = chunk_size
+        self.spin_below = spin_below
+
+        self.chunk = arrivals.next_chunk(chunk_size)
+        self.position = 0
+        self.lateness = LatencyHistogram(max_seconds=60)
+        self.replay_started = None
+
+        super().__init__(load_balancer, TrafficPattern.OPEN_LOOP, rng=rng, sessions=sessions)
+
+        events.info("open_loop_created", "Open loop arrivals from a {process} model", process=arrivals.mode.value)
+
+    def _next_due(self):
+        """
+        Seconds from the start when the next request is due
+        """
+        if self.position == len(self.chunk):
+            self.chunk = self.arrivals.next_chunk(self.chunk_size)
+            self.position = 0
+        return self.chunk[self.position]
+
+    def _generate_traffic(self):
+        """
+        Send on the real clock, runs on its own thread
+        """
+        self.replay_started = time.perf_counter()
+
+        while self.is_running:
+            self._send_batch(self._elapsed())
+
+            wait = self._calculate_sleep_time(self._elapsed())
+            if wait > self.spin_below:
+                # wake a little early and yield for the rest, sleep tends to oversleep
+                time.sleep(min(wait - self.spin_below, 0.5))
+            elif wait > 0:
+                time.sleep(0)
+
+    def _send_batch(self, elapsed_time):
+        """
+        Send every request due by elapsed_time
+
+        On the real clock it keeps going while more come due and times each send,
+        so a slow route_request shows up as lateness instead of being hidden
+        """
+        route_request = self.load_balancer.route_request
+        record = self.lateness.record
+        clock = self._elapsed if self.replay_started is not None else None
+
+        while self.is_running:
+            due = self._next_due()
+            if due > elapsed_time:
+                if clock is None:
+                    return
+                elapsed_time = clock()
+                if due > elapsed_time:
+                    return
+
+            self.request_counter += 1
+            key = f"session-{self.rng.randrange(self.sessions)}" if self.sessions else None
+            route_request(f"Traffic-{self.request_counter:04d}", key)
+
+            record((clock() if clock else elapsed_time) - due)
+            self.position += 1
+
+    def _elapsed(self):
+        return time.perf_counter() - self.replay_started
+
+    def _calculate_sleep_time(self, elapsed_time):
+        """
+        Time until the next request is due
+        """
+        return max(0.0, self._next_due() - elapsed_time)
+
+    def get_stats(self):
+        """
+        Get traffic generator stats plus how closely the requests kept to their times
+        """
+        stats = super().get_stats()
+
+        elapsed = time.perf_counter() - self.replay_started if self.replay_started else 0.0
+        late = self.lateness.percentiles((50, 99))
+
+        stats.update({
+            "arrival_process": self.arrivals.mode.value,
+            "send_rate": self.request_counter / elapsed if elapsed else 0.0,
+            "p50_lateness": late[50],
+            "p99_lateness": late[99]
+        })
+        return stats
@@ -0,0 +1,288 @@
+import time
+import random
+import asyncio
+from .load_balancer import LoadBalancer, RoutingAlgo
+from .traffic_generator import TrafficGenerator, TrafficPattern
+from .auto_scaler import AutoScaler
+from .dispatcher import DispatchMode
+from .event_log import events, quiet
+
+class AsyncDispatcher:
+    def __init__(self):
+        """
+        Runs every routed request as a task on the running event loop
+
+        A request costs one coroutine instead of one thread, so hundreds of
+        thousands can be in flight in one process
+        """
+
+        self.mode = DispatchMode.ASYNC_TASKS
+        self.submitted = 0
+        self.peak_in_flight = 0
+        self.tasks = set()
+
+    def attach(self, server):
+        """
+        Nothing to set up per server
+        """
+        pass
+
+    def detach(self, server):
+        """
+        Nothing to tear down per server
+        """
+        pass
+
+    def submit(self, server, request_id, queue_wait=0.0):
+        """
+        Schedule the request as a task, must be called from inside the event loop
+
+        The load balancer has already reserved the slot
+        """
+        self.submitted += 1
+
+        task = asyncio.get_running_loop().create_task(self._run(server, request_id, time.perf_counter() - queue_wait))
+
+        # keep a reference so the task isnt garbage collected while running
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+        if len(self.tasks) > self.peak_in_flight:
+            self.peak_in_flight = len(self.tasks)
+
+    async def _run(self, server, request_id, submitted_at):
+        """
+        Task body, the wait is how long the loop took to start the task
+        """
+        return await server.process_request_async(request_id, time.perf_counter() - submitted_at, reserved=True)
+
+    async def drain(self):
+        """
+        Wait until every request submitted so far has finished
+        """
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+
+    def shutdown(self):
+        """
+        Cancel anything still running
+        """
+        for task in list(self.tasks):
+            task.cancel()
+
+    def get_stats(self):
+        """
+        Get dispatcher stats
+        """
+        return {
+            "mode": self.mode.value,
+            "workers": 0,
+            "submitted": self.submitted,
+            "threads_created": 0,
+            "queue_depth": len(self.tasks),
+            "peak_queue_depth": self.peak_in_flight
+        }
+
+
+class AsyncLoadBalancer(LoadBalancer):
+    def __init__(self, rounting_algo=RoutingAlgo.ROTATING, **options):
+        """
+        Load balancer that routes requests as coroutines on one event loop
+
+        Uses the same routing algorithms and get_stats as LoadBalancer. Hedges are
+        timed on the event loop instead of a timer thread, so like every other request
+        their copies are submitted from the loop
+
+        Arguments:
+            rounting_algo: Routing algorithm
+            options: Any other LoadBalancer option, like queue_size, retries or hedge_percentile
+        """
+
+        if "dispatcher" in options or "call_later" in options:
+            raise ValueError("AsyncLoadBalancer always runs requests and hedge timers on the event loop")
+
+        self.loop = None # the loop requests run on, found on the first hedge
+        super().__init__(rounting_algo, dispatcher=AsyncDispatcher(), call_later=self._call_later, **options)
+
+    def _call_later(self, delay, callback):
+        """
+        Run callback on the event loop after delay seconds, safe from any thread
+        """
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, callback)
+
+    async def route_request_async(self, request_id, key=None):
+        """
+        Route a request from a coroutine
+
+        Routing never blocks so this just calls route_request, it only exists
+        so callers can await it like the rest of the async api
+        """
+        return self.route_request(request_id, key)
+
+    async def drain(self):
+        """
+        Wait for every in flight request to finish
+        """
+        await self.dispatcher.drain()
+
+
+class AsyncTrafficGenerator(TrafficGenerator):
+    def __init__(self, load_balancer, pattern=TrafficPattern.STEADY, rng=random, sessions=None):
+        """
+        Traffic generator that runs as a task instead of a thread
+        """
+
+        super().__init__(load_balancer, pattern, rng, sessions)
+        self.generator_task = None
+
+    def start(self):
+        """
+        Start generating traffic, must be called from inside the event loop
+        """
+        if self.is_running:
+            events.info("generator_running", "Traffic Generator is running")
+            return
+
+        self.is_running = True
+        self.generator_task = asyncio.get_running_loop().create_task(self._generate_traffic_async())
+
+        events.info("generator_started", "Traffic Generation has started")
+
+    def stop(self):
+        """
+        Stop generating the traffic
+        """
+        self.is_running = False
+        if self.generator_task:
+            self.generator_task.cancel()
+        events.info("generator_stopped", "Traffic Generation stopped")
+
+    async def _generate_traffic_async(self):
+        """
+        Same loop as _generate_traffic but awaits between batches
+        """
+        start_time = time.time()
+
+        while self.is_running:
+            elapsed_time = time.time() - start_time
+
+            self._send_batch(elapsed_time)
+
+            await asyncio.sleep(self._calculate_sleep_time(elapsed_time))
+
+
+class AsyncAutoScaler(AutoScaler):
+    def __init__(self, load_balancer, min_servers=2, max_servers=8, clock=time.time, policy=None):
+        """
+        Auto scaler that checks the load from a task instead of a thread
+        """
+
+        super().__init__(load_balancer, min_servers, max_servers, clock, policy)
+        self.monitor_task = None
+        self.async_wake = None
+
+    def start(self):
+        """
+        Start the auto scaler monitoring, must be called from inside the event loop
+        """
+
+        self.is_running = True
+        self.async_wake = asyncio.Event()
+        if self.event_driven:
+            self.load_balancer.triggers.subscribe(self._on_signal)
+        self.monitor_task = asyncio.get_running_loop().create_task(self._monitor_async())
+        events.info("scaler_started", "Auto Scaler started")
+
+    def stop(self):
+        """
+        Stop the auto scaler
+        """
+        self.is_running = False
+        if self.event_driven:
+            self.load_balancer.triggers.unsubscribe(self._on_signal)
+        if self.monitor_task:
+            self.monitor_task.cancel()
+        events.info("scaler_stopped", "Auto Scaler stopped")
+
+    def _on_signal(self, signal, util):
+        """
+        The load balancer crossed a line, every load change happens on the event loop so the event can be set directly
+        """
+        self.signals_heard += 1
+        if self.async_wake:
+            self.async_wake.set()
+
+    def _wake(self):
+        """
+        Make the monitor check now, set from the event loop like the signals
+        """
+        if self.async_wake:
+            self.async_wake.set()
+
+    async def _monitor_async(self):
+        """
+        Check the load when a signal arrives (or every check_interval when not event driven)
+        """
+        while self.is_running:
+            if self.event_driven:
+                try:
+                    await asyncio.wait_for(self.async_wake.wait(), self._next_wait())
+                except asyncio.TimeoutError:
+                    pass
+                self.async_wake.clear()
+            else:
+                await asyncio.sleep(self.check_interval)
+
+            self._check_and_scale()
+
+
+async def run_concurrency_test(total_requests=100000, servers=10, response_time=2.0):
+    """
+    Put total_requests in flight at once and wait for all of them
+
+    Every server gets enough capacity that nothing is rejected, so this
+    shows how many simultaneous requests one process can hold
+    """
+
+    from .server import Server
+
+    lb = AsyncLoadBalancer(RoutingAlgo.ROTATING)
+    capacity = total_requests // servers + 1
+    for i in range(servers):
+        lb.add_server(Server(f"Async-{i+1}", max_capacity=capacity, base_response_time=response_time))
+
+    start = time.perf_counter()
+    for i in range(total_requests):
+        lb.route_request(f"Async-req-{i+1}")
+
+    # let every task start before measuring the peak
+    await asyncio.sleep(0)
+    peak_load = lb.get_stats()["current_load"]
+
+    await lb.drain()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total_requests,
+        "peak_in_flight": peak_load,
+        "success_rate": lb.get_stats()["success_rate"],
+        "elapsed_s": elapsed
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print(f"Starting {total} concurrent requests on one event loop")
+
+    # per request logging would take longer than the test itself
+    with quiet():
+        result = asyncio.run(run_concurrency_test(total))
+
+    print(f"Peak in flight: {result['peak_in_flight']}")
+    print(f"Success Rate: {result['success_rate']:.1f}%")
+    print(f"Finished in {result['elapsed_s']:.2f}s")
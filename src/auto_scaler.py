@@ -2,10 +2,16 @@ import time
 import threading
 import random
 from .server import Server
+from .event_log import events
+from .scaling_policy import ThresholdPolicy
+from .load_triggers import LoadSignal
+from .load_balancer import DrainChoice
 from datetime import datetime
 
 class AutoScaler:
-    def __init__(self, load_balancer, min_servers=2, max_servers=8):
+    def __init__(self, load_balancer, min_servers=2, max_servers=8, clock=time.time, policy=None,
+                 event_driven=True, check_interval=5, recheck_interval=1.0, idle_interval=30.0, drain_timeout=30.0,
+                 drain_choice=DrainChoice.LEAST_LOADED, server_capacity=3, server_response_time=0.4, provisioner=None):
         """
         Automatically add or remove servers based on the systems load
 
@@ -13,17 +19,44 @@ class AutoScaler:
             load_balancer: The LoadBalancer instance to manage
             min_servers: Minimum number of servers, never go below this
             max_servers: Maximum number of servers, never go above this
+            clock: Function returning the current time in seconds, the simulation passes its virtual clock
+            policy: Decides how many servers there should be, defaults to the 70%/30% ThresholdPolicy
+            event_driven: Wake up when the load balancer publishes a load signal instead of checking on a timer
+            check_interval: Seconds between checks when not event driven
+            recheck_interval: Seconds between checks while a signal it can act on stays on (cooldowns, busy servers)
+            idle_interval: Seconds between checks while the load is stable, so the policy still gets readings
+            drain_timeout: Seconds a server being scaled down gets to finish its requests before it is removed anyway
+            drain_choice: Which server to drain when scaling down
+            server_capacity: max_capacity of the servers it adds
+            server_response_time: base_response_time of the servers it adds
+            provisioner: Provisioner that boots the servers it adds, None adds them ready at once
         """
 
         self.load_balancer = load_balancer
         self.min_servers = min_servers
         self.max_servers = max_servers
+        self.clock = clock
+        self.policy = policy or ThresholdPolicy()
         self.server_count = 0
         self.is_running = False
         self.last_scale_time = 0
 
+        self.event_driven = event_driven
+        self.check_interval = check_interval
+        self.recheck_interval = recheck_interval
+        self.idle_interval = idle_interval
+        self.drain_timeout = drain_timeout
+        self.drain_choice = drain_choice
+        self.server_capacity = server_capacity
+        self.server_response_time = server_response_time
+        self.provisioner = provisioner
+        self.wake = threading.Event()
+        self.checks = 0
+        self.signals_heard = 0
 
-        print(f"Auto Scaler initialized witn min {min_servers} and max {max_servers} servers")
+
+        events.info("scaler_created", "Auto Scaler initialized with min {min_servers} and max {max_servers} servers ({policy} policy)",
+                    min_servers=min_servers, max_servers=max_servers, policy=self.policy.mode.value)
 
     
     def start(self):
@@ -32,64 +65,174 @@ class AutoScaler:
         """
 
         self.is_running = True
+        if self.event_driven:
+            self.load_balancer.triggers.subscribe(self._on_signal)
         threading.Thread(target=self._monitor).start()
-        print("Auto Scaler started")
+        events.info("scaler_started", "Auto Scaler started")
     
     def stop(self):
         """
         Stop the auto scaler
         """
         self.is_running = False
-        print("Auto Scaler stopped")
-    
+        if self.event_driven:
+            self.load_balancer.triggers.unsubscribe(self._on_signal)
+        self.wake.set()
+        events.info("scaler_stopped", "Auto Scaler stopped")
+
+    def set_bounds(self, min_servers, max_servers):
+        """
+        Change the fewest and most servers while running, the next check scales to fit
+        """
+        if min_servers < 1 or max_servers < min_servers:
+            raise ValueError(f"need 1 <= min_servers <= max_servers, got {min_servers} and {max_servers}")
+
+        self.min_servers = min_servers
+        self.max_servers = max_servers
+        events.info("scaler_bounds", "Auto Scaler bounds changed to min {min_servers} and max {max_servers} servers",
+                    min_servers=min_servers, max_servers=max_servers)
+        self._wake()
+
+    def _wake(self):
+        """
+        Make the monitor check now instead of at its next wait
+        """
+        self.wake.set()
+
+    def _on_signal(self, signal, util):
+        """
+        The load balancer crossed a line, wake the monitor
+
+        Runs on the thread that changed the load (maybe holding the routing lock), so
+        it only sets the event, the scaling happens on the monitor thread
+        """
+        self.signals_heard += 1
+        self.wake.set()
+
+    def _next_wait(self):
+        """
+        How long to sleep before the next check
+
+        Short while a signal that needs servers added or removed is still on, the
+        check may have been in a cooldown or found every server busy. Long otherwise
+        """
+        if not self.event_driven:
+            return self.check_interval
+
+        # wake up in time to remove a server whose drain ran out of time
+        wait = self.idle_interval
+        until_drain = self.load_balancer.time_until_next_drain()
+        if until_drain is not None:
+            wait = min(wait, until_drain)
+
+        signals = self.load_balancer.triggers.active_signals()
+        server_count = len(self.load_balancer.servers) - len(self.load_balancer.draining)
+        if self.provisioner:
+            server_count += self.provisioner.pending()
+
+        if server_count < self.max_servers and signals & {LoadSignal.HIGH_UTIL, LoadSignal.QUEUEING, LoadSignal.SHEDDING}:
+            return min(wait, self.recheck_interval)
+        if server_count > self.min_servers and LoadSignal.LOW_UTIL in signals:
+            return min(wait, self.recheck_interval)
+        return wait
+
     def _monitor(self):
         """
         Check system load and scale up or down as needed
         """
         while self.is_running:
-            time.sleep(5) # check every 5 seconds
-
-            # not too often
-            if time.time() - self.last_scale_time < 10:
-                continue
-
-            stats = self.load_balancer.get_stats()
-            util = stats['util']
-            server_count = stats['total_servers']
-
-            # scale up if busy
-            if util > 70 and server_count < self.max_servers:
-                self._add_server()
-            
-            # scale down if quiet
-            elif util < 30 and server_count > self.min_servers:
-                self._remove_server()
+            if self.event_driven:
+                # sleeps until a load signal or the next recheck, whichever comes first
+                self.wake.wait(self._next_wait())
+                self.wake.clear()
+            else:
+                time.sleep(self.check_interval)
+
+            if not self.is_running:
+                return
+            self._check_and_scale()
+
+    def _check_and_scale(self):
+        """
+        One check of the load, adds or removes servers to get to what the policy wants
+        """
+
+        self.checks += 1
+
+        # drains and waits that ran out of time are ended here, so get_stats stays read only
+        self.load_balancer.expire_drains()
+        self.load_balancer.expire_waiting()
+        stats = self.load_balancer.get_stats()
+
+        # draining servers are on their way out, size the pool without them
+        stats['total_servers'] -= stats['draining_servers']
+        # booting ones are on their way in, count them or every check asks for more
+        if self.provisioner:
+            stats['total_servers'] += self.provisioner.pending()
+        server_count = stats['total_servers']
+
+        desired = self.policy.desired_servers(stats, self.clock(), self.last_scale_time)
+        desired = max(self.min_servers, min(self.max_servers, desired))
+
+        # scale up if busy
+        for _ in range(desired - server_count):
+            self._add_server()
+
+        # scale down if quiet
+        for _ in range(server_count - desired):
+            if not self._remove_server():
+                break # everything left is busy, try again next check
     
     def _add_server(self):
         """
-        Adds a new server
+        Adds a new server, or keeps one that is still draining instead
         """
+        for server_id in list(self.load_balancer.draining):
+            if self.load_balancer.cancel_drain(server_id):
+                self.last_scale_time = self.clock()
+                events.info("scaled_up", ">>>>> Scaled UP: Kept draining server {server_id} (Total: {total})<<<<<",
+                            server_id=server_id, total=len(self.load_balancer.servers))
+                return
+
         self.server_count +=1
         server_id = f"Auto-{self.server_count:}"
-        new_server = Server(server_id, max_capacity=3, base_response_time=0.4)
+        self.last_scale_time = self.clock()
+
+        if self.provisioner:
+            server = self.provisioner.request_server(server_id)
+            if server is None:
+                events.info("scaled_up", ">>>>> Scaled UP: Booting server {server_id} (Total: {total})<<<<<", server_id=server_id,
+                            total=len(self.load_balancer.servers) + self.provisioner.pending())
+            else:
+                events.info("scaled_up", ">>>>> Scaled UP: Promoted standby server {server_id} (Total: {total})<<<<<",
+                            server_id=server.server_id, total=len(self.load_balancer.servers))
+            return
+
+        new_server = Server(server_id, max_capacity=self.server_capacity, base_response_time=self.server_response_time, clock=self.clock)
 
         self.load_balancer.add_server(new_server)
-        self.last_scale_time = time.time()
 
-        print(f">>>>> Scaled UP: Added server {server_id} (Total: {len(self.load_balancer.servers)})<<<<<")
+        events.info("scaled_up", ">>>>> Scaled UP: Added server {server_id} (Total: {total})<<<<<", server_id=server_id, total=len(self.load_balancer.servers))
 
     def _remove_server(self):
         """
-        Removes the least busy server
+        Drains a server, it is removed once its requests finish. Returns False if none can be drained
         """
+        if self.provisioner and self.provisioner.cancel_boot():
+            self.last_scale_time = self.clock()
+            events.info("scaled_down", ">>>>> Scaled DOWN: Cancelled a boot (Serving: {total})<<<<<",
+                        total=len(self.load_balancer.servers) - len(self.load_balancer.draining))
+            return True
+
 
-        for server in self.load_balancer.servers:
-            if server.current_requests == 0:
-                self.load_balancer.remove_server(server.server_id)
-                self.last_scale_time = time.time()
+        server = self.load_balancer.drain_candidate(self.drain_choice)
+        if server is None or not self.load_balancer.drain_server(server.server_id, self.drain_timeout):
+            return False
 
-                print(f">>>>> Scaled DOWN: Removed server {server.server_id} (Total: {len(self.load_balancer.servers)})<<<<<")
-                break
+        self.last_scale_time = self.clock()
+        events.info("scaled_down", ">>>>> Scaled DOWN: Draining server {server_id} (Serving: {total})<<<<<", server_id=server.server_id,
+                    total=len(self.load_balancer.servers) - len(self.load_balancer.draining))
+        return True
 
 if __name__ == "__main__":
     from load_balancer import LoadBalancer, RoutingAlgo
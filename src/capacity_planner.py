@@ -0,0 +1,301 @@
+import os
+import json
+import glob
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .simulation import Simulation
+from .load_balancer import RoutingAlgo
+from .traffic_generator import TrafficPattern
+
+CACHE_VERSION = 1 # bump when a job or its result changes shape
+
+
+def code_fingerprint():
+    """
+    Hash of every source file the simulation runs, so cached results go stale when the code changes
+    """
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """
+    Hash of a trace file, a changed trace is a different scenario
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_job(job):
+    """
+    One seeded simulation of one configuration, runs in a worker process
+
+    Takes and returns plain dicts so they pickle cheaply and go straight into the cache
+    """
+    servers = [(f"plan-{i+1}", job["capacity"], job["response_time"]) for i in range(job["min_servers"])]
+    pattern = TrafficPattern[job["pattern"]] if job["pattern"] else TrafficPattern.BURST
+
+    results = Simulation(pattern, duration=job["duration"], seed=job["seed"], rounting_algo=RoutingAlgo(job["algorithm"]),
+                         initial_servers=servers, min_servers=job["min_servers"], max_servers=job["max_servers"],
+                         trace=job["trace"], trace_speed=job["trace_speed"], server_capacity=job["capacity"],
+                         server_response_time=job["response_time"]).run()
+
+    return {
+        "success_rate": results["success_rate"],
+        "p99_latency": results["p99_latency"],
+        "server_seconds": results["server_seconds"],
+        "peak_servers": results["peak_servers"],
+        "total_requests": results["total_requests"]
+    }
+
+
+class CapacityPlanner:
+    def __init__(self, patterns=(TrafficPattern.BURST,), traces=(), min_servers=(1, 2, 4), max_servers=(4, 8, 16), capacities=(3, 5, 10),
+                 algorithms=(RoutingAlgo.LEAST_CONNECTIONS,), seeds=10, duration=600, p99_slo=1.0, success_slo=99.0, confidence=0.9,
+                 response_time=0.4, trace_speed=1.0, workers=None, cache_dir=".capacity-cache"):
+        """
+        Finds the cheapest cluster that meets a latency and success rate SLO by simulating every option
+
+        Every configuration (min servers, max servers, slots per server, routing algorithm)
+        is simulated on every scenario (pattern or trace) once per seed. Seed n is the same
+        traffic for every configuration, so they are compared on equal terms, and the same
+        sweep always gives the same answer.
+
+        Runs go to a process pool and every result is cached on disk under a hash of the
+        job and the source code, so a repeated or widened sweep only runs what is new.
+
+        A configuration meets the SLO when, in every scenario, at least confidence of its
+        seeded runs had p99 latency at or under p99_slo and success rate at or over
+        success_slo. Cost is slot hours, server hours times slots per server, so one 10
+        slot server costs the same as two 5 slot ones.
+
+        Arguments:
+            patterns: TrafficPatterns to plan for
+            traces: Trace files to plan for as well
+            min_servers: Auto scaler minimums to try, also the starting server count
+            max_servers: Auto scaler maximums to try
+            capacities: Slots per server (max_capacity) to try
+            algorithms: RoutingAlgos to try
+            seeds: Seeded runs per configuration and scenario
+            duration: Virtual seconds per run
+            p99_slo: Highest acceptable p99 latency in seconds
+            success_slo: Lowest acceptable success rate in percent
+            confidence: Share of the seeded runs that must meet the SLO
+            response_time: base_response_time of every server
+            trace_speed: How much faster than recorded to replay the traces
+            workers: Processes to run on, None for one per CPU, 1 runs everything in this process
+            cache_dir: Directory for cached results, None to not cache
+        """
+
+        self.patterns = list(patterns)
+        self.traces = list(traces)
+        self.min_servers = list(min_servers)
+        self.max_servers = list(max_servers)
+        self.capacities = list(capacities)
+        self.algorithms = list(algorithms)
+        self.seeds = seeds
+        self.duration = duration
+        self.p99_slo = p99_slo
+        self.success_slo = success_slo
+        self.confidence = confidence
+        self.response_time = response_time
+        self.trace_speed = trace_speed
+        self.workers = workers
+        self.cache_dir = cache_dir
+
+        self.ran = 0
+        self.cached = 0
+
+    def scenarios(self):
+        """
+        (name, pattern name or None, trace path or None) for everything planned for
+        """
+        return ([(pattern.name.lower(), pattern.name, None) for pattern in self.patterns] +
+                [(trace, None, trace) for trace in self.traces])
+
+    def configs(self):
+        """
+        Every (min_servers, max_servers, capacity, algorithm) worth trying
+        """
+        return [(low, high, capacity, algorithm) for low, high, capacity, algorithm
+                in itertools.product(self.min_servers, self.max_servers, self.capacities, self.algorithms) if low <= high]
+
+    def _job(self, config, scenario, seed):
+        low, high, capacity, algorithm = config
+        _, pattern, trace = scenario
+        return {
+            "min_servers": low,
+            "max_servers": high,
+            "capacity": capacity,
+            "algorithm": algorithm.value,
+            "pattern": pattern,
+            "trace": trace,
+            "trace_speed": self.trace_speed,
+            "seed": seed,
+            "duration": self.duration,
+            "response_time": self.response_time
+        }
+
+    def _cache_path(self, job, fingerprints):
+        """
+        Where a jobs result is cached, the name hashes the job, the code and the trace it replays
+        """
+        key = json.dumps({"version": CACHE_VERSION, "code": fingerprints["code"], "trace_hash": fingerprints["traces"].get(job["trace"]), **job},
+                         sort_keys=True)
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def _load(self, path):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None # missing or half written, run it again
+
+    def _store(self, path, result):
+        # written aside and renamed, so a killed sweep never leaves a broken entry
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w") as file:
+            json.dump(result, file)
+        os.replace(temp, path)
+
+    def run_all(self):
+        """
+        Run or load every job, returns {(config, scenario name, seed): result}
+        """
+        fingerprints = {"code": code_fingerprint(), "traces": {trace: file_fingerprint(trace) for trace in self.traces}}
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        results = {}
+        todo = []
+        for config in self.configs():
+            for scenario in self.scenarios():
+                for seed in range(self.seeds):
+                    job = self._job(config, scenario, seed)
+                    path = self._cache_path(job, fingerprints) if self.cache_dir else None
+                    result = self._load(path) if path else None
+                    if result is None:
+                        todo.append(((config, scenario[0], seed), job, path))
+                    else:
+                        results[(config, scenario[0], seed)] = result
+        self.cached = len(results)
+
+        def finished(key, path, result):
+            results[key] = result
+            if path:
+                self._store(path, result)
+            self.ran += 1
+
+        if self.workers == 1 or len(todo) <= 1:
+            for key, job, path in todo:
+                finished(key, path, run_job(job))
+        elif todo:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(run_job, job): (key, path) for key, job, path in todo}
+                for future in as_completed(futures):
+                    finished(*futures[future], future.result())
+
+        return results
+
+    def _meets_slo(self, result):
+        return result["p99_latency"] <= self.p99_slo and result["success_rate"] >= self.success_slo
+
+    def plan(self):
+        """
+        Simulate the sweep, returns one row per configuration sorted cheapest first, SLO or not
+        """
+        results = self.run_all()
+        scenario_names = [name for name, _, _ in self.scenarios()]
+
+        rows = []
+        for config in self.configs():
+            low, high, capacity, algorithm = config
+            runs = {name: [results[(config, name, seed)] for seed in range(self.seeds)] for name in scenario_names}
+            flat = [run for seeded in runs.values() for run in seeded]
+
+            # the worst scenario decides, a config has to hold up under all of them
+            pass_rate = min(sum(1 for run in seeded if self._meets_slo(run)) / len(seeded) for seeded in runs.values())
+
+            rows.append({
+                "min_servers": low,
+                "max_servers": high,
+                "capacity": capacity,
+                "algorithm": algorithm.value,
+                "success_rate": sum(run["success_rate"] for run in flat) / len(flat),
+                "p99_latency": sum(run["p99_latency"] for run in flat) / len(flat),
+                "worst_p99_latency": max(run["p99_latency"] for run in flat),
+                "peak_servers": max(run["peak_servers"] for run in flat),
+                "slot_hours": sum(run["server_seconds"] for run in flat) * capacity / len(flat) / 3600,
+                "pass_rate": pass_rate,
+                "meets_slo": pass_rate >= self.confidence
+            })
+
+        rows.sort(key=lambda row: (row["slot_hours"], row["min_servers"], row["max_servers"], row["capacity"], row["algorithm"]))
+        return rows
+
+    @staticmethod
+    def cheapest(rows):
+        """
+        The cheapest row that meets the SLO, None if none do
+        """
+        return next((row for row in rows if row["meets_slo"]), None)
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Find the cheapest cluster that meets a latency and success rate SLO")
+    parser.add_argument("--patterns", nargs="*", choices=["steady", "burst", "gradual_increase", "random"])
+    parser.add_argument("--trace", action="append", default=[], help="also plan for this trace file, may be given more than once")
+    parser.add_argument("--speed", type=float, default=1.0, help="trace replay speed, 10 is ten times faster")
+    parser.add_argument("--min", type=int, nargs="+", default=[1, 2, 4], help="min_servers values to try")
+    parser.add_argument("--max", type=int, nargs="+", default=[4, 8, 16], help="max_servers values to try")
+    parser.add_argument("--capacity", type=int, nargs="+", default=[3, 5, 10], help="slots per server to try")
+    parser.add_argument("--algo", nargs="+", default=["least_connections"], choices=[algo.value for algo in RoutingAlgo])
+    parser.add_argument("--seeds", type=int, default=10, help="seeded runs per configuration and scenario")
+    parser.add_argument("--duration", type=float, default=600, help="virtual seconds per run")
+    parser.add_argument("--p99", type=float, default=1.0, help="p99 latency SLO in seconds")
+    parser.add_argument("--success", type=float, default=99.0, help="success rate SLO in percent")
+    parser.add_argument("--confidence", type=float, default=0.9, help="share of seeded runs that must meet the SLO")
+    parser.add_argument("--workers", type=int, default=None, help="processes to use, defaults to one per CPU")
+    parser.add_argument("--cache", default=".capacity-cache", help="directory to cache results in")
+    parser.add_argument("--no-cache", action="store_true", help="run everything and cache nothing")
+    parser.add_argument("--top", type=int, default=15, help="rows to show")
+    args = parser.parse_args()
+
+    # burst unless only traces were asked for
+    patterns = args.patterns if args.patterns is not None else ([] if args.trace else ["burst"])
+    planner = CapacityPlanner([TrafficPattern[name.upper()] for name in patterns],
+                              args.trace, args.min, args.max, args.capacity, [RoutingAlgo(algo) for algo in args.algo], args.seeds,
+                              args.duration, args.p99, args.success, args.confidence, trace_speed=args.speed, workers=args.workers,
+                              cache_dir=None if args.no_cache else args.cache)
+
+    start = time.perf_counter()
+    rows = planner.plan()
+    elapsed = time.perf_counter() - start
+
+    scenarios = ", ".join(name for name, _, _ in planner.scenarios())
+    print(f"{len(rows)} configurations x {scenarios} x {args.seeds} seeds of {args.duration:.0f}s: "
+          f"{planner.ran} simulated, {planner.cached} cached, {elapsed:.1f}s")
+    print(f"SLO: p99 <= {args.p99:g}s and success >= {args.success:g}% in {args.confidence * 100:.0f}% of runs\n")
+
+    print(f"{'min':>4}{'max':>5}{'slots':>7}  {'algorithm':<18}{'success %':>10}{'p99 s':>8}{'worst s':>9}{'peak':>6}{'slot h':>9}{'pass %':>8}  slo")
+    for row in rows[:args.top]:
+        print(f"{row['min_servers']:>4}{row['max_servers']:>5}{row['capacity']:>7}  {row['algorithm']:<18}{row['success_rate']:>10.2f}"
+              f"{row['p99_latency']:>8.3f}{row['worst_p99_latency']:>9.3f}{row['peak_servers']:>6}{row['slot_hours']:>9.2f}"
+              f"{row['pass_rate'] * 100:>8.0f}  {'yes' if row['meets_slo'] else 'no'}")
+
+    best = CapacityPlanner.cheapest(rows)
+    if best:
+        print(f"\nCheapest that meets the SLO: min {best['min_servers']}, max {best['max_servers']}, {best['capacity']} slots per server, "
+              f"{best['algorithm']} ({best['slot_hours']:.2f} slot hours per run)")
+    else:
+        print("\nNo configuration meets the SLO, try more servers or bigger ones")
@@ -0,0 +1,92 @@
+import threading
+from .server import ServerStatus
+
+class ClusterStats:
+    def __init__(self):
+        """
+        Load balancer totals kept up to date as things change instead of rescanned
+
+        Every server change (request started or finished, status or capacity changed)
+        is applied as a difference from what was last seen for that server, so keeping
+        the totals right is O(1) per change and reading them is O(1).
+
+        Uses its own small lock, never the routing lock, so reading stats never
+        holds up routing. Under the GIL striped counters would not update in
+        parallel anyway, and one lock keeps every snapshot consistent.
+        """
+
+        self.lock = threading.Lock()
+
+        self.server_count = 0
+        self.healthy_servers = 0
+        self.total_capacity = 0
+        self.current_load = 0
+
+        # what each server looked like last time, so changes can be applied as differences
+        self.loads = {} # server_id -> current_requests
+        self.capacities = {} # server_id -> max_capacity
+        self.healthy = {} # server_id -> bool
+
+    def add_server(self, server):
+        """
+        Count a new server
+        """
+        with self.lock:
+            if server.server_id in self.loads:
+                return
+
+            healthy = server.status == ServerStatus.HEALTHY
+            self.loads[server.server_id] = server.current_requests
+            self.capacities[server.server_id] = server.max_capacity
+            self.healthy[server.server_id] = healthy
+
+            self.server_count += 1
+            self.current_load += server.current_requests
+            self.total_capacity += server.max_capacity
+            self.healthy_servers += healthy
+
+    def remove_server(self, server):
+        """
+        Stop counting a server
+        """
+        with self.lock:
+            if server.server_id not in self.loads:
+                return
+
+            self.server_count -= 1
+            self.current_load -= self.loads.pop(server.server_id)
+            self.total_capacity -= self.capacities.pop(server.server_id)
+            self.healthy_servers -= self.healthy.pop(server.server_id)
+
+    def on_server_change(self, server):
+        """
+        Apply whatever changed on the server since last time, O(1)
+        """
+        with self.lock:
+            old_load = self.loads.get(server.server_id)
+            if old_load is None:
+                return # not ours (already removed)
+
+            load = server.current_requests
+            self.current_load += load - old_load
+            self.loads[server.server_id] = load
+
+            capacity = server.max_capacity
+            self.total_capacity += capacity - self.capacities[server.server_id]
+            self.capacities[server.server_id] = capacity
+
+            healthy = server.status == ServerStatus.HEALTHY
+            self.healthy_servers += healthy - self.healthy[server.server_id]
+            self.healthy[server.server_id] = healthy
+
+    def snapshot(self):
+        """
+        All the totals from the same moment
+        """
+        with self.lock:
+            return {
+                "total_servers": self.server_count,
+                "healthy_servers": self.healthy_servers,
+                "total_capacity": self.total_capacity,
+                "current_load": self.current_load
+            }
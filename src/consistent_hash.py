@@ -0,0 +1,214 @@
+import math
+import bisect
+import hashlib
+import threading
+from operator import itemgetter
+
+def stable_hash(value):
+    """
+    64 bit hash that is the same in every process (python's hash() is not)
+    """
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, vnodes=100, load_factor=1.25, probe_keys=2000):
+        """
+        Consistent hash ring with virtual nodes and bounded load
+
+        Every server is put on the ring vnodes times. A key goes to the first server
+        clockwise from its hash, found with a binary search, O(log n). Adding or
+        removing a server only moves the keys next to its points, about 1/n of them.
+        If that server is full or already has more than load_factor times the average
+        load, the key keeps walking clockwise to the next server.
+
+        Arguments:
+            vnodes: Points on the ring per server, more gives a more even split
+            load_factor: How far over the average load a server may go before keys overflow
+            probe_keys: Sample keys used to measure how many keys move on a change
+        """
+
+        self.vnodes = vnodes
+        self.load_factor = load_factor
+
+        self.points = [] # sorted hashes
+        self.owners = [] # server at each point
+        self.pending = [] # (hash, server) added since the ring was last sorted
+        self.servers = {} # server_id -> server
+
+        # load tracking for the bound, kept up to date by update()
+        # update() runs on the server threads without the routing lock, so these have a small lock of their own
+        self.loads = {} # server_id -> current_requests last seen
+        self.total_load = 0
+        self.load_lock = threading.Lock()
+
+        # hashed once up front, re-checking them after a change is just binary searches
+        self.probe_hashes = [stable_hash(f"probe-{i}") for i in range(probe_keys)]
+        self.probe_owners = None
+        self.remap_fraction = 0.0
+        self.changed = False # probe owners are out of date
+        self.overflows = 0 # keys that had to skip their home server
+
+    def add(self, server):
+        """
+        Put a server on the ring
+        """
+        if server.server_id in self.servers:
+            return
+
+        self.servers[server.server_id] = server
+        with self.load_lock:
+            self.loads[server.server_id] = server.current_requests
+            self.total_load += server.current_requests
+        # sorted in on the next lookup, so adding many servers in a row sorts once
+        self.pending.extend((stable_hash(f"{server.server_id}#{i}"), server) for i in range(self.vnodes))
+        self.changed = True
+
+    def remove(self, server):
+        """
+        Take a server off the ring
+        """
+        if server.server_id not in self.servers:
+            return
+
+        self._sort_pending()
+        del self.servers[server.server_id]
+        with self.load_lock:
+            self.total_load -= self.loads.pop(server.server_id, 0)
+        kept = [(p, o) for p, o in zip(self.points, self.owners) if o.server_id != server.server_id]
+        self.points = [p for p, _ in kept]
+        self.owners = [o for _, o in kept]
+        self.changed = True
+
+    def _sort_pending(self):
+        """
+        Merge points added since the last lookup into the ring
+        """
+        if not self.pending:
+            return
+
+        ring = sorted(list(zip(self.points, self.owners)) + self.pending, key=itemgetter(0))
+        self.points = [p for p, _ in ring]
+        self.owners = [o for _, o in ring]
+        self.pending = []
+
+    def update(self, server):
+        """
+        A servers load changed, O(1)
+
+        Ignored for servers no longer on the ring, so a late update cant put one back
+        """
+        with self.load_lock:
+            old = self.loads.get(server.server_id)
+            if old is None:
+                return
+            current = server.current_requests
+            self.loads[server.server_id] = current
+            self.total_load += current - old
+
+    def home(self, key):
+        """
+        Server the key belongs to ignoring load, O(log n)
+        """
+        if self.pending:
+            self._sort_pending()
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, stable_hash(key)) % len(self.points)
+        return self.owners[index]
+
+    def lookup(self, key):
+        """
+        Server that should take the key, skipping full or overloaded ones
+
+        Returns None if no server on the ring can take it
+        """
+        if self.pending:
+            self._sort_pending()
+        if not self.points:
+            return None
+
+        # most requests one server may hold right now
+        limit = math.ceil((self.total_load + 1) / len(self.servers) * self.load_factor)
+
+        index = bisect.bisect(self.points, stable_hash(key)) % len(self.points)
+        tried = set()
+        for step in range(len(self.points)):
+            server = self.owners[(index + step) % len(self.points)]
+            if server.server_id in tried:
+                continue
+            tried.add(server.server_id)
+
+            if server.can_handle_request() and server.current_requests < limit:
+                if step:
+                    self.overflows += 1
+                return server
+
+            if len(tried) == len(self.servers):
+                break
+
+        return None
+
+    def _owner_of_hash(self, point):
+        """
+        Server id owning a hash, O(log n)
+        """
+        return self.owners[bisect.bisect(self.points, point) % len(self.points)].server_id
+
+    @property
+    def last_remap_fraction(self):
+        """
+        Fraction of keys that moved to a different server in the changes since this was last read
+        """
+        self._record_remap()
+        return self.remap_fraction
+
+    def _record_remap(self):
+        """
+        Work out what fraction of the probe keys moved to a different server
+
+        Done when asked for instead of on every change, a probe costs thousands of
+        binary searches and would make adding n servers O(n^2)
+        """
+        if not self.changed:
+            return
+        self.changed = False
+        self._sort_pending()
+
+        before = self.probe_owners
+        after = [self._owner_of_hash(point) for point in self.probe_hashes] if self.points else None
+        self.probe_owners = after
+
+        if before is None or after is None:
+            self.remap_fraction = 1.0 if before != after else 0.0
+            return
+
+        moved = sum(1 for old, new in zip(before, after) if old != new)
+        self.remap_fraction = moved / len(after)
+
+    def get_stats(self):
+        """
+        Remap fraction of the last change and how evenly load is spread
+        """
+
+        # share of the key space each server owns vs a perfect split
+        remap_fraction = self.last_remap_fraction
+        owned = {server_id: 0 for server_id in self.servers}
+        for server_id in self.probe_owners or []:
+            owned[server_id] += 1
+        ideal = len(self.probe_hashes) / max(1, len(self.servers))
+
+        # live load vs the average
+        with self.load_lock:
+            total_load = self.total_load
+            peak_load = max(self.loads.values(), default=0)
+        mean_load = total_load / max(1, len(self.servers))
+
+        return {
+            "servers": len(self.servers),
+            "vnodes": self.vnodes,
+            "last_remap_fraction": remap_fraction,
+            "key_imbalance": max(owned.values(), default=0) / max(1, ideal),
+            "load_imbalance": peak_load / mean_load if mean_load else 0.0,
+            "overflows": self.overflows
+        }
@@ -1,8 +1,11 @@
 import time
+import asyncio
 from datetime import datetime
+from .timeseries import sparkline
+from .server import ServerStatus
 
 class Dashboard:
-    def __init__(self, load_balancer, traffic_generator=None, auto_scaler=None):
+    def __init__(self, load_balancer=None, traffic_generator=None, auto_scaler=None, metrics=None, history=None):
         """
         Dashboard to show real time monitoring of the system
 
@@ -10,11 +13,16 @@ class Dashboard:
             load_balancer: Instance of load balancer to monitor
             traffic_generator: TrafficGenerator instance
             auto_scaler: AutoScaler instance
+            metrics: MetricsReader to show instead of load_balancer, so the dashboard can run in another process
+            history: MetricsHistory to draw trends from
         """
 
         self.load_balancer = load_balancer
         self.traffic_generator = traffic_generator
         self.auto_scaler = auto_scaler
+        self.metrics = metrics
+        self.history = history
+        self.trend_width = 40 # samples shown in each trend line
     
     def display_stats(self):
         """
@@ -29,20 +37,48 @@ class Dashboard:
 
 
         # Load Balancer Stats
-        lb_stats = self.load_balancer.get_stats()
+        if self.metrics:
+            lb_stats = self.metrics.get_stats()
+            algorithm = self.metrics.algorithm
+            server_stats = self.metrics.server_stats(lb_stats["published_servers"])
+        else:
+            lb_stats = self.load_balancer.get_stats()
+            algorithm = self.load_balancer.rounting_algo.value
+            server_stats = [server.get_stats() for server in self.load_balancer.servers]
+
         print(f"\nLOAD BALANCER: ")
-        print(f" Algorithm: {self.load_balancer.rounting_algo.value}")
-        print(f" Servers: {lb_stats['total_servers']} active")
+        if self.metrics:
+            age = self.metrics.age()
+            print(f" Published: {f'{age:.1f}s ago' if age is not None else 'not yet'} from {self.metrics.path}")
+        print(f" Algorithm: {algorithm}")
+        print(f" Servers: {lb_stats['total_servers']} active, {lb_stats['healthy_servers']} healthy, {lb_stats['draining_servers']} draining")
         print(f" Success Rate: {lb_stats['success_rate']:.1f}%")
         print(f" System Load: {lb_stats['current_load']}/{lb_stats['total_capacity']} ({lb_stats['util']:.1f}%)")
+        print(f" Latency: p50 {lb_stats['p50_latency'] * 1000:.0f}ms, p95 {lb_stats['p95_latency'] * 1000:.0f}ms, p99 {lb_stats['p99_latency'] * 1000:.0f}ms")
+        print(f" Queue Wait p99: {lb_stats['p99_queue_wait'] * 1000:.1f}ms, Service p99: {lb_stats['p99_service_time'] * 1000:.0f}ms")
+        if "retries" in lb_stats:
+            print(f" Resilience: {lb_stats['retries']} retries, {lb_stats['hedges']} hedges ({lb_stats['hedges_won']} won), "
+                  f"{lb_stats['retry_budget_denied']} over budget")
+        print(f" Waiting: {lb_stats['queue_depth']}/{lb_stats['queue_capacity']} (peak {lb_stats['peak_queue_depth']}), {lb_stats['shed']} shed, {lb_stats['timed_out']} timed out")
+
+        # Trends
+        if self.history:
+            self._display_trends()
 
 
         # Server details
         print(f"\n Servers:")
-        for i, server in enumerate(self.load_balancer.servers, 1):
-            stats = server.get_stats()
-            status_icon = "ONLINE ●" if stats["status"] == "healthy" else "OFFLINE ○"
-            print(f" {i}. {server.server_id}: {stats['current_requests']}/{server.max_capacity} ({stats['util']:.0f}%) {status_icon}")
+        for i, stats in enumerate(server_stats, 1):
+            if stats["status"] == ServerStatus.HEALTHY.value:
+                status_icon = "ONLINE ●"
+            elif stats["status"] == ServerStatus.OVERLOADED.value:
+                status_icon = "BUSY ◐"
+            elif stats["status"] == ServerStatus.DRAINING.value:
+                status_icon = "DRAINING ◌"
+            else:
+                status_icon = "OFFLINE ○"
+            trend = f" {sparkline(self.history.server_trend(stats['server_id'], last=20), width=20, low=0, high=100)}" if self.history else ""
+            print(f" {i}. {stats['server_id']}: {stats['current_requests']}/{stats['max_capacity']} ({stats['util']:.0f}%) p99 {stats['p99_latency'] * 1000:.0f}ms {status_icon}{trend}")
 
         # Traffic Generator Stats
         if self.traffic_generator:
@@ -50,6 +86,7 @@ class Dashboard:
             print(f"\n Traffic Generator: ")
             print(f" Pattern: {traffic_stats['pattern']}")
             print(f" Requests Sent: {traffic_stats['total_requests_sent']}")
+            print(f" Held Back: {traffic_stats['requests_deferred']} waiting, {traffic_stats['requests_given_up']} given up, backed off {traffic_stats['backoffs']} times")
             print(f" Status:" " RUNNING ●" if traffic_stats['is_running'] else "STOPPED ○")
 
         if self.auto_scaler:
@@ -57,10 +94,36 @@ class Dashboard:
             print(f" Min Servers: {self.auto_scaler.min_servers}")
             print(f" Maximum Servers: {self.auto_scaler.max_servers}")
             print(f" Status: {'Active' if self.auto_scaler.is_running else 'Inactive'}")
+            print(f" Policy: {self.auto_scaler.policy.mode.value}, wants {self.auto_scaler.policy.get_stats().get('desired', '-')} servers")
+            signals = self.load_balancer.triggers.get_stats()["active_signals"]
+            print(f" Signals: {', '.join(signals) or 'none'} ({self.auto_scaler.checks} checks, {self.auto_scaler.signals_heard} signals heard)")
+            if self.auto_scaler.provisioner:
+                provisioning = self.auto_scaler.provisioner.get_stats()
+                print(f" Provisioning: {provisioning['standby_ready']} standby, {provisioning['booting']} booting, {provisioning['warming']} warming up "
+                      f"({provisioning['promotions']} promoted, {provisioning['cold_starts']} cold starts)")
+                print(f" Time to Capacity: p50 {provisioning['p50_time_to_capacity']:.1f}s, p99 {provisioning['p99_time_to_capacity']:.1f}s")
 
         print("\n")
         print("=============================================================================================")
 
+    def _display_trends(self):
+        """
+        Sparklines of the last trend_width samples with the latest value and peak
+        """
+        summary = self.history.summary()
+        print(f"\n Trends (last {self.trend_width} samples):")
+
+        # label, metric, fixed scale, how to show a value
+        for label, metric, scale, show in (
+            ("Util", "util", (0, 100), lambda v: f"{v:.0f}%"),
+            ("Requests", "request_rate", (0, None), lambda v: f"{v:.1f}/s"),
+            ("Servers", "total_servers", (0, None), lambda v: f"{v:.0f}"),
+            ("Waiting", "queue_depth", (0, None), lambda v: f"{v:.0f}"),
+            ("p99", "p99_latency", (0, None), lambda v: f"{v * 1000:.0f}ms")
+        ):
+            line = sparkline(self.history.trend(metric, last=self.trend_width), self.trend_width, *scale)
+            print(f" {label:<9}{line:<{self.trend_width}} {show(summary[metric]['last'])} now, peak {show(summary[metric]['peak'])}")
+
     def start_live_monitoring(self, refresh_interval=3):
         """
         Starts live dashboard and refreshes automatically 
@@ -74,6 +137,21 @@ class Dashboard:
                 time.sleep(refresh_interval)
         except KeyboardInterrupt:
             print("\nDashboard Ended")
+
+    async def start_live_monitoring_async(self, refresh_interval=3):
+        """
+        Same as start_live_monitoring but runs as a task on the event loop
+        """
+
+        print("Live Dashboard")
+
+        try:
+            while True:
+                self.display_stats()
+                await asyncio.sleep(refresh_interval)
+        except asyncio.CancelledError:
+            print("\nDashboard Ended")
+            raise
     
 if __name__ == "__main__":
     from load_balancer import LoadBalancer, RoutingAlgo
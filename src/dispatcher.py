@@ -0,0 +1,300 @@
+import time
+import threading
+import queue
+from enum import Enum
+
+class DispatchMode(Enum):
+    THREAD_PER_REQUEST = "thread_per_request" # new thread for every request (original behaviour)
+    SHARED_POOL = "shared_pool" # fixed set of workers shared by all servers
+    PER_SERVER_POOL = "per_server_pool" # each server gets its own queue and workers
+    ASYNC_TASKS = "async_tasks" # one asyncio task per request, see async_engine
+    SIMULATED = "simulated" # completions scheduled on a virtual clock, see simulation
+    INLINE = "inline" # request runs on the routing thread, for measuring routing on its own
+
+
+class ThreadPerRequestDispatcher:
+    def __init__(self):
+        """
+        Starts a new thread for every request routed to a server
+
+        Kept so it can be compared against the worker pools
+        """
+
+        self.mode = DispatchMode.THREAD_PER_REQUEST
+        self.submitted = 0
+        self.threads_created = 0
+        self.lock = threading.Lock()
+
+    def attach(self, server):
+        """
+        Nothing to set up per server
+        """
+        pass
+
+    def detach(self, server):
+        """
+        Nothing to tear down per server
+        """
+        pass
+
+    def submit(self, server, request_id, queue_wait=0.0):
+        """
+        Process the request on a brand new thread
+
+        The load balancer has already reserved the slot, queue_wait is how long the
+        request waited in the admission queue before that
+        """
+        with self.lock:
+            self.submitted += 1
+            self.threads_created += 1
+
+        request_thread = threading.Thread(target=self._run, args=(server, request_id, time.perf_counter() - queue_wait), daemon=True)
+        request_thread.start()
+
+    def _run(self, server, request_id, submitted_at):
+        """
+        Thread body, the wait is how long the thread took to start
+        """
+        server.process_request(request_id, time.perf_counter() - submitted_at, reserved=True)
+
+    def shutdown(self):
+        """
+        Threads finish on their own, nothing to stop
+        """
+        pass
+
+    def get_stats(self):
+        """
+        Get dispatcher stats
+        """
+        with self.lock:
+            return {
+                "mode": self.mode.value,
+                "workers": threading.active_count(),
+                "submitted": self.submitted,
+                "threads_created": self.threads_created,
+                "queue_depth": 0,
+                "peak_queue_depth": 0
+            }
+
+
+class InlineDispatcher:
+    def __init__(self):
+        """
+        Processes the request right away on the thread that routed it
+
+        Routing blocks for the whole service time, so this is only useful with
+        servers that take no time, to measure routing without dispatch costs
+        """
+
+        self.mode = DispatchMode.INLINE
+        self.submitted = 0
+
+    def attach(self, server):
+        """
+        Nothing to set up per server
+        """
+        pass
+
+    def detach(self, server):
+        """
+        Nothing to tear down per server
+        """
+        pass
+
+    def submit(self, server, request_id, queue_wait=0.0):
+        """
+        Process the request now, the load balancer has already reserved the slot
+        """
+        self.submitted += 1
+        server.process_request(request_id, queue_wait, reserved=True)
+
+    def shutdown(self):
+        """
+        Nothing to stop
+        """
+        pass
+
+    def get_stats(self):
+        """
+        Get dispatcher stats
+        """
+        return {
+            "mode": self.mode.value,
+            "workers": 0,
+            "submitted": self.submitted,
+            "threads_created": 0,
+            "queue_depth": 0,
+            "peak_queue_depth": 0
+        }
+
+
+class WorkerPoolDispatcher:
+    def __init__(self, workers=8, per_server=False, workers_per_server=None):
+        """
+        Hands requests to a bounded set of long lived worker threads through queues
+
+        Arguments:
+            workers: Size of the shared pool (ignored when per_server is True)
+            per_server: Give every server its own queue and workers instead of one shared pool
+            workers_per_server: Workers for each server, defaults to the servers max_capacity
+        """
+
+        self.mode = DispatchMode.PER_SERVER_POOL if per_server else DispatchMode.SHARED_POOL
+        self.workers = workers
+        self.per_server = per_server
+        self.workers_per_server = workers_per_server
+
+        self.submitted = 0
+        self.threads_created = 0
+        self.peak_queue_depth = 0
+        self.lock = threading.Lock()
+
+        self.shared_queue = None
+        self.shared_threads = []
+        self.server_queues = {} # server_id -> (queue, threads)
+
+        if not per_server:
+            self.shared_queue = queue.SimpleQueue()
+            self.shared_threads = self._start_workers(self.shared_queue, workers, "shared")
+
+    def _start_workers(self, work_queue, count, name):
+        """
+        Start count workers pulling from work_queue
+        """
+        threads = []
+        for i in range(count):
+            worker = threading.Thread(target=self._worker, args=(work_queue,), name=f"dispatch-{name}-{i+1}", daemon=True)
+            worker.start()
+            threads.append(worker)
+
+        with self.lock:
+            self.threads_created += count
+        return threads
+
+    def _worker(self, work_queue):
+        """
+        Worker loop, runs until it gets the None sentinel
+        """
+        while True:
+            item = work_queue.get()
+            if item is None:
+                return
+
+            server, request_id, submitted_at = item
+            server.process_request(request_id, time.perf_counter() - submitted_at, reserved=True)
+
+    def attach(self, server):
+        """
+        Give a newly added server its own workers (per server mode only)
+        """
+        if not self.per_server:
+            return
+
+        with self.lock:
+            if server.server_id in self.server_queues:
+                return
+
+        count = self.workers_per_server or server.max_capacity
+        work_queue = queue.SimpleQueue()
+        threads = self._start_workers(work_queue, count, server.server_id)
+
+        with self.lock:
+            self.server_queues[server.server_id] = (work_queue, threads)
+
+    def detach(self, server):
+        """
+        Stop the workers of a removed server once its queued requests are done
+        """
+        if not self.per_server:
+            return
+
+        with self.lock:
+            entry = self.server_queues.pop(server.server_id, None)
+
+        if entry:
+            work_queue, threads = entry
+            for _ in threads:
+                work_queue.put(None)
+
+    def submit(self, server, request_id, queue_wait=0.0):
+        """
+        Queue the request for a worker, no thread is created here
+
+        The load balancer has already reserved the slot, queue_wait is how long the
+        request waited in the admission queue before that
+        """
+        with self.lock:
+            self.submitted += 1
+
+            if self.per_server:
+                entry = self.server_queues.get(server.server_id)
+                work_queue = entry[0] if entry else None
+            else:
+                work_queue = self.shared_queue
+
+        if work_queue is None:
+            # server was never attached, attach it now
+            self.attach(server)
+            work_queue = self.server_queues[server.server_id][0]
+
+        work_queue.put((server, request_id, time.perf_counter() - queue_wait))
+
+        depth = work_queue.qsize()
+        if depth > self.peak_queue_depth:
+            self.peak_queue_depth = depth
+
+    def shutdown(self):
+        """
+        Stop every worker after the requests already queued are processed
+        """
+        if self.per_server:
+            with self.lock:
+                entries = list(self.server_queues.values())
+                self.server_queues = {}
+        else:
+            entries = [(self.shared_queue, self.shared_threads)]
+
+        for work_queue, threads in entries:
+            for _ in threads:
+                work_queue.put(None)
+
+        for _, threads in entries:
+            for worker in threads:
+                worker.join()
+
+    def get_stats(self):
+        """
+        Get dispatcher stats
+        """
+        with self.lock:
+            if self.per_server:
+                workers = sum(len(threads) for _, threads in self.server_queues.values())
+                depth = sum(q.qsize() for q, _ in self.server_queues.values())
+            else:
+                workers = len(self.shared_threads)
+                depth = self.shared_queue.qsize()
+
+            return {
+                "mode": self.mode.value,
+                "workers": workers,
+                "submitted": self.submitted,
+                "threads_created": self.threads_created,
+                "queue_depth": depth,
+                "peak_queue_depth": self.peak_queue_depth
+            }
+
+
+def create_dispatcher(mode=DispatchMode.SHARED_POOL, workers=8, workers_per_server=None):
+    """
+    Build a dispatcher for the given mode
+    """
+
+    if mode == DispatchMode.THREAD_PER_REQUEST:
+        return ThreadPerRequestDispatcher()
+    elif mode == DispatchMode.INLINE:
+        return InlineDispatcher()
+    elif mode == DispatchMode.PER_SERVER_POOL:
+        return WorkerPoolDispatcher(per_server=True, workers_per_server=workers_per_server)
+    else:
+        return WorkerPoolDispatcher(workers=workers)
@@ -0,0 +1,229 @@
+import sys
+import json
+import time
+import atexit
+import threading
+from enum import IntEnum
+from collections import deque
+from contextlib import contextmanager
+
+class LogLevel(IntEnum):
+    DEBUG = 10 # every request (routing, processing, completed)
+    INFO = 20 # things worth seeing while it runs (servers added, scaling, spikes)
+    WARNING = 30
+    ERROR = 40
+    OFF = 100
+
+
+class EventLog:
+    def __init__(self, level=LogLevel.INFO, stream=None, jsonl_path=None, jsonl_level=LogLevel.DEBUG,
+                 batch_size=512, flush_interval=0.1, max_pending=100000):
+        """
+        Structured event log with levels and a background writer
+
+        Logging an event only checks the level and appends a tuple to a queue, the
+        message is formatted and written later by a writer thread in batches, so the
+        request path never waits on stdout. Events below the level cost one compare.
+
+        Arguments:
+            level: Lowest level written to the console
+            stream: Where console lines go, defaults to whatever sys.stdout is at write time
+            jsonl_path: Also write every event as a JSON line here for later analysis
+            jsonl_level: Lowest level written to the JSON lines file
+            batch_size: Wake the writer early once this many events are waiting
+            flush_interval: Seconds between writes when it is quiet
+            max_pending: Events waiting past this are dropped and counted instead of using more memory
+        """
+
+        self.stream = stream
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self.pending = deque() # (time, level, event, message, fields), append and popleft are thread safe
+        self.dropped = 0
+        self.written = 0
+
+        self.wake = threading.Event()
+        self.write_lock = threading.Lock()
+        self.writer_thread = None
+        self.start_lock = threading.Lock()
+
+        self.jsonl_file = None
+        self.jsonl_level = jsonl_level
+        self.level = level
+        self.set_level(level)
+        if jsonl_path:
+            self.open_jsonl(jsonl_path, jsonl_level)
+
+    def set_level(self, level):
+        """
+        Change the console level
+        """
+        self.level = LogLevel(level)
+        self._update_threshold()
+
+    def open_jsonl(self, path, level=LogLevel.DEBUG):
+        """
+        Start writing events to a JSON lines file
+        """
+        with self.write_lock:
+            if self.jsonl_file:
+                self.jsonl_file.close()
+            self.jsonl_file = open(path, "a")
+            self.jsonl_level = LogLevel(level)
+        self._update_threshold()
+
+    def _update_threshold(self):
+        """
+        Lowest level anything will be written at, events below it are skipped right away
+        """
+        threshold = self.level
+        if self.jsonl_file:
+            threshold = min(threshold, self.jsonl_level)
+        self.threshold = threshold
+
+        # plain bool so the hottest paths can skip building the event at all
+        self.debug_enabled = threshold <= LogLevel.DEBUG
+
+    def enabled(self, level):
+        """
+        Would an event at this level be written anywhere
+        """
+        return level >= self.threshold
+
+    def log(self, level, event, message, **fields):
+        """
+        Queue an event, the message is a format string filled in from fields by the writer
+        """
+        if level < self.threshold:
+            return
+
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return
+
+        self.pending.append((time.time(), level, event, message, fields))
+
+        if self.writer_thread is None:
+            self._start_writer()
+        if len(self.pending) >= self.batch_size:
+            self.wake.set()
+
+    def debug(self, event, message, **fields):
+        self.log(LogLevel.DEBUG, event, message, **fields)
+
+    def info(self, event, message, **fields):
+        self.log(LogLevel.INFO, event, message, **fields)
+
+    def warning(self, event, message, **fields):
+        self.log(LogLevel.WARNING, event, message, **fields)
+
+    def error(self, event, message, **fields):
+        self.log(LogLevel.ERROR, event, message, **fields)
+
+    def _start_writer(self):
+        """
+        Start the background writer the first time something is logged
+        """
+        with self.start_lock:
+            if self.writer_thread is None:
+                self.writer_thread = threading.Thread(target=self._writer, name="event-log-writer", daemon=True)
+                self.writer_thread.start()
+
+    def _writer(self):
+        """
+        Writes whatever is waiting every flush_interval, or sooner when a batch fills up
+        """
+        while True:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Write everything waiting right now
+        """
+        with self.write_lock:
+            console = []
+            jsonl = []
+            while self.pending:
+                stamp, level, event, message, fields = self.pending.popleft()
+
+                if level >= self.level:
+                    try:
+                        console.append(message.format(**fields))
+                    except (KeyError, IndexError, ValueError):
+                        console.append(message)
+
+                if self.jsonl_file and level >= self.jsonl_level:
+                    record = {"ts": round(stamp, 6), "level": level.name, "event": event}
+                    record.update(fields)
+                    jsonl.append(json.dumps(record, default=str))
+
+            if console:
+                stream = self.stream or sys.stdout
+                try:
+                    stream.write("\n".join(console) + "\n")
+                    stream.flush()
+                except (ValueError, OSError):
+                    pass # stream closed, usually during shutdown
+
+            if jsonl:
+                self.jsonl_file.write("\n".join(jsonl) + "\n")
+                self.jsonl_file.flush()
+
+            self.written += len(console) + len(jsonl)
+
+    def close(self):
+        """
+        Write what is left and close the JSON lines file
+        """
+        self.flush()
+        with self.write_lock:
+            if self.jsonl_file:
+                self.jsonl_file.close()
+                self.jsonl_file = None
+        self._update_threshold()
+
+    def get_stats(self):
+        """
+        Get event log stats
+        """
+        return {
+            "level": self.level.name,
+            "pending": len(self.pending),
+            "written": self.written,
+            "dropped": self.dropped,
+            "jsonl": self.jsonl_file.name if self.jsonl_file else None
+        }
+
+
+# one shared log for the whole system
+events = EventLog()
+atexit.register(events.close)
+
+
+def configure(level=None, jsonl_path=None, jsonl_level=LogLevel.DEBUG):
+    """
+    Set up the shared event log
+    """
+    if level is not None:
+        events.set_level(level)
+    if jsonl_path:
+        events.open_jsonl(jsonl_path, jsonl_level)
+
+
+@contextmanager
+def quiet(level=LogLevel.WARNING):
+    """
+    Only log at level and above inside the block, for simulations and benchmarks
+    """
+    events.flush()
+    old_level = events.level
+    events.set_level(level)
+    try:
+        yield
+    finally:
+        events.flush()
+        events.set_level(old_level)
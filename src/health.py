@@ -0,0 +1,316 @@
+import time
+import bisect
+import threading
+from enum import Enum
+from .server import ServerStatus
+from .event_log import events
+
+class BreakerState(Enum):
+    CLOSED = "closed" # taking traffic
+    OPEN = "open" # ejected, no traffic until the ejection ends
+    HALF_OPEN = "half_open" # back on trial, the next judged window decides
+
+
+class ServerHealth:
+    def __init__(self, server, now):
+        """
+        What the health checker knows about one server, works like a circuit breaker
+        """
+
+        self.server = server
+        self.state = BreakerState.CLOSED
+        self.ejections = 0 # recent ejections, each one doubles the next ejection time
+        self.ejected_until = None
+        self.reason = None
+        self.changed_at = now
+        self.probe_failures = 0
+        self.judged = False # the window was judged in the current check
+
+        # the passive window, counters as they were when it started
+        self.window_count = 0
+        self.window_total = 0
+        self.window_errors = 0
+        self.mean_service = None # mean service time of the last judged window, in seconds
+        self.error_fraction = 0.0
+        self._start_window()
+
+    def _start_window(self):
+        service = self.server.timings.service
+        self.window_count = service.count
+        self.window_total = service.total
+        self.window_errors = self.server.errors
+
+    def window_requests(self):
+        return self.server.timings.service.count - self.window_count
+
+    def judge_window(self):
+        """
+        Close the window, keeping its mean service time and error fraction
+        """
+        service = self.server.timings.service
+        count = service.count - self.window_count
+        self.mean_service = (service.total - self.window_total) / count / 1_000_000
+        self.error_fraction = (self.server.errors - self.window_errors) / count
+        self._start_window()
+
+
+def _median_without(values, index):
+    """
+    Median of sorted values leaving out the one at index, O(1)
+    """
+    count = len(values) - 1
+    if count <= 0:
+        return None
+
+    def at(i):
+        return values[i] if i < index else values[i + 1]
+
+    middle = count // 2
+    if count % 2:
+        return at(middle)
+    return (at(middle - 1) + at(middle)) / 2
+
+
+class HealthChecker:
+    def __init__(self, load_balancer, interval=1.0, clock=time.perf_counter, probe=None, min_requests=5,
+                 error_threshold=0.5, consecutive_errors=5, latency_factor=3.0, probe_failures=2,
+                 base_ejection=10.0, max_ejection=300.0, max_ejected_percent=50, trial_slots=1, trial_requests=1):
+        """
+        Finds failing or slow servers and takes them out of routing for a while
+
+        Every interval it looks at each server two ways:
+            passive: mean service time and error fraction over the requests finished
+                since the last judgement (once there are min_requests of them)
+            active: probe(server), a health check that works without traffic
+
+        A server is ejected when its errors pass error_threshold or consecutive_errors,
+        when its mean service time is latency_factor times the median of the other
+        servers, or when probe_failures probes in a row fail. Ejecting sets the server
+        DOWN, every routing algorithm already skips servers that cant take requests, so
+        skipping ejected ones costs routing nothing extra.
+
+        Ejection lasts base_ejection seconds doubled for every recent ejection, up to
+        max_ejection. When it ends the server is probed and, if it answers, let back
+        in half open with only trial_slots slots: once trial_requests have finished
+        they close the breaker or eject it again for longer. Every base_ejection
+        seconds healthy forgives one past ejection.
+        No more than max_ejected_percent of the servers are ever ejected at once.
+
+        Arguments:
+            load_balancer: LoadBalancer whose servers are checked
+            interval: Seconds between checks
+            clock: Function returning the time in seconds, the simulation passes its virtual clock
+            probe: Function taking a server and returning True if it is up, defaults to Server.probe
+            min_requests: Finished requests needed before a servers window is judged
+            error_threshold: Error fraction over a window that ejects
+            consecutive_errors: Errors in a row that eject
+            latency_factor: How many times slower than the other servers ejects
+            probe_failures: Failed probes in a row that eject
+            base_ejection: Seconds the first ejection lasts
+            max_ejection: Longest an ejection lasts
+            max_ejected_percent: Most of the servers that may be ejected at once
+            trial_slots: Requests a half open server may take at once
+            trial_requests: Finished requests that decide a half open trial
+        """
+
+        self.load_balancer = load_balancer
+        self.interval = interval
+        self.clock = clock
+        self.probe = probe or (lambda server: server.probe())
+        self.min_requests = min_requests
+        self.error_threshold = error_threshold
+        self.consecutive_errors = consecutive_errors
+        self.latency_factor = latency_factor
+        self.probe_failures = probe_failures
+        self.base_ejection = base_ejection
+        self.max_ejection = max_ejection
+        self.max_ejected_percent = max_ejected_percent
+        self.trial_slots = trial_slots
+        self.trial_requests = trial_requests
+
+        self.records = {} # server_id -> ServerHealth
+        self.checks = 0
+        self.total_ejections = 0
+        self.recoveries = 0
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Check every interval on a background thread
+        """
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        events.info("health_started", "Health checks every {interval}s", interval=self.interval)
+
+    def stop(self):
+        """
+        Stop checking, ejected servers stay ejected
+        """
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """
+        One round of checks over every server
+        """
+
+        self.checks += 1
+        now = self.clock()
+        servers = list(self.load_balancer.servers)
+
+        for server in servers:
+            if server.server_id not in self.records:
+                self.records[server.server_id] = ServerHealth(server, now)
+        if len(self.records) > len(servers):
+            current = {server.server_id for server in servers}
+            for server_id in [s for s in self.records if s not in current]:
+                del self.records[server_id]
+
+        # judge every window that has enough requests in it
+        for record in self.records.values():
+            needed = self.trial_requests if record.state == BreakerState.HALF_OPEN else self.min_requests
+            if record.state != BreakerState.OPEN and record.window_requests() >= needed:
+                record.judge_window()
+                record.judged = True
+            else:
+                record.judged = False
+
+        # the latency baseline is the other servers, so one slow server cant drag it up
+        means = sorted(r.mean_service for r in self.records.values()
+                       if r.state == BreakerState.CLOSED and r.mean_service is not None)
+
+        for record in list(self.records.values()):
+            if record.server.status == ServerStatus.DRAINING:
+                continue # on its way out, leave it alone
+
+            if record.state == BreakerState.OPEN:
+                if now >= record.ejected_until:
+                    self._try_recover(record, now)
+                continue
+
+            reason = self._probe(record) or self._passive_reason(record, means)
+            if reason:
+                self._eject(record, reason, now)
+            elif record.state == BreakerState.HALF_OPEN and record.judged:
+                self._close(record, now)
+            elif record.state == BreakerState.CLOSED and record.ejections and now - record.changed_at >= self.base_ejection:
+                record.ejections -= 1
+                record.changed_at = now
+
+    def _probe(self, record):
+        """
+        Run the active check, returns a reason once enough probes in a row failed
+        """
+        if self.probe(record.server):
+            record.probe_failures = 0
+            return None
+
+        record.probe_failures += 1
+        if record.probe_failures >= self.probe_failures:
+            return f"{record.probe_failures} failed probes"
+        return None
+
+    def _passive_reason(self, record, means):
+        """
+        Why the servers own requests say it should be ejected, or None
+        """
+        server = record.server
+        if server.consecutive_errors >= self.consecutive_errors:
+            return f"{server.consecutive_errors} errors in a row"
+
+        if not record.judged:
+            return None
+
+        if record.error_fraction >= self.error_threshold:
+            return f"{record.error_fraction * 100:.0f}% errors"
+
+        if record.state == BreakerState.CLOSED:
+            index = bisect.bisect_left(means, record.mean_service)
+            baseline = _median_without(means, index)
+        else:
+            baseline = means[len(means) // 2] if means else None
+
+        if baseline and record.mean_service > baseline * self.latency_factor:
+            return f"{record.mean_service * 1000:.0f}ms mean against {baseline * 1000:.0f}ms"
+        return None
+
+    def _eject(self, record, reason, now):
+        """
+        Take the server out of routing, unless too many already are
+        """
+        if record.state != BreakerState.OPEN:
+            ejected = sum(1 for r in self.records.values() if r.state == BreakerState.OPEN)
+            if (ejected + 1) * 100 > len(self.records) * self.max_ejected_percent:
+                return
+
+        duration = min(self.max_ejection, self.base_ejection * 2 ** record.ejections)
+        record.ejections += 1
+        record.state = BreakerState.OPEN
+        record.ejected_until = now + duration
+        record.reason = reason
+        record.changed_at = now
+        self.total_ejections += 1
+
+        # ends a trial of ours, a warm-up limit is left to the provisioner
+        record.server.limit_slots(None, owner=self)
+        record.server.set_status(ServerStatus.DOWN)
+        events.info("server_ejected", "Ejected {server_id} for {duration:.0f}s: {reason}",
+                    server_id=record.server.server_id, duration=duration, reason=reason)
+
+    def _try_recover(self, record, now):
+        """
+        Ejection is over, let the server back on trial if it answers a probe
+        """
+        if not self.probe(record.server):
+            # still down, stay ejected for longer
+            self._eject(record, "failed probe after ejection", now)
+            return
+
+        record.state = BreakerState.HALF_OPEN
+        record.probe_failures = 0
+        record.server.consecutive_errors = 0
+        record.changed_at = now
+        record._start_window()
+
+        # a server still warming up is already on a trickle, its warm-up limit stands in for the trial
+        record.server.limit_slots(self.trial_slots, owner=self)
+        record.server.set_status(ServerStatus.HEALTHY)
+        events.info("server_half_open", "{server_id} back on trial after ejection", server_id=record.server.server_id)
+
+    def _close(self, record, now):
+        """
+        The trial went well, the server is fully back
+        """
+        record.state = BreakerState.CLOSED
+        record.reason = None
+        record.changed_at = now
+        record.server.limit_slots(None, owner=self)
+        self.recoveries += 1
+        events.info("server_recovered", "{server_id} recovered", server_id=record.server.server_id)
+
+    def state_of(self, server_id):
+        """
+        Breaker state of a server, CLOSED for ones not checked yet
+        """
+        record = self.records.get(server_id)
+        return record.state if record else BreakerState.CLOSED
+
+    def get_stats(self):
+        """
+        Get health checker stats
+        """
+        return {
+            "checks": self.checks,
+            "ejected": sum(1 for r in self.records.values() if r.state == BreakerState.OPEN),
+            "half_open": sum(1 for r in self.records.values() if r.state == BreakerState.HALF_OPEN),
+            "total_ejections": self.total_ejections,
+            "recoveries": self.recoveries
+        }
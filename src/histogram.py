@@ -0,0 +1,196 @@
+import threading
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+class LatencyHistogram:
+    def __init__(self, sub_bucket_bits=6, max_seconds=3600):
+        """
+        Fixed size log bucketed histogram of latencies, like HdrHistogram
+
+        Values are kept in microseconds. Below 2^sub_bucket_bits us every value gets its
+        own bucket, above that each power of two is split into 2^(sub_bucket_bits-1)
+        buckets, so every value is within about 3% of its real size with the default
+        bits. Memory is fixed (under 1000 counters up to an hour), recording is O(1)
+        and two histograms with the same settings can be merged by adding counters.
+
+        Arguments:
+            sub_bucket_bits: Precision, 6 gives roughly 3% relative error
+            max_seconds: Largest value tracked, anything bigger lands in the last bucket
+        """
+
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.sub_bucket_half = self.sub_bucket_count >> 1
+        self.max_value = int(max_seconds * 1_000_000)
+
+        self.bucket_total = self._index(self.max_value) + 1
+        self.counts = array("q", [0]) * self.bucket_total
+
+        self.count = 0
+        self.total = 0 # sum of values in us, for the mean
+        self.min_value = None
+        self.max_seen = 0
+        self.cached = None # (count, wanted, results) from the last percentiles call
+        self.lock = threading.Lock()
+
+    def _index(self, value):
+        """
+        Bucket for a value in microseconds, O(1)
+        """
+        if value < self.sub_bucket_count:
+            return value
+
+        shift = value.bit_length() - self.sub_bucket_bits
+        top = value >> shift # always between sub_bucket_half and sub_bucket_count
+        return self.sub_bucket_count + (shift - 1) * self.sub_bucket_half + (top - self.sub_bucket_half)
+
+    def _value_at(self, index):
+        """
+        Middle of the range a bucket covers, in microseconds
+        """
+        if index < self.sub_bucket_count:
+            return index
+
+        shift = (index - self.sub_bucket_count) // self.sub_bucket_half + 1
+        top = (index - self.sub_bucket_count) % self.sub_bucket_half + self.sub_bucket_half
+        low = top << shift
+        return low + ((1 << shift) - 1) / 2
+
+    def record(self, seconds):
+        """
+        Add one latency, O(1)
+        """
+        value = min(max(0, int(seconds * 1_000_000)), self.max_value)
+        index = self._index(value)
+
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if self.min_value is None or value < self.min_value:
+                self.min_value = value
+            if value > self.max_seen:
+                self.max_seen = value
+
+    def merge(self, other):
+        """
+        Add another histograms counts into this one
+        """
+        if other.bucket_total != self.bucket_total or other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError("Can only merge histograms with the same settings")
+
+        with other.lock:
+            counts = array("q", other.counts)
+            count, total, min_value, max_seen = other.count, other.total, other.min_value, other.max_seen
+
+        with self.lock:
+            for i, c in enumerate(counts):
+                if c:
+                    self.counts[i] += c
+            self.count += count
+            self.total += total
+            if min_value is not None and (self.min_value is None or min_value < self.min_value):
+                self.min_value = min_value
+            self.max_seen = max(self.max_seen, max_seen)
+
+    def percentiles(self, wanted=(50, 95, 99)):
+        """
+        Several percentiles in seconds
+
+        A running total of the buckets (built in C by accumulate) is binary searched
+        for each percentile, so this stays cheap enough to call every sample
+        """
+        with self.lock:
+            if not self.count:
+                return {p: 0.0 for p in wanted}
+
+            # nothing recorded since last time, same answer
+            if self.cached and self.cached[0] == self.count and self.cached[1] == wanted:
+                return dict(self.cached[2])
+
+            # buckets past the largest value seen are all empty
+            running = list(accumulate(self.counts[:self._index(self.max_seen) + 1]))
+            results = {}
+            for p in wanted:
+                target = max(1, int(self.count * p / 100 + 0.5))
+                index = bisect_left(running, target)
+                # never report past what was actually recorded
+                results[p] = min(self._value_at(index), self.max_seen) / 1_000_000
+
+            self.cached = (self.count, wanted, results)
+            return dict(results)
+
+    def percentile(self, p):
+        """
+        One percentile in seconds
+        """
+        return self.percentiles((p,))[p]
+
+    def mean(self):
+        """
+        Average in seconds
+        """
+        with self.lock:
+            return self.total / self.count / 1_000_000 if self.count else 0.0
+
+    def reset(self):
+        """
+        Clear everything
+        """
+        with self.lock:
+            self.counts = array("q", [0]) * self.bucket_total
+            self.count = 0
+            self.total = 0
+            self.min_value = None
+            self.max_seen = 0
+            self.cached = None
+
+
+class RequestTimings:
+    def __init__(self, parent=None):
+        """
+        Queue wait, service time and end to end time histograms for a server or the cluster
+
+        Arguments:
+            parent: Another RequestTimings that every recording is also added to (the load balancers)
+        """
+
+        self.queue = LatencyHistogram()
+        self.service = LatencyHistogram()
+        self.total = LatencyHistogram()
+        self.parent = parent
+
+    def record(self, queue_wait, service_time):
+        """
+        Record one finished request, O(1)
+        """
+        self.queue.record(queue_wait)
+        self.service.record(service_time)
+        self.total.record(queue_wait + service_time)
+
+        if self.parent:
+            self.parent.record(queue_wait, service_time)
+
+    def merge(self, other):
+        """
+        Add another RequestTimings into this one
+        """
+        self.queue.merge(other.queue)
+        self.service.merge(other.service)
+        self.total.merge(other.total)
+
+    def get_stats(self):
+        """
+        p50/p95/p99 of end to end time plus p99 of queue wait and service time, and the mean service time
+        """
+        total = self.total.percentiles((50, 95, 99))
+        return {
+            "completed": self.total.count,
+            "p50_latency": total[50],
+            "p95_latency": total[95],
+            "p99_latency": total[99],
+            "p99_queue_wait": self.queue.percentile(99),
+            "p99_service_time": self.service.percentile(99),
+            "mean_service_time": self.service.mean()
+        }
@@ -0,0 +1,378 @@
+import json
+import time
+import asyncio
+import threading
+from urllib.parse import urlsplit, parse_qs
+from .load_balancer import RoutingAlgo
+from .event_log import events
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    """
+    Escape a label value for the Prometheus text format
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class Exposition:
+    def __init__(self):
+        """
+        Builds a Prometheus text format page
+
+        Samples are grouped under their family with one HELP and TYPE each, whatever
+        order they are added in, the format needs every sample of a family together
+        """
+        self.families = {} # family name -> [HELP and TYPE lines, samples...]
+
+    def add(self, name, value, kind="gauge", help_text="", labels=None, family=None):
+        """
+        Add one sample, family is only needed for samples like a summarys _sum and _count
+        """
+        family = family or name
+        lines = self.families.get(family)
+        if lines is None:
+            lines = self.families[family] = [f"# HELP {family} {help_text}", f"# TYPE {family} {kind}"]
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def render(self):
+        return ("\n".join(line for lines in self.families.values() for line in lines) + "\n").encode()
+
+
+def render_metrics(snapshot):
+    """
+    Turn a snapshot from MetricsEndpoint.take_snapshot into Prometheus text format
+    """
+
+    page = Exposition()
+    lb = snapshot["load_balancer"]
+
+    page.add("stc_requests_total", lb["total_requests_routed"], "counter", "Requests sent to the load balancer")
+    page.add("stc_requests_failed_total", lb["failed_requests"], "counter", "Requests rejected, shed, timed out or failed on their server")
+    page.add("stc_requests_shed_total", lb["shed"], "counter", "Requests rejected because the waiting queue was full")
+    page.add("stc_requests_timed_out_total", lb["timed_out"], "counter", "Requests that waited too long for a slot")
+
+    for quantile, stat in (("0.5", "p50_latency"), ("0.95", "p95_latency"), ("0.99", "p99_latency")):
+        page.add("stc_request_duration_seconds", lb[stat], "summary",
+                 "Time from routing to finishing, queue wait included", {"quantile": quantile})
+    page.add("stc_request_duration_seconds_sum", lb["latency_sum"], family="stc_request_duration_seconds")
+    page.add("stc_request_duration_seconds_count", lb["latency_count"], family="stc_request_duration_seconds")
+
+    if "retries" in lb:
+        page.add("stc_retries_total", lb["retries"], "counter", "Failed requests sent again to another server")
+        page.add("stc_hedges_total", lb["hedges"], "counter", "Copies sent for requests slower than the hedge delay")
+        page.add("stc_hedges_won_total", lb["hedges_won"], "counter", "Requests answered by their hedge copy")
+        page.add("stc_retry_budget_denied_total", lb["retry_budget_denied"], "counter", "Retries and hedges refused by the retry budget")
+        page.add("stc_hedge_delay_seconds", lb["hedge_delay"], "gauge", "How long a request runs before it is hedged")
+
+    page.add("stc_servers", lb["total_servers"], "gauge", "Servers in the pool")
+    page.add("stc_servers_healthy", lb["healthy_servers"], "gauge", "Servers that are not overloaded or down")
+    page.add("stc_servers_draining", lb["draining_servers"], "gauge", "Servers finishing their requests before removal")
+    page.add("stc_capacity", lb["total_capacity"], "gauge", "Request slots across all servers")
+    page.add("stc_load", lb["current_load"], "gauge", "Requests running across all servers")
+    page.add("stc_utilization_ratio", lb["util"] / 100, "gauge", "Load over capacity")
+    page.add("stc_queue_depth", lb["queue_depth"], "gauge", "Requests waiting for a slot")
+    page.add("stc_queue_capacity", lb["queue_capacity"], "gauge", "Requests that may wait for a slot")
+    page.add("stc_routing_algorithm", 1, "gauge", "Routing algorithm in use", {"algorithm": snapshot["algorithm"]})
+
+    for server in snapshot["servers"]:
+        labels = {"server": server["server_id"]}
+        page.add("stc_server_load", server["current_requests"], "gauge", "Requests running on the server", labels)
+        page.add("stc_server_capacity", server["max_capacity"], "gauge", "Request slots on the server", labels)
+        page.add("stc_server_requests_total", server["total_handled"], "counter", "Requests the server finished", labels)
+        page.add("stc_server_p99_seconds", server["p99_latency"], "gauge", "99th percentile time on the server", labels)
+        page.add("stc_server_status", 1, "gauge", "Server status", {**labels, "status": server["status"]})
+
+    traffic = snapshot.get("traffic")
+    if traffic:
+        page.add("stc_traffic_sent_total", traffic["total_requests_sent"], "counter", "Requests the traffic generator sent")
+        page.add("stc_traffic_given_up_total", traffic["requests_given_up"], "counter", "Requests dropped by the generator under backpressure")
+        page.add("stc_traffic_deferred", traffic["requests_deferred"], "gauge", "Requests held back for the next batch")
+
+    scaler = snapshot.get("scaler")
+    if scaler:
+        page.add("stc_scaler_min_servers", scaler["min_servers"], "gauge", "Fewest servers the auto scaler keeps")
+        page.add("stc_scaler_max_servers", scaler["max_servers"], "gauge", "Most servers the auto scaler adds")
+        page.add("stc_scaler_desired_servers", scaler["desired"], "gauge", "Servers the scaling policy last asked for")
+        page.add("stc_scaler_checks_total", scaler["checks"], "counter", "Load checks the auto scaler made")
+
+    provisioning = snapshot.get("provisioning")
+    if provisioning:
+        page.add("stc_standby_servers", provisioning["standby_ready"], "gauge", "Warm servers ready to promote")
+        page.add("stc_servers_booting", provisioning["booting"], "gauge", "Servers booting for the pool or the standby pool")
+        page.add("stc_servers_warming", provisioning["warming"], "gauge", "Servers with some of their slots still closed")
+        page.add("stc_standby_promotions_total", provisioning["promotions"], "counter", "Scale ups served from the standby pool")
+        page.add("stc_cold_starts_total", provisioning["cold_starts"], "counter", "Scale ups that had to boot a server")
+        for quantile, stat in (("0.5", "p50_time_to_capacity"), ("0.99", "p99_time_to_capacity")):
+            page.add("stc_time_to_capacity_seconds", provisioning[stat], "gauge",
+                     "Time from a scale up until the server has every slot open", {"quantile": quantile})
+
+    page.add("stc_snapshot_timestamp_seconds", snapshot["time"], "gauge", "When these numbers were taken")
+    return page.render()
+
+
+class MetricsEndpoint:
+    def __init__(self, load_balancer, traffic_generator=None, auto_scaler=None, host="127.0.0.1", port=8000, refresh_interval=1.0):
+        """
+        Small asyncio HTTP server with the stats in Prometheus format and a few controls
+
+        The numbers are read once per refresh_interval into a snapshot and the page
+        is rendered then, a scrape only sends the cached bytes. Reading them uses the
+        O(1) get_stats and plain attribute reads, never the routing lock, so scraping
+        as often as you like does not slow routing down.
+
+            GET  /metrics              Prometheus text format
+            GET  /stats                The snapshot as JSON
+            GET  /healthz              ok
+            POST /control/algorithm    name=least_connections
+            POST /control/scaler       min=2&max=10
+
+        Control parameters can be in the query string, a form body or a JSON body.
+        It binds to localhost by default, there is no authentication.
+
+        Arguments:
+            load_balancer: LoadBalancer to report on and control
+            traffic_generator: TrafficGenerator to report on
+            auto_scaler: AutoScaler to report on and control
+            host: Address to listen on
+            port: Port to listen on, 0 picks a free one
+            refresh_interval: Seconds between snapshots
+        """
+
+        self.load_balancer = load_balancer
+        self.traffic_generator = traffic_generator
+        self.auto_scaler = auto_scaler
+        self.host = host
+        self.port = port
+        self.refresh_interval = refresh_interval
+
+        self.snapshot = None
+        self.page = b""
+        self.scrapes = 0
+
+        self.loop = None
+        self.stopping = None
+        self.ready = threading.Event()
+        self.thread = None
+
+    def take_snapshot(self):
+        """
+        Read every number once, without the routing lock
+        """
+
+        lb_stats = self.load_balancer.get_stats()
+
+        # the summary's sum and count come from the histogram its quantiles came from, per request with retries or hedging
+        resilience = self.load_balancer.resilience
+        latency = resilience.latency if resilience else self.load_balancer.timings.total
+        with latency.lock:
+            lb_stats["latency_sum"] = latency.total / 1_000_000
+            lb_stats["latency_count"] = latency.count
+
+        servers = []
+        for server in list(self.load_balancer.servers):
+            servers.append({
+                "server_id": server.server_id,
+                "current_requests": server.current_requests,
+                "max_capacity": server.max_capacity,
+                "total_handled": server.total_requests_handled,
+                "status": server.status.value,
+                "p99_latency": server.timings.total.percentile(99)
+            })
+
+        snapshot = {
+            "time": time.time(),
+            "algorithm": self.load_balancer.rounting_algo.value,
+            "load_balancer": lb_stats,
+            "servers": servers
+        }
+
+        if self.traffic_generator:
+            snapshot["traffic"] = self.traffic_generator.get_stats()
+
+        if self.auto_scaler:
+            snapshot["scaler"] = {
+                "min_servers": self.auto_scaler.min_servers,
+                "max_servers": self.auto_scaler.max_servers,
+                "desired": self._desired_servers(lb_stats["total_servers"]),
+                "checks": self.auto_scaler.checks,
+                "is_running": self.auto_scaler.is_running
+            }
+            if self.auto_scaler.provisioner:
+                snapshot["provisioning"] = self.auto_scaler.provisioner.get_stats()
+        return snapshot
+
+    def _desired_servers(self, server_count):
+        """
+        What the policy last asked for, kept inside the scalers bounds like the scaler does
+        """
+        desired = self.auto_scaler.policy.get_stats().get("desired", server_count)
+        return max(self.auto_scaler.min_servers, min(self.auto_scaler.max_servers, desired))
+
+    def refresh(self):
+        """
+        Take a new snapshot and render the page scrapes get
+        """
+        snapshot = self.take_snapshot()
+        self.page = render_metrics(snapshot)
+        self.snapshot = snapshot
+
+    async def serve(self):
+        """
+        Listen and refresh the snapshot until stop, run this as a task or use start
+        """
+
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+
+        self.refresh()
+        self.ready.set()
+        events.info("http_started", "Metrics at http://{host}:{port}/metrics", host=self.host, port=self.port)
+
+        try:
+            while not self.stopping.is_set():
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), self.refresh_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.refresh()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    def start(self):
+        """
+        Serve from an event loop on its own thread, for the threaded system
+        """
+        self.thread = threading.Thread(target=asyncio.run, args=(self.serve(),), daemon=True)
+        self.thread.start()
+        self.ready.wait(5)
+
+    def stop(self):
+        """
+        Stop serving, safe to call from any thread
+        """
+        if self.loop and self.stopping:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        if self.thread:
+            self.thread.join()
+
+    async def _handle(self, reader, writer):
+        """
+        Read one request, answer it and close the connection
+        """
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            length = min(int(headers.get("content-length") or 0), 65536)
+            body = await asyncio.wait_for(reader.readexactly(length), 5) if length else b""
+
+            status, content_type, payload = self._route(method, target, body)
+        except (ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            status, content_type, payload = 400, "text/plain", b"bad request\n"
+
+        head = (f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n")
+        try:
+            writer.write(head.encode() + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _route(self, method, target, body):
+        """
+        Work out the response for a request, returns (status, content type, body)
+        """
+        url = urlsplit(target)
+
+        if url.path in ("/metrics", "/stats", "/healthz"):
+            if method != "GET":
+                return self._json(405, {"error": "use GET"})
+            if url.path == "/metrics":
+                self.scrapes += 1
+                return 200, PROMETHEUS_TYPE, self.page
+            if url.path == "/stats":
+                return self._json(200, self.snapshot)
+            return 200, "text/plain", b"ok\n"
+
+        if url.path in ("/control/algorithm", "/control/scaler"):
+            if method != "POST":
+                return self._json(405, {"error": "use POST"})
+            try:
+                params = self._params(url.query, body)
+                if url.path == "/control/algorithm":
+                    result = self._set_algorithm(params)
+                else:
+                    result = self._set_scaler(params)
+            except (TypeError, AttributeError, ValueError) as e:
+                # bad values like {"min": null} are the clients fault, answer instead of dropping the connection
+                return self._json(400, {"error": str(e)})
+
+            self.refresh()
+            return self._json(200, result)
+
+        return self._json(404, {"error": f"no such path {url.path}"})
+
+    def _params(self, query, body):
+        """
+        Control parameters from the query string and a form or JSON body
+        """
+        params = {name: values[-1] for name, values in parse_qs(query).items()}
+        if body.strip().startswith((b"{", b"[")):
+            values = json.loads(body)
+            if not isinstance(values, dict):
+                raise ValueError("the JSON body must be an object")
+            params.update(values)
+        elif body:
+            params.update({name: values[-1] for name, values in parse_qs(body.decode()).items()})
+        return params
+
+    def _set_algorithm(self, params):
+        if "name" not in params:
+            raise ValueError("name is required")
+
+        try:
+            algo = RoutingAlgo(params["name"])
+        except (TypeError, ValueError):
+            raise ValueError(f"unknown algorithm, use one of {', '.join(a.value for a in RoutingAlgo)}")
+
+        self.load_balancer.set_algorithm(algo)
+        return {"algorithm": algo.value}
+
+    def _set_scaler(self, params):
+        if not self.auto_scaler:
+            raise ValueError("there is no auto scaler")
+
+        min_servers = int(params.get("min", self.auto_scaler.min_servers))
+        max_servers = int(params.get("max", self.auto_scaler.max_servers))
+        self.auto_scaler.set_bounds(min_servers, max_servers)
+        return {"min_servers": min_servers, "max_servers": max_servers}
+
+    def _json(self, status, value):
+        return status, "application/json", (json.dumps(value) + "\n").encode()
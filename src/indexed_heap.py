@@ -0,0 +1,117 @@
+import threading
+import itertools
+
+class ServerHeap:
+    def __init__(self):
+        """
+        Min heap of servers that knows where every server sits in it
+
+        Ordered by (cant take requests, current_requests, order added) so the top is
+        always the least busy server that can take a request. Because every server's
+        position is tracked, a server whose load changes is moved up or down in
+        O(log n) instead of rebuilding or scanning the whole list.
+        """
+
+        self.heap = [] # list of [key, server]
+        self.positions = {} # server_id -> index in heap
+        self.order = {} # server_id -> order it was added, breaks ties like min() did
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def _key(self, server):
+        """
+        Sort key for a server, smaller is better
+        """
+        return (0 if server.can_handle_request() else 1, server.current_requests, self.order[server.server_id])
+
+    def push(self, server):
+        """
+        Add a server
+        """
+        with self.lock:
+            if server.server_id in self.positions:
+                return
+
+            self.order[server.server_id] = next(self.counter)
+            self.heap.append([self._key(server), server])
+            self.positions[server.server_id] = len(self.heap) - 1
+            self._sift_up(len(self.heap) - 1)
+
+    def remove(self, server):
+        """
+        Take a server out, O(log n)
+        """
+        with self.lock:
+            index = self.positions.pop(server.server_id, None)
+            if index is None:
+                return
+            del self.order[server.server_id]
+
+            last = self.heap.pop()
+            if index < len(self.heap):
+                # move the last entry into the hole and fix it up
+                self.heap[index] = last
+                self.positions[last[1].server_id] = index
+                self._sift_down(index)
+                self._sift_up(index)
+
+    def update(self, server):
+        """
+        Re-read the servers load and move it to the right place, O(log n)
+        """
+        with self.lock:
+            index = self.positions.get(server.server_id)
+            if index is None:
+                return
+
+            new_key = self._key(server)
+            old_key = self.heap[index][0]
+            if new_key == old_key:
+                return
+
+            self.heap[index][0] = new_key
+            if new_key < old_key:
+                self._sift_up(index)
+            else:
+                self._sift_down(index)
+
+    def peek(self):
+        """
+        Least busy server, O(1)
+        """
+        with self.lock:
+            return self.heap[0][1] if self.heap else None
+
+    def _swap(self, i, j):
+        self.heap[i], self.heap[j] = self.heap[j], self.heap[i]
+        self.positions[self.heap[i][1].server_id] = i
+        self.positions[self.heap[j][1].server_id] = j
+
+    def _sift_up(self, index):
+        while index > 0:
+            parent = (index - 1) // 2
+            if self.heap[index][0] < self.heap[parent][0]:
+                self._swap(index, parent)
+                index = parent
+            else:
+                return
+
+    def _sift_down(self, index):
+        size = len(self.heap)
+        while True:
+            smallest = index
+            left = 2 * index + 1
+            right = left + 1
+
+            if left < size and self.heap[left][0] < self.heap[smallest][0]:
+                smallest = left
+            if right < size and self.heap[right][0] < self.heap[smallest][0]:
+                smallest = right
+
+            if smallest == index:
+                return
+            self._swap(index, smallest)
+            index = smallest
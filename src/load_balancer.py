@@ -1,42 +1,125 @@
 import threading
 import time
+import random
 from datetime import datetime
 from enum import Enum
 from .server import Server, ServerStatus
+from .dispatcher import DispatchMode, create_dispatcher
+from .indexed_heap import ServerHeap
+from .weighted import WeightedSchedule
+from .consistent_hash import HashRing
+from .cluster_stats import ClusterStats
+from .histogram import RequestTimings
+from .event_log import events
+from .admission import AdmissionQueues, QueueScope
+from .load_triggers import LoadTriggers
+from .resilience import ResilienceLayer, RetryBudget
 
 class RoutingAlgo(Enum):
     ROTATING = "rotating"
     LEAST_CONNECTIONS = "least_connections"
     WEIGHTED = "weighted"
+    POWER_OF_TWO = "power_of_two"
+    CONSISTENT_HASH = "consistent_hash"
+
+
+class DrainChoice(Enum):
+    LEAST_LOADED = "least_loaded" # fewest requests left to finish, top of the least connections heap
+    NEWEST = "newest" # last server added
 
 
 class LoadBalancer:
-    def __init__(self, rounting_algo=RoutingAlgo.ROTATING):
+    def __init__(self, rounting_algo=RoutingAlgo.ROTATING, dispatcher=None, choices=2, rng=random, vnodes=100, hash_load_factor=1.25,
+                 queue_size=10, queue_timeout=2.0, queue_scope=QueueScope.SHARED, clock=time.perf_counter, retries=0, retry_budget=0.2,
+                 hedge_percentile=None, call_later=None):
         """
         Main Load Balancer class that manages different servers
 
         Arguments:
             rounting_algo: How to decide which server gets each request
+            dispatcher: How routed requests get run on their server, defaults to a worker pool per server
+            choices: How many random servers POWER_OF_TWO compares
+            rng: Source of randomness for POWER_OF_TWO, pass a seeded random.Random for repeatable runs
+            vnodes: Points on the hash ring per server for CONSISTENT_HASH
+            hash_load_factor: How far over the average load CONSISTENT_HASH lets a server go before overflowing
+            queue_size: Requests that may wait for a slot per server when every server is full, 0 rejects right away
+            queue_timeout: Seconds a request may wait for a slot before it is dropped, None to wait forever
+            queue_scope: One waiting queue for the whole cluster or one per server
+            clock: Function returning the time in seconds for queue timeouts, the simulation passes its virtual clock
+            retries: Times a request that fails on its server is retried on another one, see ResilienceLayer
+            retry_budget: Retries and hedges allowed per request across the cluster, 0.2 is one for every five
+            hedge_percentile: Send a copy of requests running longer than this percentile of service time, None for no hedging
+            call_later: Function (delay, callback) that starts hedges later, the simulation passes its event queue
         """
 
         self.rounting_algo = rounting_algo
+        self.choices = choices
+        self.rng = rng
+        self.dispatcher = dispatcher or create_dispatcher(DispatchMode.PER_SERVER_POOL)
         self.servers = []
         self.current_server_index = 0  # For round robin
+        self.connection_heap = ServerHeap()  # For least connections, kept up to date by server listeners
+        self.weighted_schedule = WeightedSchedule()  # For weighted, rebuilt only when servers or weights change
+        self.hash_ring = HashRing(vnodes, hash_load_factor)  # For consistent hash
         self.total_requests = 0
         self.failed_requests = 0
+        self.cluster_stats = ClusterStats()  # server totals kept up to date, so get_stats is O(1)
+        self.timings = RequestTimings()  # latency histograms for the whole cluster, servers record into it
+        self.admission = AdmissionQueues(queue_size, queue_timeout, queue_scope, clock)  # where requests wait when every server is full
+        self.admitting = threading.local()  # set while a thread is starting waiting requests, see _admit_waiting
+        self.triggers = LoadTriggers(clock=clock)  # tells the auto scaler when load crosses a line, so it doesnt have to poll
+        self.clock = clock
+        self.draining = {}  # server_id -> time it is removed even if requests are still running (None for never)
+        self.drained = 0
+        self.drain_timeouts = 0
+        self.errored_requests = 0 # failed on their server, without a ResilienceLayer to retry them
+
+        # only requests need looking after when there are retries or hedges
+        self.resilience = None
+        if retries or hedge_percentile is not None:
+            self.resilience = ResilienceLayer(self, retries, RetryBudget(retry_budget, clock=clock), hedge_percentile,
+                                              call_later=call_later, clock=clock)
 
-        # Thread safety
-        self.lock = threading.Lock()
-        print(f"Load Balancer initialized with {rounting_algo.value} algorithm")
+        # Thread safety, reentrant because reserving a slot under it can admit a waiting request that
+        # finishes inline (INLINE dispatch) and is retried or hedged through _route_copy on the same thread
+        self.lock = threading.RLock()
+        self.error_lock = threading.Lock()
+        events.info("lb_created", "Load Balancer initialized with {algo} algorithm", algo=rounting_algo.value)
 
     def add_server(self, server):
         """
         Add new server to the pool
         """
+        self.dispatcher.attach(server)
+
         with self.lock:
             self.servers.append(server)
-            print(f"Added {server.server_id} to Load Balancer. Total servers: {len(self.servers)}")
+            self.connection_heap.push(server)
+            self.weighted_schedule.add(server)
+            self.hash_ring.add(server)
+            server.add_listener(self._on_server_change)
+            server.on_finish = self._on_request_done
+            self.cluster_stats.add_server(server)
+            self.admission.add_server(server)
+            server.timings.parent = self.timings
+            events.info("server_added", "Added {server_id} to Load Balancer. Total servers: {total}", server_id=server.server_id, total=len(self.servers))
+
+        # a new server can start on the backlog straight away
+        self._admit_waiting(server)
+        self._check_triggers()
     
+    def set_algorithm(self, rounting_algo):
+        """
+        Switch the routing algorithm while requests are being routed
+
+        Every algorithms structures are kept up to date all the time, so the
+        next request is simply picked the new way
+        """
+        with self.lock:
+            previous = self.rounting_algo
+            self.rounting_algo = rounting_algo
+        events.info("algorithm_changed", "Routing algorithm changed from {old} to {new}", old=previous.value, new=rounting_algo.value)
+
     def remove_server(self, server_id):
         """
         Remove server from the pool
@@ -45,43 +128,339 @@ class LoadBalancer:
             for i, server in enumerate(self.servers):
                 if server.server_id == server_id:
                     removed_server = self.servers.pop(i)
-                    print(f"Removed {server_id} from load balancer. Total Servers: {len(self.servers)}")
-                    return removed_server
-            return None
+                    # out of the heap under the lock too, or least connections could still pick it
+                    self.connection_heap.remove(removed_server)
+                    self.weighted_schedule.remove(removed_server)
+                    self.hash_ring.remove(removed_server)
+
+                    # keep the rotating index pointing at the same next server
+                    if i < self.current_server_index:
+                        self.current_server_index -= 1
+                    if self.current_server_index >= len(self.servers):
+                        self.current_server_index = 0
+                    break
+            else:
+                return None
+
+        removed_server.remove_listener(self._on_server_change)
+        self.cluster_stats.remove_server(removed_server)
+
+        # requests waiting for this server keep their place in time and wait somewhere else
+        for request_id, enqueued_at in self.admission.remove_server(removed_server):
+            self.admission.enqueue(request_id, enqueued_at=enqueued_at)
+        self._admit_waiting_all()
+        self._check_triggers()
+
+        # let the servers workers finish what is already queued, then stop them
+        self.dispatcher.detach(removed_server)
+        events.info("server_removed", "Removed {server_id} from load balancer. Total Servers: {total}", server_id=server_id, total=len(self.servers))
+        return removed_server
     
-    def route_request(self, request_id):
+    def drain_server(self, server_id, timeout=30.0):
+        """
+        Stop routing to a server and remove it once its requests have finished
+
+        The server is set DRAINING, which every routing algorithm skips. It is
+        removed as soon as it is idle, or after timeout seconds even if it is not.
+        Requests waiting in its own queue move to the other servers straight away.
+        Returns False if there is no such server or it is not taking requests.
+
+        Arguments:
+            server_id: Server to drain
+            timeout: Seconds to wait for its requests before removing it anyway, None to wait forever
+        """
+        server = self._find_server(server_id)
+        if server is None or server.status in (ServerStatus.DRAINING, ServerStatus.DOWN) or server_id in self.draining:
+            return False
+
+        self.draining[server_id] = None if timeout is None else self.clock() + timeout
+        events.info("server_draining", "Draining {server_id}, {running} requests to finish", server_id=server_id, running=server.current_requests)
+
+        for request_id, enqueued_at in self.admission.remove_server(server):
+            self.admission.enqueue(request_id, enqueued_at=enqueued_at)
+
+        # tells the listeners, which removes it right away if it is already idle
+        server.set_status(ServerStatus.DRAINING)
+        self._admit_waiting_all()
+        return True
+
+    def cancel_drain(self, server_id):
+        """
+        Put a draining server back into service, cheaper than starting a new one
+
+        Returns False if it was not draining (or was already removed)
+        """
+        if self.draining.pop(server_id, False) is False:
+            return False
+
+        server = self._find_server(server_id)
+        if server is None:
+            return False
+
+        # a limit nobody owns would throttle it for good, a warm-up or health trial keeps its own (limit_slots refuses)
+        if server.slot_limit < server.max_capacity:
+            server.limit_slots(None)
+
+        self.admission.add_server(server)
+        server.set_status(ServerStatus.HEALTHY)
+        events.info("drain_cancelled", "{server_id} back in service", server_id=server_id)
+        return True
+
+    def drain_candidate(self, choice=DrainChoice.LEAST_LOADED):
+        """
+        Server that is cheapest to drain, or None if none is taking requests
+
+        LEAST_LOADED is the top of the least connections heap, O(1) unless every
+        server is full. NEWEST looks from the end of the list, usually O(1)
+        """
+        usable = (ServerStatus.HEALTHY, ServerStatus.OVERLOADED)
+
+        if choice == DrainChoice.NEWEST:
+            for server in reversed(self.servers):
+                if server.status in usable and server.server_id not in self.draining:
+                    return server
+            return None
+
+        server = self.connection_heap.peek()
+        if server and server.status in usable and server.server_id not in self.draining:
+            return server
+
+        # the top is full or out of service, find the least loaded by hand
+        servers = [s for s in self.servers if s.status in usable and s.server_id not in self.draining]
+        return min(servers, key=lambda s: s.current_requests) if servers else None
+
+    def _find_server(self, server_id):
+        for server in self.servers:
+            if server.server_id == server_id:
+                return server
+        return None
+
+    def _finish_drain(self, server, timed_out=False):
+        """
+        Remove a drained server, only the first caller for a server does anything
+        """
+        if self.draining.pop(server.server_id, False) is False:
+            return
+
+        if timed_out:
+            self.drain_timeouts += 1
+            events.info("drain_timeout", "{server_id} still had {running} requests when its drain ran out of time",
+                        server_id=server.server_id, running=server.current_requests)
+        else:
+            self.drained += 1
+        self.remove_server(server.server_id)
+
+    def expire_drains(self):
+        """
+        Remove draining servers whose time is up
+
+        Called by the auto scaler on each check, see time_until_next_drain
+        """
+        if not self.draining:
+            return
+
+        now = self.clock()
+        for server_id, deadline in list(self.draining.items()):
+            if deadline is not None and now >= deadline:
+                server = self._find_server(server_id)
+                if server is None:
+                    self.draining.pop(server_id, None)
+                else:
+                    self._finish_drain(server, timed_out=True)
+
+    def expire_waiting(self):
+        """
+        Drop waiting requests past their timeout
+
+        Waiting requests also expire whenever a request is queued or admitted, this
+        catches the ones stuck in a queue nothing is happening to. Called by the auto
+        scaler on each check, like expire_drains
+        """
+        self.admission.expire()
+
+    def time_until_next_drain(self):
+        """
+        Seconds until a draining server is removed anyway, None if no drain has a timeout
+
+        Worked out on the load balancers own clock, the one the deadlines were set with
+        """
+        deadlines = [deadline for deadline in list(self.draining.values()) if deadline is not None]
+        return max(0.0, min(deadlines) - self.clock()) if deadlines else None
+
+    def route_request(self, request_id, key=None):
         """
         Decide which server should handle this reuqest
 
         This is called everytime a new web request comes in
+
+        Arguments:
+            request_id: The request
+            key: What CONSISTENT_HASH routes on (like a session id), defaults to request_id
         """
 
         with self.lock:
             self.total_requests += 1
 
             if not self.servers:
-                print(f"No servers available for request {request_id}")
+                events.debug("request_rejected", "No servers available for request {request_id}", request_id=request_id)
                 self.failed_requests += 1
+                self._check_triggers()
                 return False
             
             # Choose server based on algo (from enum)
-            selected_server = self._select_server()
+            selected_server = self._select_server(request_id if key is None else key)
+
+            # take the slot now, so requests on their way to the server already count
+            if selected_server and not selected_server.reserve_slot():
+                selected_server = None
 
             if not selected_server:
-                print(f"No available servers for request {request_id}")
-                self.failed_requests += 1
+                # every server is full, wait in line for a slot instead of failing straight away
+                preferred = self.hash_ring.home(str(request_id if key is None else key)) if self.rounting_algo == RoutingAlgo.CONSISTENT_HASH else None
+                queued = self.admission.enqueue(request_id, preferred)
+
+        if not selected_server:
+            self._check_triggers()
+
+            if not queued:
+                events.debug("request_rejected", "No available servers for request {request_id}", request_id=request_id)
                 return False
-            
+
+            if events.debug_enabled:
+                events.debug("request_queued", "Request {request_id} waiting for a free server ({depth} waiting)", request_id=request_id, depth=self.admission.depth)
+
+            # a slot may have opened while this was being queued
+            self._admit_waiting_all()
+            return True
+
         # Route the request outside the lock so other requests can start while this is processed
-        print(f"Routing request {request_id} to {selected_server.server_id}")
+        if events.debug_enabled:
+            events.debug("request_routed", "Routing request {request_id} to {server_id}", request_id=request_id, server_id=selected_server.server_id)
 
-        # Process the request in a different thread so it doesnt block the load balancer
-        request_thread = threading.Thread(target=selected_server.process_request, args=(request_id,))
-        request_thread.start()
+        # Hand the request to the dispatcher so it doesnt block the load balancer
+        self._submit(selected_server, request_id, key=key)
 
         return True
+
+    def _submit(self, server, request_id, queue_wait=0.0, key=None):
+        """
+        Send a request to the server its slot was reserved on
+        """
+        if self.resilience:
+            self.resilience.on_dispatch(server, request_id, key, queue_wait)
+        self.dispatcher.submit(server, request_id, queue_wait)
+
+    def _route_copy(self, request_id, key, tried):
+        """
+        Reserve a slot for a retry or hedge on a server not in tried, None if every other server is full
+
+        Only retries and hedges get here, and the budget keeps them rare, so the
+        fallback scan over every server costs routing nothing in normal running
+        """
+        with self.lock:
+            server = self._select_server(request_id if key is None else key)
+            if server is None or server.server_id in tried:
+                candidates = [s for s in self.servers if s.server_id not in tried and s.can_handle_request()]
+                server = min(candidates, key=lambda s: s.current_requests / s.slot_limit) if candidates else None
+
+            if server and not server.reserve_slot():
+                server = None
+        return server
+
+    def _on_request_done(self, server, request_id, failed):
+        """
+        A server finished a request, retry it if it failed and there is a ResilienceLayer
+        """
+        if self.resilience:
+            self.resilience.on_finish(server, request_id, failed)
+        elif failed:
+            with self.error_lock:
+                self.errored_requests += 1
+
+    def backpressure(self):
+        """
+        How full the waiting queues are from 0 to 1
+
+        At 1 new requests are being shed, senders should slow down
+        """
+        return self.admission.pressure()
+
+    def shutdown(self):
+        """
+        Stop the dispatcher workers once queued requests are done
+        """
+        self.dispatcher.shutdown()
+        if self.resilience:
+            self.resilience.stop()
     
-    def _select_server(self):
+    def _on_server_change(self, server):
+        """
+        A servers load, status or weight changed, move it in the least connections heap
+        """
+        self.connection_heap.update(server)
+        self.weighted_schedule.check(server)
+        self.hash_ring.update(server)
+        self.cluster_stats.on_server_change(server)
+
+        if server.status == ServerStatus.DRAINING:
+            # the last request finished, removing it checks the triggers
+            if server.current_requests == 0 and server.server_id in self.draining:
+                self._finish_drain(server)
+                return
+
+        # a slot opened up, give it to whoever has been waiting longest
+        elif self.admission.depth and server.can_handle_request():
+            self._admit_waiting(server)
+
+        self._check_triggers()
+
+    def _check_triggers(self):
+        """
+        Let the triggers see the latest totals, publishes if a line was crossed
+        """
+        self.triggers.check(self.cluster_stats.current_load, self.cluster_stats.total_capacity, self.admission.depth,
+                            self.failed_requests + self.admission.shed + self.admission.timed_out)
+
+    def _admit_waiting(self, server):
+        """
+        Start waiting requests on the server until it is full or nobody is waiting
+        """
+
+        # reserving a slot tells the listeners again, dont start another round inside this one
+        if getattr(self.admitting, "active", False):
+            return
+
+        self.admitting.active = True
+        try:
+            while server.can_handle_request():
+                waiting = self.admission.next_for(server)
+                if waiting is None:
+                    return
+
+                request_id, waited = waiting
+                if not server.reserve_slot():
+                    self.admission.put_back(server, request_id, waited)
+                    return
+
+                self.admission.record_admitted(waited)
+                if events.debug_enabled:
+                    events.debug("request_routed", "Routing request {request_id} to {server_id} after waiting {waited:.3f}s",
+                                 request_id=request_id, server_id=server.server_id, waited=waited)
+                self._submit(server, request_id, waited)
+        finally:
+            self.admitting.active = False
+
+    def _admit_waiting_all(self):
+        """
+        Give every server with a free slot a chance at the waiting requests
+        """
+        if not self.admission.depth:
+            return
+        for server in list(self.servers):
+            if server.can_handle_request():
+                self._admit_waiting(server)
+
+    def _select_server(self, key=None):
         """
         Choose which server should handle the next request
         """
@@ -90,6 +469,12 @@ class LoadBalancer:
             return self._rotating_selection()
         elif self.rounting_algo == RoutingAlgo.LEAST_CONNECTIONS:
             return self._least_connections_selection()
+        elif self.rounting_algo == RoutingAlgo.WEIGHTED:
+            return self._weighted_selection()
+        elif self.rounting_algo == RoutingAlgo.POWER_OF_TWO:
+            return self._power_of_two_selection()
+        elif self.rounting_algo == RoutingAlgo.CONSISTENT_HASH:
+            return self._consistent_hash_selection(key)
         else:
             return self._rotating_selection()
     
@@ -115,9 +500,72 @@ class LoadBalancer:
         # no servers available
         return None
     
+    def _weighted_selection(self):
+        """
+        Next server from the smooth weighted round robin schedule, O(1)
+        """
+        return self.weighted_schedule.next(self.servers)
+
+    def _consistent_hash_selection(self, key):
+        """
+        Server that owns the key on the hash ring, O(log n)
+
+        Same key goes to the same server while it has room, so its cache stays warm
+        """
+        return self.hash_ring.lookup(str(key))
+
+    def _power_of_two_selection(self):
+        """
+        Pick a few servers at random and take the least loaded one
+
+        Comparing just 2 random servers spreads load almost as well as checking
+        all of them, for O(1) work per request
+        """
+
+        count = len(self.servers)
+        if count <= self.choices:
+            candidates = self.servers
+        elif self.choices == 2:
+            # two different servers without building a sample list
+            first = self.rng.randrange(count)
+            second = self.rng.randrange(count - 1)
+            if second >= first:
+                second += 1
+            candidates = (self.servers[first], self.servers[second])
+        else:
+            candidates = self.rng.sample(self.servers, self.choices)
+
+        best_server = None
+        best_load = None
+        for server in candidates:
+            if not server.can_handle_request():
+                continue
+            load = server.current_requests / server.max_capacity
+            if best_load is None or load < best_load:
+                best_server = server
+                best_load = load
+
+        if best_server:
+            return best_server
+
+        # all the picks were full, fall back to the least busy server overall
+        return self._least_connections_selection()
+
     def _least_connections_selection(self):
         """
-        Choose the server with fewest actinve connections
+        Choose the server with fewest active connections
+
+        The heap is kept sorted as loads change so this is O(1)
+        """
+
+        server = self.connection_heap.peek()
+        if server and server.can_handle_request():
+            return server
+        return None
+
+    def _least_connections_scan(self):
+        """
+        Old O(n) version of _least_connections_selection, kept for the benchmark
         """
 
         available_servers = [s for s in self.servers if s.can_handle_request()]
@@ -132,33 +580,41 @@ class LoadBalancer:
     def get_stats(self):
         """
         Get current load balancer stats
+
+        O(1) and never takes the routing lock, the server totals are kept up to date
+        by ClusterStats as requests start and finish
         """
 
-        with self.lock:
-            healthy_servers = 0
-            for s in self.servers:
-                if s.status == ServerStatus.HEALTHY:
-                    healthy_servers += 1
-            
-            total_capacity = 0
-            for s in self.servers:
-                total_capacity += s.max_capacity
+        cluster = self.cluster_stats.snapshot()
+        admission = self.admission.get_stats()
+
+        # failed is read before total so it can never be ahead of it
+        failed_requests = self.failed_requests + self.errored_requests + admission["shed"] + admission["timed_out"]
+        if self.resilience:
+            failed_requests += self.resilience.failed
+        total_requests = self.total_requests
+
+        stats = {
+            "total_servers": cluster["total_servers"],
+            "healthy_servers": cluster["healthy_servers"],
+            "draining_servers": len(self.draining),
+            "total_requests_routed": total_requests,
+            "failed_requests": failed_requests,
+            "success_rate": ((total_requests - failed_requests) / max(1, total_requests)) * 100,
+            "total_capacity": cluster["total_capacity"],
+            "current_load": cluster["current_load"],
+            "util": (cluster["current_load"] / max(1, cluster["total_capacity"])) * 100
+        }
+
+        # percentiles cost the same no matter how many servers there are
+        stats.update(self.timings.get_stats())
+        stats.update(admission)
+
+        # a request can take several copies with retries or hedging, so its latency is from arriving to the first answer
+        if self.resilience:
+            stats.update(self.resilience.get_stats())
+        return stats
 
-            current_load = 0
-            for s in self.servers:
-                current_load += s.current_requests
-        
-            return {
-                "total_servers": len(self.servers),
-                "healthy_servers": healthy_servers,
-                "total_requests_routed": self.total_requests,
-                "failed_requests": self.failed_requests,
-                "success_rate": ((self.total_requests - self.failed_requests) / max(1, self.total_requests)) * 100,
-                "total_capacity": total_capacity,
-                "current_load": current_load,
-                "util": (current_load / max(1, total_capacity)) * 100
-            }
-        
     def print_stats(self):
         """
         Prints current status of load balancer and all servers
@@ -168,11 +624,19 @@ class LoadBalancer:
         print("\n--- Load Balancer Stats ---")
         print(f"\n Load Balancer Status:")
         print(f" Algorithm: {self.rounting_algo.value}")
+        print(f" Dispatch: {self.dispatcher.mode.value}")
         print(f" Servers: {stats['healthy_servers']}/{stats['total_servers']} healthy")
         print(f" Requests: {stats['total_requests_routed']} total, {stats['failed_requests']} failed")
         print(f" Success Rate: {stats['success_rate']:.1f}%")
         print(f" System Load: {stats['current_load']}/{stats['total_capacity']} ({stats['util']:.1f}%)")
+        print(f" Latency: p50 {stats['p50_latency'] * 1000:.0f}ms, p95 {stats['p95_latency'] * 1000:.0f}ms, p99 {stats['p99_latency'] * 1000:.0f}ms")
+        print(f" Queue: {stats['queue_depth']}/{stats['queue_capacity']} waiting ({stats['queue_scope']}), {stats['shed']} shed, {stats['timed_out']} timed out, p99 wait {stats['p99_admission_wait'] * 1000:.0f}ms")
         
+        if self.rounting_algo == RoutingAlgo.CONSISTENT_HASH:
+            ring_stats = self.hash_ring.get_stats()
+            print(f" Hash Ring: {ring_stats['vnodes']} vnodes per server, last change moved {ring_stats['last_remap_fraction'] * 100:.1f}% of keys")
+            print(f" Imbalance: keys {ring_stats['key_imbalance']:.2f}x, load {ring_stats['load_imbalance']:.2f}x of average, {ring_stats['overflows']} overflowed")
+
         print(f"\n Server Details:")
         for server in self.servers:
             print(f"   {server}")
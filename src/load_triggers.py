@@ -0,0 +1,114 @@
+import time
+from enum import Enum
+
+class LoadSignal(Enum):
+    HIGH_UTIL = "high_util" # util went over the high line
+    LOW_UTIL = "low_util" # util went under the low line
+    QUEUEING = "queueing" # requests are waiting for a slot
+    SHEDDING = "shedding" # requests were rejected or timed out recently
+
+
+class LoadTriggers:
+    def __init__(self, high_util=70, low_util=30, queue_depth=1, rejection_window=1.0, clock=time.perf_counter):
+        """
+        Publishes an event when the load crosses a line, instead of making anyone poll
+
+        The load balancer calls check on every load change. That is a few compares,
+        and subscribers only hear about it when a signal turns on, so nothing
+        happens while the load stays on the same side of every line.
+
+        There is no lock, check runs on the hot path from many threads. Two threads
+        racing on the same crossing can at worst publish it twice, the next check
+        always puts the state right.
+
+        Arguments:
+            high_util: Util % that turns HIGH_UTIL on
+            low_util: Util % that turns LOW_UTIL on
+            queue_depth: Waiting requests that turn QUEUEING on
+            rejection_window: Seconds SHEDDING stays on after the last rejected request
+            clock: Function returning the time in seconds, the simulation passes its virtual clock
+        """
+
+        self.high_util = high_util
+        self.low_util = low_util
+        self.queue_depth = queue_depth
+        self.rejection_window = rejection_window
+        self.clock = clock
+
+        self.active = {signal: False for signal in LoadSignal}
+        self.subscribers = []
+        self.last_rejected = 0
+        self.last_rejection_time = None
+        self.published = 0
+
+    def subscribe(self, callback):
+        """
+        Get called with (signal, util) whenever a signal turns on
+
+        Called on whatever thread changed the load, often with the routing lock
+        held, so callbacks should only wake something up and return
+        """
+        # copy on write so check can loop without a lock
+        self.subscribers = self.subscribers + [callback]
+
+    def unsubscribe(self, callback):
+        """
+        Stop getting called
+        """
+        self.subscribers = [s for s in self.subscribers if s != callback]
+
+    def check(self, load, capacity, queue_depth, rejected):
+        """
+        Compare the latest numbers against the lines, O(1)
+
+        Arguments:
+            load: Requests running across the cluster
+            capacity: Slots across the cluster
+            queue_depth: Requests waiting for a slot
+            rejected: Total requests rejected so far (shed, timed out or no servers)
+        """
+
+        util = load / capacity * 100 if capacity else 100.0
+
+        self._set(LoadSignal.HIGH_UTIL, util > self.high_util, util)
+        self._set(LoadSignal.LOW_UTIL, util < self.low_util, util)
+        self._set(LoadSignal.QUEUEING, queue_depth >= self.queue_depth, util)
+
+        if rejected != self.last_rejected:
+            self.last_rejected = rejected
+            self.last_rejection_time = self.clock()
+            self._set(LoadSignal.SHEDDING, True, util)
+        elif self.active[LoadSignal.SHEDDING]:
+            self._set(LoadSignal.SHEDDING, self.clock() - self.last_rejection_time <= self.rejection_window, util)
+
+    def _set(self, signal, on, util):
+        """
+        Update one signal and tell the subscribers if it just turned on
+        """
+        if on == self.active[signal]:
+            return
+
+        self.active[signal] = on
+        if on:
+            self.published += 1
+            for callback in self.subscribers:
+                callback(signal, util)
+
+    def active_signals(self):
+        """
+        Signals that are on right now
+        """
+        # SHEDDING turns itself off once the window passes even if nothing else changed
+        if self.active[LoadSignal.SHEDDING] and self.clock() - self.last_rejection_time > self.rejection_window:
+            self.active[LoadSignal.SHEDDING] = False
+
+        return {signal for signal, on in self.active.items() if on}
+
+    def get_stats(self):
+        """
+        Get trigger stats
+        """
+        return {
+            "active_signals": sorted(signal.value for signal in self.active_signals()),
+            "signals_published": self.published
+        }
@@ -0,0 +1,281 @@
+import os
+import mmap
+import time
+import struct
+import threading
+from .server import ServerStatus
+from .event_log import events
+
+MAGIC = b"STCMETR1"
+VERSION = 2
+
+# magic, version, server slots, routing algorithm
+HEADER = struct.Struct("<8sII16s")
+
+CLUSTER_FIELDS = (
+    "total_servers",
+    "healthy_servers",
+    "draining_servers",
+    "total_requests_routed",
+    "failed_requests",
+    "success_rate",
+    "total_capacity",
+    "current_load",
+    "util",
+    "completed",
+    "p50_latency",
+    "p95_latency",
+    "p99_latency",
+    "p99_queue_wait",
+    "p99_service_time",
+    "queue_depth",
+    "queue_capacity",
+    "peak_queue_depth",
+    "shed",
+    "timed_out",
+    "published_servers", # how many server slots below are current
+    "published_at" # wall clock time of the publish
+)
+
+SERVER_FIELDS = (
+    "current_requests",
+    "max_capacity",
+    "peak_requests",
+    "total_handled",
+    "util",
+    "status", # index into ServerStatus
+    "p99_latency"
+)
+
+STATUSES = list(ServerStatus)
+SERVER_ID_BYTES = 32
+
+
+class SeqlockBlock:
+    def __init__(self, fmt):
+        """
+        A fixed layout record behind a sequence counter, for one writer and any number of readers
+
+        The writer bumps the counter to odd, writes, then bumps it back to even. A
+        reader copies the record and keeps it only if the counter was even and the
+        same before and after, otherwise it read half a write and tries again.
+        Neither side ever takes a lock, so a slow reader cannot hold up the writer.
+
+        Arguments:
+            fmt: struct format of the record, without the byte order
+        """
+
+        self.sequence = struct.Struct("<Q")
+        self.record = struct.Struct("<" + fmt)
+        self.size = self.sequence.size + self.record.size
+
+    def write(self, buf, offset, values):
+        """
+        Write a record, one writer at a time, callers with more than one writing thread must lock
+        """
+        seq = self.sequence.unpack_from(buf, offset)[0]
+        self.sequence.pack_into(buf, offset, seq + 1) # odd, a write is in progress
+        self.record.pack_into(buf, offset + self.sequence.size, *values)
+        self.sequence.pack_into(buf, offset, seq + 2)
+
+    def read(self, buf, offset, retries=1000):
+        """
+        Read a consistent record
+
+        Returns (sequence, values), sequence is 2 per write so far. Returns None if
+        the writer was in the middle of a write every try
+        """
+        for _ in range(retries):
+            before = self.sequence.unpack_from(buf, offset)[0]
+            if before & 1:
+                continue
+            values = self.record.unpack_from(buf, offset + self.sequence.size)
+            if self.sequence.unpack_from(buf, offset)[0] == before:
+                return before, values
+        return None
+
+
+CLUSTER_BLOCK = SeqlockBlock("d" * len(CLUSTER_FIELDS))
+SERVER_BLOCK = SeqlockBlock(f"{SERVER_ID_BYTES}s" + "d" * len(SERVER_FIELDS))
+
+
+def _segment_size(max_servers):
+    return HEADER.size + CLUSTER_BLOCK.size + max_servers * SERVER_BLOCK.size
+
+
+class MetricsPublisher:
+    def __init__(self, load_balancer, path, max_servers=64, interval=0.5):
+        """
+        Copies the load balancer and server counters into a memory mapped file
+
+        Anything that can open the file (a dashboard in another process, a
+        monitoring agent) reads the stats from there with MetricsReader instead of
+        calling get_stats and taking the servers locks. The copying is done on its
+        own thread every interval, the counters are read without locks, so the cost
+        to routing is one O(1) get_stats per interval.
+
+        Arguments:
+            load_balancer: LoadBalancer to publish
+            path: File to publish into, created or overwritten
+            max_servers: Server slots in the file, servers past this are only in the cluster totals
+            interval: Seconds between publishes
+        """
+
+        self.load_balancer = load_balancer
+        self.path = path
+        self.max_servers = max_servers
+        self.interval = interval
+        self.is_running = False
+        self.publishes = 0
+
+        with open(path, "wb") as file:
+            file.truncate(_segment_size(max_servers))
+
+        self.file = open(path, "r+b")
+        self.buf = mmap.mmap(self.file.fileno(), _segment_size(max_servers))
+        HEADER.pack_into(self.buf, 0, MAGIC, VERSION, max_servers, load_balancer.rounting_algo.value.encode()[:16])
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Start publishing every interval
+        """
+        self.is_running = True
+        self.publish()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        events.info("metrics_publishing", "Publishing metrics to {path} every {interval}s", path=self.path, interval=self.interval)
+
+    def stop(self):
+        """
+        Publish once more and stop, the file stays so readers see the final numbers
+        """
+        self.is_running = False
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        self.publish()
+        self.buf.close()
+        self.file.close()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.publish()
+
+    def publish(self):
+        """
+        Write one snapshot of every counter
+        """
+
+        stats = self.load_balancer.get_stats()
+        servers = list(self.load_balancer.servers)[:self.max_servers]
+        stats["published_servers"] = len(servers)
+        stats["published_at"] = time.time()
+
+        offset = HEADER.size
+        CLUSTER_BLOCK.write(self.buf, offset, [float(stats[field]) for field in CLUSTER_FIELDS])
+        offset += CLUSTER_BLOCK.size
+
+        for server in servers:
+            # plain attribute reads, the servers lock is left to the requests
+            values = (
+                server.current_requests,
+                server.max_capacity,
+                server.peak_requests,
+                server.total_requests_handled,
+                server.current_requests / server.max_capacity * 100,
+                STATUSES.index(server.status),
+                server.timings.total.percentile(99)
+            )
+            SERVER_BLOCK.write(self.buf, offset, (str(server.server_id).encode()[:SERVER_ID_BYTES],) + tuple(map(float, values)))
+            offset += SERVER_BLOCK.size
+
+        self.publishes += 1
+
+
+class MetricsReader:
+    def __init__(self, path):
+        """
+        Attach to a file written by MetricsPublisher, from any process
+
+        Arguments:
+            path: The publishers file
+        """
+
+        self.path = path
+        self.file = open(path, "rb")
+        self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.max_servers, algorithm = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a metrics segment")
+        self.algorithm = algorithm.rstrip(b"\0").decode()
+
+    def get_stats(self):
+        """
+        Last published load balancer stats, same keys as LoadBalancer.get_stats
+        """
+        result = CLUSTER_BLOCK.read(self.buf, HEADER.size)
+        if result is None:
+            return None
+        _, values = result
+
+        stats = dict(zip(CLUSTER_FIELDS, values))
+        for field in ("total_servers", "healthy_servers", "total_requests_routed", "failed_requests", "total_capacity",
+                      "current_load", "completed", "queue_depth", "queue_capacity", "peak_queue_depth", "shed",
+                      "timed_out", "published_servers"):
+            stats[field] = int(stats[field])
+        return stats
+
+    def server_stats(self, count=None):
+        """
+        Last published stats of each server
+
+        Arguments:
+            count: Slots to read, defaults to how many the last cluster publish had
+        """
+        if count is None:
+            stats = self.get_stats()
+            count = stats["published_servers"] if stats else 0
+
+        servers = []
+        offset = HEADER.size + CLUSTER_BLOCK.size
+        for _ in range(min(count, self.max_servers)):
+            result = SERVER_BLOCK.read(self.buf, offset)
+            offset += SERVER_BLOCK.size
+            if result is None:
+                continue
+
+            _, values = result
+            server = dict(zip(SERVER_FIELDS, values[1:]))
+            server["server_id"] = values[0].rstrip(b"\0").decode()
+            server["status"] = STATUSES[int(server["status"])].value
+            for field in ("current_requests", "max_capacity", "peak_requests", "total_handled"):
+                server[field] = int(server[field])
+            servers.append(server)
+        return servers
+
+    def age(self):
+        """
+        Seconds since the last publish
+        """
+        stats = self.get_stats()
+        return time.time() - stats["published_at"] if stats and stats["published_at"] else None
+
+    def close(self):
+        self.buf.close()
+        self.file.close()
+
+
+if __name__ == "__main__":
+    import sys
+    from .dashboard import Dashboard
+
+    if len(sys.argv) < 2 or not os.path.exists(sys.argv[1]):
+        print("Usage: python -m src.metrics_segment PATH (the file main.py --metrics PATH writes)")
+        sys.exit(1)
+
+    Dashboard(metrics=MetricsReader(sys.argv[1])).start_live_monitoring(refresh_interval=1)
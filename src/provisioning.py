@@ -0,0 +1,253 @@
+import math
+import time
+import heapq
+import itertools
+import threading
+from collections import deque
+from .server import Server, ServerStatus
+from .histogram import LatencyHistogram
+from .event_log import events
+
+
+class Provisioner:
+    def __init__(self, load_balancer, boot_time=30.0, warmup_time=60.0, warmup_capacity=0.25, standby=0,
+                 server_capacity=3, server_response_time=0.4, clock=time.perf_counter, interval=0.5):
+        """
+        Starts servers the way real ones start: booting takes a while and they are slow to warm up
+
+        A new server takes boot_time seconds before it can be added to the load
+        balancer, then opens only warmup_capacity of its slots, rising in a straight
+        line to all of them over warmup_time. Warm-up uses Server.limit_slots, so
+        routing sees it at no extra cost.
+
+        standby servers are kept booted and warm outside the load balancer. Asking for
+        a server promotes one of them in O(1) at full capacity, and a replacement
+        starts booting in the background. An empty pool falls back to a cold start.
+        Standby servers cost money while they wait, see servers_paid.
+
+        Time to first slot (asked for until routed to) and time to capacity (until
+        every slot is open) are kept in histograms.
+
+        Arguments:
+            load_balancer: LoadBalancer the servers are added to
+            boot_time: Seconds from asking for a server until it can take requests
+            warmup_time: Seconds from joining until all its slots are open, 0 for none
+            warmup_capacity: Share of the slots open when it joins
+            standby: Warm servers to keep ready, the pool starts full
+            server_capacity: max_capacity of the servers it starts
+            server_response_time: base_response_time of the servers it starts
+            clock: Function returning the time in seconds, the simulation passes its virtual clock
+            interval: Seconds between ticks when running on its own thread
+        """
+
+        self.load_balancer = load_balancer
+        self.boot_time = boot_time
+        self.warmup_time = warmup_time
+        self.warmup_capacity = warmup_capacity
+        self.standby = standby
+        self.server_capacity = server_capacity
+        self.server_response_time = server_response_time
+        self.clock = clock
+        self.interval = interval
+
+        self.pool = deque() # warm servers ready to promote
+        self.booting = [] # heap of (ready_at, order, server, asked_at, for_pool), for_pool None once it is warming for the pool
+        self.warming = [] # (server, joined_at, asked_at) still opening slots
+        self.order = itertools.count()
+        self.standby_count = 0
+        self.lock = threading.Lock()
+
+        self.promotions = 0
+        self.cold_starts = 0
+        self.boots_cancelled = 0
+        self.time_to_first_slot = LatencyHistogram(max_seconds=3600)
+        self.time_to_capacity = LatencyHistogram(max_seconds=3600)
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        # the pool starts full, as if it was warmed before the run
+        for _ in range(standby):
+            self.pool.append(self._new_standby())
+
+        events.info("provisioner_created", "Provisioner with {boot}s boot, {warmup}s warm-up and {standby} standby servers",
+                    boot=boot_time, warmup=warmup_time, standby=standby)
+
+    def _new_standby(self):
+        self.standby_count += 1
+        return Server(f"Standby-{self.standby_count}", max_capacity=self.server_capacity,
+                      base_response_time=self.server_response_time, clock=self.clock)
+
+    def start(self):
+        """
+        Tick every interval on a background thread
+        """
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop ticking, servers still booting never arrive
+        """
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.tick()
+
+    def request_server(self, server_id):
+        """
+        Get another server into the load balancer, returns the promoted server or None if it is booting
+
+        Arguments:
+            server_id: Name for a cold started server, promoted ones keep their standby name
+        """
+        now = self.clock()
+
+        with self.lock:
+            if not self.pool:
+                self.cold_starts += 1
+                self._boot(Server(server_id, max_capacity=self.server_capacity, base_response_time=self.server_response_time,
+                                  clock=self.clock), now, for_pool=False)
+                events.info("server_booting", "Booting {server_id}, ready in {boot}s", server_id=server_id, boot=self.boot_time)
+                return None
+
+            server = self.pool.popleft()
+            self.promotions += 1
+            self.load_balancer.add_server(server)
+            self._boot(self._new_standby(), now, for_pool=True)
+
+        self.time_to_first_slot.record(0.0)
+        self.time_to_capacity.record(0.0)
+        events.info("server_promoted", "Promoted {server_id} from the standby pool ({left} left)", server_id=server.server_id, left=len(self.pool))
+        return server
+
+    def _boot(self, server, now, for_pool):
+        """
+        Start booting a server, lock must be held
+        """
+        heapq.heappush(self.booting, (now + self.boot_time, next(self.order), server, now, for_pool))
+
+    def pending(self):
+        """
+        Servers booting for the load balancer, the auto scaler counts them as on their way
+        """
+        return sum(1 for entry in self.booting if entry[4] is False)
+
+    def cancel_boot(self):
+        """
+        Stop the latest boot for the load balancer, returns False if none is booting
+
+        Scaling down should give up a server that never arrived before draining one that is working
+        """
+        with self.lock:
+            mine = [i for i, entry in enumerate(self.booting) if entry[4] is False]
+            if not mine:
+                return False
+
+            entry = self.booting[max(mine, key=lambda i: self.booting[i][0])]
+            self.booting.remove(entry)
+            heapq.heapify(self.booting)
+            self.boots_cancelled += 1
+
+        events.info("boot_cancelled", "Cancelled booting {server_id}", server_id=entry[2].server_id)
+        return True
+
+    def servers_paid(self):
+        """
+        Servers running outside the load balancer: the standby pool and everything booting
+        """
+        return len(self.pool) + len(self.booting)
+
+    def next_due(self):
+        """
+        When the next boot finishes, None if nothing is booting
+        """
+        booting = self.booting
+        return booting[0][0] if booting else None
+
+    def tick(self):
+        """
+        Finish boots that are due and open more slots on warming servers
+        """
+        now = self.clock()
+
+        with self.lock:
+            ready = []
+            while self.booting and self.booting[0][0] <= now:
+                ready.append(heapq.heappop(self.booting))
+
+            for _, _, server, asked_at, for_pool in ready:
+                if for_pool:
+                    # standby servers warm up before they go in the pool, so they are ready at full capacity
+                    heapq.heappush(self.booting, (now + self.warmup_time, next(self.order), server, asked_at, None))
+                elif for_pool is None:
+                    self.pool.append(server)
+                else:
+                    # joins under the lock so the scaler never sees it neither booting nor added
+                    self._join(server, asked_at, now)
+
+            if self.warming:
+                self._warm(now)
+
+    def _join(self, server, asked_at, now):
+        """
+        A cold started server finished booting, add it with some of its slots open
+        """
+        self.time_to_first_slot.record(now - asked_at)
+
+        if self.warmup_time > 0 and self.warmup_capacity < 1:
+            server.limit_slots(max(1, math.ceil(server.max_capacity * self.warmup_capacity)), owner=self)
+            self.warming.append((server, now, asked_at))
+        else:
+            self.time_to_capacity.record(now - asked_at)
+
+        self.load_balancer.add_server(server)
+        events.info("server_booted", "{server_id} booted after {seconds:.1f}s", server_id=server.server_id, seconds=now - asked_at)
+
+    def _warm(self, now):
+        """
+        Open slots on warming servers in a straight line to full over warmup_time
+        """
+        still_warming = []
+        for server, joined_at, asked_at in self.warming:
+            if server.status == ServerStatus.DRAINING:
+                # warming carries on if the drain is cancelled, forget it once it is removed
+                if server in self.load_balancer.servers:
+                    still_warming.append((server, joined_at, asked_at))
+                continue
+
+            # a health trial owns the slots for now, limit_slots refuses and warming picks up after it
+            done = (now - joined_at) / self.warmup_time
+            if done >= 1:
+                if server.limit_slots(None, owner=self):
+                    self.time_to_capacity.record(now - asked_at)
+                    continue
+            else:
+                limit = math.ceil(server.max_capacity * (self.warmup_capacity + (1 - self.warmup_capacity) * done))
+                if limit != server.slot_limit:
+                    server.limit_slots(limit, owner=self)
+            still_warming.append((server, joined_at, asked_at))
+        self.warming = still_warming
+
+    def get_stats(self):
+        """
+        Get provisioner stats
+        """
+        first_slot = self.time_to_first_slot.percentiles((50, 99))
+        capacity = self.time_to_capacity.percentiles((50, 99))
+        return {
+            "standby_ready": len(self.pool),
+            "booting": len(self.booting),
+            "warming": len(self.warming),
+            "promotions": self.promotions,
+            "cold_starts": self.cold_starts,
+            "boots_cancelled": self.boots_cancelled,
+            "p50_time_to_first_slot": first_slot[50],
+            "p99_time_to_first_slot": first_slot[99],
+            "p50_time_to_capacity": capacity[50],
+            "p99_time_to_capacity": capacity[99]
+        }
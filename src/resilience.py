@@ -0,0 +1,346 @@
+import time
+import heapq
+import itertools
+import threading
+from .histogram import LatencyHistogram
+from .event_log import events
+
+
+class RetryBudget:
+    def __init__(self, ratio=0.2, min_per_second=0.1, max_tokens=10.0, clock=time.perf_counter):
+        """
+        Caps retries and hedges at a share of the real requests, so a sick cluster cant be buried in retries
+
+        Every new request adds ratio tokens and every retry or hedge spends one, so
+        extra attempts stay under ratio of the traffic however bad things get. A
+        trickle of min_per_second tokens lets quiet clusters retry too. At most
+        max_tokens are saved up for a burst of failures.
+
+        Arguments:
+            ratio: Retries and hedges allowed per request, 0.2 is one for every five
+            min_per_second: Tokens added every second whatever the traffic
+            max_tokens: Most tokens that can be saved up
+            clock: Function returning the time in seconds, the simulation passes its virtual clock
+        """
+
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.clock = clock
+
+        self.tokens = max_tokens
+        self.last_refill = clock()
+        self.spent = 0
+        self.denied = 0
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        """
+        A new request came in, O(1)
+        """
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self, keep=0.0):
+        """
+        Take a token for a retry or hedge, False if the budget is used up
+
+        Arguments:
+            keep: Tokens that must be left after spending, so lower priority spends leave some for the rest
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.max_tokens, self.tokens + (now - self.last_refill) * self.min_per_second)
+            self.last_refill = now
+
+            if self.tokens < 1 + keep:
+                self.denied += 1
+                return False
+
+            self.tokens -= 1
+            self.spent += 1
+            return True
+
+    def refund(self):
+        """
+        Give back a token that ended up not being used
+        """
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + 1)
+            self.spent -= 1
+
+
+class TimerThread:
+    def __init__(self):
+        """
+        Runs callbacks after a delay on one background thread, so a hedge timer doesnt cost a thread each
+        """
+
+        self.timers = [] # heap of (due, order, callback)
+        self.order = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    def call_later(self, delay, callback):
+        """
+        Run callback in delay seconds
+        """
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="hedge-timers", daemon=True)
+                self.thread.start()
+            heapq.heappush(self.timers, (time.perf_counter() + delay, next(self.order), callback))
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.stopped and (not self.timers or self.timers[0][0] > time.perf_counter()):
+                    self.condition.wait(self.timers[0][0] - time.perf_counter() if self.timers else None)
+                if self.stopped:
+                    return
+                _, _, callback = heapq.heappop(self.timers)
+            callback()
+
+    def stop(self):
+        """
+        Drop every timer not run yet
+        """
+        with self.condition:
+            self.stopped = True
+            self.timers = []
+            self.condition.notify()
+
+
+class Attempt:
+    __slots__ = ("request_id", "key", "arrived", "tried", "running", "retries", "hedged", "hedge_server", "done")
+
+    def __init__(self, request_id, key, arrived):
+        """
+        One request and every copy of it sent to a server
+        """
+        self.request_id = request_id
+        self.key = key
+        self.arrived = arrived
+        self.tried = set() # server ids it was sent to
+        self.running = 0 # copies still on a server
+        self.retries = 0
+        self.hedged = False # hedged or retried, either way no more hedging
+        self.hedge_server = None
+        self.done = False # a copy answered, or it failed for good
+
+
+class ResilienceLayer:
+    def __init__(self, load_balancer, max_retries=2, budget=None, hedge_percentile=None, hedge_min_delay=0.0, hedge_min_samples=20,
+                 hedge_refresh=1.0, call_later=None, clock=time.perf_counter):
+        """
+        Retries failed requests on another server and hedges slow ones, the first answer wins
+
+        A request that fails on its server is sent to a server it hasnt tried yet,
+        up to max_retries times. With hedge_percentile set, a request still running
+        after that percentile of service time gets one copy on another server, and
+        whichever copy finishes first answers it. The losing copy still runs to the
+        end, like a request the client stopped waiting for, and its answer is thrown away.
+
+        Retries and hedges both spend from one RetryBudget for the whole cluster, so
+        when every server is failing the extra load stays a small share of the traffic
+        instead of multiplying it. Copies only go to servers with a free slot right now,
+        they never wait in the admission queue.
+
+        Arguments:
+            load_balancer: LoadBalancer whose requests are looked after
+            max_retries: Most times one request is retried
+            budget: RetryBudget shared by retries and hedges, defaults to 20% of requests
+            hedge_percentile: Service time percentile after which a copy is sent, None for no hedging
+            hedge_min_delay: Never hedge sooner than this many seconds
+            hedge_min_samples: Finished requests needed before hedging starts
+            hedge_refresh: Seconds between recomputing the hedge delay
+            call_later: Function (delay, callback) that runs callback later, defaults to a TimerThread
+            clock: Function returning the time in seconds, the simulation passes its virtual clock
+        """
+
+        self.load_balancer = load_balancer
+        self.max_retries = max_retries
+        self.budget = budget or RetryBudget(clock=clock)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_refresh = hedge_refresh
+        self.clock = clock
+
+        self.timer_thread = None
+        if call_later is None and hedge_percentile is not None:
+            self.timer_thread = TimerThread()
+            call_later = self.timer_thread.call_later
+        self.call_later = call_later
+
+        self.attempts = {} # request_id -> Attempt, while a copy is on a server
+        self.lock = threading.Lock()
+
+        self.hedge_delay = None # seconds, None until there are enough samples
+        self.hedge_delay_at = None
+
+        # per request, not per copy, so a hedge that wins shows up here
+        self.latency = LatencyHistogram()
+        self.retries = 0
+        self.retries_succeeded = 0
+        self.hedges = 0
+        self.hedges_won = 0
+        self.failed = 0 # requests that failed on every copy
+
+    def on_dispatch(self, server, request_id, key=None, queue_wait=0.0):
+        """
+        A request was sent to its first server, start looking after it
+
+        Called for every routed request, so it is O(1)
+        """
+        now = self.clock()
+        attempt = Attempt(request_id, key, now - queue_wait)
+        attempt.tried.add(server.server_id)
+        attempt.running = 1
+
+        with self.lock:
+            self.attempts[request_id] = attempt
+        self.budget.deposit()
+
+        if self.hedge_percentile is not None:
+            self._arm(attempt, now)
+
+    def _arm(self, attempt, dispatched):
+        """
+        Time the hedge for a request, until there are enough samples to know the delay keep asking again
+        """
+        if attempt.done:
+            return
+
+        now = self.clock()
+        delay = self._hedge_delay(now)
+        if delay is None:
+            self.call_later(self.hedge_refresh, lambda: self._arm(attempt, dispatched))
+        else:
+            self.call_later(max(0.0, dispatched + delay - now), lambda: self._hedge(attempt))
+
+    def _hedge_delay(self, now):
+        """
+        How long to wait before hedging, refreshed every hedge_refresh seconds
+        """
+        if self.hedge_delay_at is not None and now - self.hedge_delay_at < self.hedge_refresh:
+            return self.hedge_delay
+
+        service = self.load_balancer.timings.service
+        self.hedge_delay_at = now
+        if service.count >= self.hedge_min_samples:
+            self.hedge_delay = max(self.hedge_min_delay, service.percentile(self.hedge_percentile))
+        return self.hedge_delay
+
+    def _hedge(self, attempt):
+        """
+        The hedge delay passed, send a copy if the request is still running
+        """
+        with self.lock:
+            if attempt.done or attempt.hedged:
+                return
+            attempt.hedged = True
+
+        # hedges only spend the top half of the budget, the rest is kept for retrying failures
+        if not self.budget.try_spend(keep=self.budget.max_tokens / 2):
+            return
+
+        server = self.load_balancer._route_copy(attempt.request_id, attempt.key, attempt.tried)
+        if server is None:
+            # every other server is full, look again after another delay
+            self.budget.refund()
+            with self.lock:
+                attempt.hedged = attempt.done
+            if not attempt.done:
+                self.call_later(self.hedge_delay, lambda: self._hedge(attempt))
+            return
+
+        with self.lock:
+            attempt.tried.add(server.server_id)
+            attempt.running += 1
+            attempt.hedge_server = server.server_id
+            self.hedges += 1
+
+        # counted before it is sent, an inline dispatcher finishes it before submit returns
+        self.load_balancer.dispatcher.submit(server, attempt.request_id)
+
+    def on_finish(self, server, request_id, failed):
+        """
+        A copy finished, answer the request or retry it on another server
+        """
+        with self.lock:
+            attempt = self.attempts.get(request_id)
+            if attempt is None:
+                return # not one of ours
+
+            attempt.running -= 1
+            if attempt.done:
+                # the other copy already answered
+                if not attempt.running:
+                    del self.attempts[request_id]
+                return
+
+            if not failed:
+                attempt.done = True
+                if not attempt.running:
+                    del self.attempts[request_id]
+                if attempt.retries:
+                    self.retries_succeeded += 1
+                if server.server_id == attempt.hedge_server:
+                    self.hedges_won += 1
+                self.latency.record(self.clock() - attempt.arrived)
+                return
+
+            if attempt.running:
+                return # a hedge copy is still running and may answer
+
+            retry = attempt.retries < self.max_retries
+            if retry:
+                attempt.retries += 1
+                attempt.hedged = True # a retry is never hedged as well
+
+        if retry and self.budget.try_spend():
+            copy = self.load_balancer._route_copy(request_id, attempt.key, attempt.tried)
+            if copy is not None:
+                with self.lock:
+                    attempt.tried.add(copy.server_id)
+                    attempt.running += 1
+                    self.retries += 1
+                self.load_balancer.dispatcher.submit(copy, request_id)
+                return
+            self.budget.refund()
+
+        with self.lock:
+            attempt.done = True
+            self.attempts.pop(request_id, None)
+            self.failed += 1
+        if events.debug_enabled:
+            events.debug("request_failed", "Request {request_id} failed on {server_id}, not retried", request_id=request_id, server_id=server.server_id)
+
+    def stop(self):
+        """
+        Stop the hedge timers
+        """
+        if self.timer_thread:
+            self.timer_thread.stop()
+
+    def get_stats(self):
+        """
+        Get retry and hedging stats, the latencies are per request
+        """
+        latency = self.latency.percentiles((50, 95, 99))
+        return {
+            "retries": self.retries,
+            "retries_succeeded": self.retries_succeeded,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "retry_budget_spent": self.budget.spent,
+            "retry_budget_denied": self.budget.denied,
+            "requests_failed_on_server": self.failed,
+            "hedge_delay": self.hedge_delay or 0.0,
+            "p50_latency": latency[50],
+            "p95_latency": latency[95],
+            "p99_latency": latency[99]
+        }
@@ -0,0 +1,208 @@
+import math
+from enum import Enum
+from collections import deque
+
+class ScalingMode(Enum):
+    THRESHOLD = "threshold" # add or remove one server when util crosses fixed lines (original behaviour)
+    PREDICTIVE = "predictive" # forecast demand and jump straight to the servers needed
+
+
+class HoltForecast:
+    def __init__(self, alpha=0.5, beta=0.2):
+        """
+        Holt's linear smoothing (an EWMA of the level plus an EWMA of the trend)
+
+        Handles readings at uneven times, the trend is kept per second
+
+        Arguments:
+            alpha: How much each new reading moves the level, higher reacts faster but is noisier
+            beta: How much each new reading moves the trend
+        """
+
+        self.alpha = alpha
+        self.beta = beta
+        self.level = None
+        self.trend = 0.0 # change per second
+        self.last_time = None
+
+    def update(self, value, now):
+        """
+        Add a reading taken at now
+        """
+        if self.level is None:
+            self.level = value
+            self.last_time = now
+            return
+
+        elapsed = now - self.last_time
+        if elapsed <= 0:
+            return
+
+        previous = self.level
+        self.level = self.alpha * value + (1 - self.alpha) * (previous + self.trend * elapsed)
+        self.trend = self.beta * (self.level - previous) / elapsed + (1 - self.beta) * self.trend
+        self.last_time = now
+
+    def forecast(self, ahead):
+        """
+        Expected value ahead seconds from the last reading, never below 0
+        """
+        if self.level is None:
+            return 0.0
+        return max(0.0, self.level + self.trend * ahead)
+
+
+class ThresholdPolicy:
+    def __init__(self, scale_up_at=70, scale_down_at=30, cooldown=10):
+        """
+        Add a server above scale_up_at util, remove one below scale_down_at
+
+        Arguments:
+            scale_up_at: Util % that adds a server
+            scale_down_at: Util % that removes a server
+            cooldown: Seconds after a change before the next one
+        """
+
+        self.mode = ScalingMode.THRESHOLD
+        self.scale_up_at = scale_up_at
+        self.scale_down_at = scale_down_at
+        self.cooldown = cooldown
+        self.last_decision = None
+
+    def desired_servers(self, stats, now, last_scale_time):
+        """
+        How many servers there should be given the current load balancer stats
+        """
+        server_count = stats["total_servers"]
+
+        # not too often
+        if now - last_scale_time < self.cooldown:
+            return server_count
+
+        if stats["util"] > self.scale_up_at:
+            desired = server_count + 1
+        elif stats["util"] < self.scale_down_at:
+            desired = server_count - 1
+        else:
+            desired = server_count
+
+        self.last_decision = {"util": stats["util"], "desired": desired}
+        return desired
+
+    def get_stats(self):
+        """
+        Get policy stats
+        """
+        stats = {"policy": self.mode.value}
+        stats.update(self.last_decision or {})
+        return stats
+
+
+class PredictivePolicy:
+    def __init__(self, target_util=60, horizon=10, alpha=0.5, beta=0.2, scale_down_window=60, default_service_time=0.5, min_interval=1.0):
+        """
+        Forecast demand over the provisioning horizon and size the pool for target_util
+
+        Two things are smoothed with HoltForecast: requests in the system
+        (running plus waiting) and the arrival rate. Arrival rate times the mean service
+        time is the load that is coming (Littles law), so a spike that has started
+        arriving shows up before the servers fill. The larger forecast at horizon seconds
+        sets how many servers are needed, and the pool jumps straight there.
+
+        Scaling down waits until every forecast over scale_down_window seconds wanted
+        fewer servers, so one quiet moment in bursty traffic does not remove servers
+        that are needed again seconds later.
+
+        Checks can come milliseconds apart when the scaler is woken by load signals,
+        a rate or trend over such a short gap is mostly noise, so the forecasts only
+        take a reading every min_interval. Whats in the system right now is always
+        used as a floor, so a spike is still acted on the moment it is seen.
+
+        Arguments:
+            target_util: Util % to size the pool for, leaves room for what the forecast misses
+            horizon: Seconds ahead to plan for, about how long a new server takes to help
+            alpha: Level smoothing for the forecasts
+            beta: Trend smoothing for the forecasts
+            scale_down_window: Seconds every forecast must agree before removing servers
+            default_service_time: Seconds per request to assume before any have finished
+            min_interval: Fewest seconds between forecast readings
+        """
+
+        self.mode = ScalingMode.PREDICTIVE
+        self.target_util = target_util
+        self.horizon = horizon
+        self.scale_down_window = scale_down_window
+        self.default_service_time = default_service_time
+        self.min_interval = min_interval
+
+        self.in_system = HoltForecast(alpha, beta)
+        self.arrival_rate = HoltForecast(alpha, beta)
+        self.last_total = None
+        self.last_time = None
+
+        self.recent = deque() # (time, servers needed) inside the scale down window
+        self.last_decision = None
+
+    def desired_servers(self, stats, now, last_scale_time):
+        """
+        How many servers there should be given the current load balancer stats
+        """
+        server_count = stats["total_servers"]
+
+        # requests running or waiting right now
+        in_system = stats["current_load"] + stats.get("queue_depth", 0)
+        total = stats["total_requests_routed"]
+
+        if self.last_time is None:
+            self.in_system.update(in_system, now)
+            self.last_total = total
+            self.last_time = now
+        elif now - self.last_time >= self.min_interval:
+            self.in_system.update(in_system, now)
+            self.arrival_rate.update((total - self.last_total) / (now - self.last_time), now)
+            self.last_total = total
+            self.last_time = now
+
+        service_time = stats.get("mean_service_time") or self.default_service_time
+        demand = max(in_system, self.in_system.forecast(self.horizon), self.arrival_rate.forecast(self.horizon) * service_time)
+
+        per_server = stats["total_capacity"] / max(1, server_count)
+        needed = math.ceil(demand / max(1e-9, per_server * self.target_util / 100))
+
+        self.recent.append((now, needed))
+        while self.recent and now - self.recent[0][0] > self.scale_down_window:
+            self.recent.popleft()
+
+        if needed >= server_count:
+            desired = needed
+        else:
+            # only come down as far as the busiest forecast in the window allows, never up
+            desired = min(server_count, max(n for _, n in self.recent))
+
+        self.last_decision = {
+            "demand": demand,
+            "arrival_rate": self.arrival_rate.forecast(0),
+            "service_time": service_time,
+            "needed": needed,
+            "desired": desired
+        }
+        return desired
+
+    def get_stats(self):
+        """
+        Get policy stats
+        """
+        stats = {"policy": self.mode.value}
+        stats.update(self.last_decision or {})
+        return stats
+
+
+def create_policy(mode=ScalingMode.THRESHOLD, **options):
+    """
+    Build a scaling policy for the given mode
+    """
+
+    if mode == ScalingMode.PREDICTIVE:
+        return PredictivePolicy(**options)
+    else:
+        return ThresholdPolicy(**options)
@@ -1,16 +1,20 @@
 import time
 import random
+import asyncio
 import threading
 from enum import Enum
 from datetime import datetime
+from .histogram import RequestTimings
+from .event_log import events
 
 class ServerStatus(Enum):
     HEALTHY = "Healthy"
     OVERLOADED = "Overloaded"
     DOWN = "Down"
+    DRAINING = "Draining" # finishing its requests before it is removed, takes no new ones
 
 class Server:
-    def __init__(self, server_id, max_capacity=10, base_response_time=0.1):
+    def __init__(self, server_id, max_capacity=10, base_response_time=0.1, weight=None, clock=None):
         """
         Web server simulation
 
@@ -18,53 +22,252 @@ class Server:
         server_id : unique identifier for the server
         max_capacity: Max concurrent reqs the server can handle
         base_response_time: In seconds, how long the server takes to process a request
+        weight: Share of traffic for WEIGHTED routing, defaults to max_capacity
+        clock: Function returning the time in seconds for timing requests, the simulation passes its virtual clock
         """
         self.server_id = server_id
         self.max_capacity = max_capacity
+        self.slot_limit = max_capacity # slots open to new requests, see limit_slots
+        self.slot_owner = None # whoever set slot_limit, like a warm-up or a health trial
         self.base_response_time = base_response_time
+        self.weight = weight
+        self.clock = clock or time.perf_counter
 
         # Current state
         self.current_requests = 0
+        self.peak_requests = 0
         self.total_requests_handled = 0
         self.status = ServerStatus.HEALTHY
         self.last_request_time = None
+        self.errors = 0
+        self.consecutive_errors = 0
+
+        # faults for testing health checks, see degrade
+        self.slowdown = 1.0
+        self.error_rate = 0.0
+        self.reachable = True
+        self.rng = random
+
+        # latency histograms, the load balancer sets the parent so its totals get every request too
+        self.timings = RequestTimings()
+
+        # called with (server, request_id, failed) as each request finishes, the load balancer sets it to retry failures
+        self.on_finish = None
 
         # Thread safety
         self.lock = threading.Lock()
 
-        print(f"Server {self.server_id} initialized with max capacity {self.max_capacity} and base response time {self.base_response_time}s")
+        # called with this server whenever its load or status changes
+        self.listeners = []
+
+        events.info("server_created", "Server {server_id} initialized with max capacity {max_capacity} and base response time {base_response_time}s",
+                    server_id=server_id, max_capacity=max_capacity, base_response_time=base_response_time)
+
+    def add_listener(self, listener):
+        """
+        Get told whenever this servers load or status changes
+        """
+        # copy on write so _notify can loop without a lock
+        self.listeners = self.listeners + [listener]
+
+    def remove_listener(self, listener):
+        """
+        Stop getting told about changes
+        """
+        self.listeners = [l for l in self.listeners if l != listener]
+
+    def _notify(self):
+        """
+        Tell the listeners something changed, called outside the lock
+        """
+        for listener in self.listeners:
+            listener(self)
+
+    def get_weight(self):
+        """
+        Weight used by WEIGHTED routing
+        """
+        return self.weight if self.weight is not None else self.max_capacity
+
+    def set_weight(self, weight):
+        """
+        Change the weight, None goes back to using max_capacity
+        """
+        self.weight = weight
+        self._notify()
+
+    def set_status(self, status):
+        """
+        Change the status, listeners are told so routing sees it straight away
+        """
+        with self.lock:
+            changed = self.status != status
+            self.status = status
+
+        if changed:
+            self._notify()
+
+    def limit_slots(self, limit=None, owner=None):
+        """
+        Take at most limit requests at once, None opens every slot again
+
+        Used to let only a trickle of requests through, like a server on trial
+        after being ejected. max_capacity is unchanged
+
+        A limit set with an owner can only be changed or cleared by that owner, so a
+        warm-up and a health trial never undo each other. Returns False if refused
+
+        Arguments:
+            limit: Most requests at once, None for max_capacity
+            owner: Who is setting the limit
+        """
+        if self.slot_owner is not None and self.slot_owner is not owner:
+            return False
+
+        self.slot_limit = self.max_capacity if limit is None else min(limit, self.max_capacity)
+        self.slot_owner = None if limit is None else owner
+        self._notify()
+        return True
+
+    def degrade(self, slowdown=1.0, error_rate=0.0, reachable=True, rng=None):
+        """
+        Inject a fault, degrade() with no arguments makes the server well again
+
+        Arguments:
+            slowdown: Response times are multiplied by this
+            error_rate: Chance each finished request counts as an error
+            reachable: False makes every probe fail, like a crashed process
+            rng: Source of randomness for the errors
+        """
+        self.slowdown = slowdown
+        self.error_rate = error_rate
+        self.reachable = reachable
+        if rng is not None:
+            self.rng = rng
+
+    def probe(self):
+        """
+        Active health check, True if the server answers
+
+        Simulated servers answer unless made unreachable with degrade
+        """
+        return self.reachable
 
     def can_handle_request(self):
         # Can the server take more requests -- checker
-        return self.current_requests < self.max_capacity and self.status == ServerStatus.HEALTHY
+        return self.current_requests < self.slot_limit and self.status == ServerStatus.HEALTHY
 
-    def process_request(self, request_id):
+    def reserve_slot(self):
         """
-        Simulate processing web request
+        Take a slot for a request that will start soon, returns False if the server is full
 
-        Runs by its own thread for concurrency processing
+        The load balancer reserves when it routes, so requests still on their way to
+        the server already count and two requests can never be routed to the last slot
         """
 
         with self.lock:
             if not self.can_handle_request():
-                return False # server full or down
-            
+                return False
+
             self.current_requests += 1
+            if self.current_requests > self.peak_requests:
+                self.peak_requests = self.current_requests
+
+        self._notify()
+        return True
+
+    def process_request(self, request_id, queue_wait=0.0, reserved=False):
+        """
+        Simulate processing web request
+
+        Runs by its own thread for concurrency processing
+
+        Arguments:
+            request_id: The request
+            queue_wait: How long the request waited between routing and now, in seconds
+            reserved: A slot was already taken with reserve_slot
+        """
+
+        started = self.clock()
+        processing_time = self._begin_request(request_id, reserved)
+        if processing_time is None:
+            return False # server full or down
+
+        # Show that work is being done
+        time.sleep(processing_time)
+
+        self._finish_request(request_id, started, queue_wait)
+        return True
+
+    async def process_request_async(self, request_id, queue_wait=0.0, reserved=False):
+        """
+        Same as process_request but awaits the service time on the event loop
+        """
+
+        started = self.clock()
+        processing_time = self._begin_request(request_id, reserved)
+        if processing_time is None:
+            return False # server full or down
+
+        await asyncio.sleep(processing_time)
+
+        self._finish_request(request_id, started, queue_wait)
+        return True
+
+    def _begin_request(self, request_id, reserved=False):
+        """
+        Start the request, returns how long it will take or None if it cant be taken
+
+        Takes a slot first unless one was already reserved for it
+        """
+
+        with self.lock:
+            if not reserved:
+                if not self.can_handle_request():
+                    return None
+
+                self.current_requests += 1
+                if self.current_requests > self.peak_requests:
+                    self.peak_requests = self.current_requests
+
             self.total_requests_handled += 1
             self.last_request_time = datetime.now()
-        
+
+        if not reserved:
+            self._notify()
+
         processing_time = self.calculate_response_time()
-        print(f"Server {self.server_id} processing request {request_id} (will take {processing_time:.2f}s)")
+        if events.debug_enabled:
+            events.debug("request_started", "Server {server_id} processing request {request_id} (will take {processing_time:.2f}s)",
+                         server_id=self.server_id, request_id=request_id, processing_time=processing_time)
+        return processing_time
 
-        # Show that work is being done
-        time.sleep(processing_time)
+    def _finish_request(self, request_id, started=None, queue_wait=0.0):
+        """
+        Request done, give the slot back and record how long it took
+        """
+
+        failed = bool(self.error_rate) and self.rng.random() < self.error_rate
 
-        # Request done
         with self.lock:
             self.current_requests -= 1
-        
-        print(f"Server {self.server_id} completed request {request_id}")
-        return True
+            if failed:
+                self.errors += 1
+                self.consecutive_errors += 1
+            else:
+                self.consecutive_errors = 0
+
+        self._notify()
+
+        if started is not None:
+            self.timings.record(queue_wait, self.clock() - started)
+
+        if self.on_finish:
+            self.on_finish(self, request_id, failed)
+
+        if events.debug_enabled:
+            events.debug("request_completed", "Server {server_id} completed request {request_id}",
+                         server_id=self.server_id, request_id=request_id)
 
     def calculate_response_time(self):
         """
@@ -73,32 +276,31 @@ class Server:
         load_factor = self.current_requests / self.max_capacity
 
         # When server is busy, response time decreases
-        response_time = self.base_response_time * (1 + load_factor)
+        response_time = self.base_response_time * (1 + load_factor) * self.slowdown
 
         return response_time
     
     def get_stats(self):
         """
-        Gets the current server stats
+        Gets the current server stats, only reads so looking never changes where requests go
         """
 
         with self.lock:
             util = (self.current_requests / self.max_capacity) * 100
-
-            # update status based on load
-            if util > 90:
-                self.status = ServerStatus.OVERLOADED
-            elif util < 70:
-                self.status = ServerStatus.HEALTHY
-            
-            return {
+            stats = {
                 "server_id": self.server_id,
                 "current_requests": self.current_requests,
+                "max_capacity": self.max_capacity,
+                "peak_requests": self.peak_requests,
                 "total_handled": self.total_requests_handled,
                 "util": util,
                 "status": self.status.value,
+                "errors": self.errors,
                 "last_request": self.last_request_time
             }
+
+        stats.update(self.timings.get_stats())
+        return stats
         
     def __str__(self):
         stats = self.get_stats()
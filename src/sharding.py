@@ -0,0 +1,372 @@
+import os
+import time
+import random
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from .server import Server
+from .load_balancer import LoadBalancer, RoutingAlgo
+from .dispatcher import DispatchMode, create_dispatcher
+from .traffic_generator import TrafficGenerator, TrafficPattern
+from .consistent_hash import stable_hash
+from .event_log import events, quiet, LogLevel
+from .metrics_segment import SeqlockBlock
+
+# one row of these per shard in shared memory, all int64
+METRIC_FIELDS = (
+    "total_servers",
+    "healthy_servers",
+    "total_requests_routed",
+    "failed_requests",
+    "total_capacity",
+    "current_load",
+    "completed",
+    "queue_depth",
+    "p99_latency_us"
+)
+
+
+class ShardMetrics:
+    def __init__(self, shards):
+        """
+        Per shard stats in a shared memory block so the coordinator can read them without asking
+
+        Every shard owns one row and is the only process that writes it. Rows are
+        SeqlockBlocks, so a read never sees half of a publish and readers never lock.
+
+        Arguments:
+            shards: Number of rows
+        """
+
+        self.shards = shards
+        self.row = SeqlockBlock("q" * len(METRIC_FIELDS))
+        self.memory = shared_memory.SharedMemory(create=True, size=shards * self.row.size)
+        self.memory.buf[:] = bytes(shards * self.row.size)
+        self.last = [None] * shards # last consistent read of each row
+
+    def write(self, shard, stats):
+        """
+        Publish a shards stats into its row
+        """
+        self.row.write(self.memory.buf, shard * self.row.size, [int(stats[field]) for field in METRIC_FIELDS])
+
+    def read(self, shard):
+        """
+        One shards last published stats, publishes is how many times it has published
+
+        If the shard was mid publish on every try the previous read is returned
+        (zeros before the first), a row is never left half written for long
+        """
+        result = self.row.read(self.memory.buf, shard * self.row.size)
+        if result is None:
+            result = self.last[shard] or (0, (0,) * len(METRIC_FIELDS))
+        self.last[shard] = result
+
+        sequence, values = result
+        stats = dict(zip(METRIC_FIELDS, values))
+        stats["publishes"] = sequence // 2
+        return stats
+
+    def close(self, unlink=False):
+        """
+        Let go of the shared memory, the coordinator also unlinks it
+        """
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def _publish(lb, metrics, index, lock):
+    """
+    Copy a shards load balancer stats into its shared memory row
+
+    The publisher thread and the command loop both publish, the lock keeps the
+    row to one writer at a time as SeqlockBlock needs
+    """
+    stats = lb.get_stats()
+    stats["p99_latency_us"] = stats["p99_latency"] * 1_000_000
+    with lock:
+        metrics.write(index, stats)
+
+
+def _shard_main(index, servers, options, inbox, replies, metrics):
+    """
+    Body of one shard process
+
+    Owns an ordinary LoadBalancer with its own servers, lock and dispatcher, so
+    routing here never touches another shards GIL
+    """
+
+    with quiet(options["log_level"]):
+        lb = LoadBalancer(RoutingAlgo(options["rounting_algo"]), dispatcher=create_dispatcher(DispatchMode(options["dispatch_mode"])),
+                          queue_size=options["queue_size"], queue_timeout=options["queue_timeout"])
+        for server_id, max_capacity, base_response_time in servers:
+            lb.add_server(Server(server_id, max_capacity, base_response_time))
+
+        running = True
+        traffic = None
+        publish_lock = threading.Lock()
+
+        def publisher():
+            while running:
+                _publish(lb, metrics, index, publish_lock)
+                time.sleep(options["publish_interval"])
+
+        publish_thread = threading.Thread(target=publisher, daemon=True)
+        publish_thread.start()
+
+        while True:
+            command, payload = inbox.get()
+
+            if command == "route":
+                for request_id, key in payload:
+                    lb.route_request(request_id, key)
+
+            elif command == "route_local":
+                # routing heavy work generated right here, nothing crosses a process boundary per request
+                count, prefix = payload
+                start = time.perf_counter()
+                for i in range(count):
+                    lb.route_request(f"{prefix}-{i}")
+                replies.put((index, "route_local", time.perf_counter() - start))
+
+            elif command == "traffic":
+                pattern, seed = payload
+                if traffic is None:
+                    traffic = TrafficGenerator(lb, TrafficPattern[pattern], rng=random.Random(f"shard-{index}-{seed}"))
+                    traffic.start()
+
+            elif command == "stop_traffic":
+                if traffic:
+                    traffic.stop()
+                    traffic = None
+
+            elif command == "add_server":
+                server_id, max_capacity, base_response_time = payload
+                lb.add_server(Server(server_id, max_capacity, base_response_time))
+
+            elif command == "remove_server":
+                lb.remove_server(payload)
+
+            elif command == "stop":
+                break
+
+            _publish(lb, metrics, index, publish_lock)
+
+        if traffic:
+            traffic.stop()
+        running = False
+        lb.shutdown()
+        _publish(lb, metrics, index, publish_lock)
+        replies.put((index, "stopped", None))
+
+
+class ShardedLoadBalancer:
+    def __init__(self, servers, shards=None, rounting_algo=RoutingAlgo.ROTATING, dispatch_mode=DispatchMode.PER_SERVER_POOL,
+                 batch_size=256, flush_interval=0.01, queue_size=10, queue_timeout=2.0, publish_interval=0.05, log_level=LogLevel.WARNING):
+        """
+        Load balancer split across processes so routing can use every core
+
+        Each shard is a process with its own LoadBalancer and a partition of the
+        servers. This coordinator only picks a shard for each request: keyed
+        requests by hashing the key (so a session always lands on the same shard)
+        and the rest in turn. Requests are sent to shards in batches, because
+        sending them one at a time would cost more than routing them.
+
+        Shards publish their stats into shared memory (ShardMetrics) and get_stats
+        adds the rows up without talking to the shards.
+
+        Feeding every request through the coordinator is still one process, so for
+        full throughput give the shards their own traffic (start_traffic or route_local).
+
+        Arguments:
+            servers: List of (server_id, max_capacity, base_response_time), dealt out across the shards
+            shards: Number of shard processes, defaults to one per core
+            rounting_algo: Routing algorithm inside each shard
+            dispatch_mode: How each shard runs its requests
+            batch_size: Requests buffered per shard before they are sent
+            flush_interval: Seconds before a part filled batch is sent anyway
+            queue_size: Admission queue size per server inside each shard
+            queue_timeout: Admission queue timeout inside each shard
+            publish_interval: Seconds between each shards stats publishes
+            log_level: Event log level inside the shards, quiet by default since every shard logs its own servers
+        """
+
+        self.shard_count = shards or os.cpu_count() or 1
+        self.rounting_algo = rounting_algo
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        options = {
+            "rounting_algo": rounting_algo.value,
+            "dispatch_mode": dispatch_mode.value,
+            "queue_size": queue_size,
+            "queue_timeout": queue_timeout,
+            "publish_interval": publish_interval,
+            "log_level": log_level
+        }
+
+        self.metrics = ShardMetrics(self.shard_count)
+        self.replies = multiprocessing.Queue()
+        self.inboxes = []
+        self.processes = []
+        self.server_shards = {} # server_id -> shard index
+
+        for index in range(self.shard_count):
+            partition = servers[index::self.shard_count]
+            for server_id, _, _ in partition:
+                self.server_shards[server_id] = index
+
+            inbox = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_shard_main, args=(index, partition, options, inbox, self.replies, self.metrics),
+                                              name=f"shard-{index}", daemon=True)
+            process.start()
+            self.inboxes.append(inbox)
+            self.processes.append(process)
+
+        # requests waiting to be sent to each shard
+        self.pending = [[] for _ in range(self.shard_count)]
+        self.next_shard = 0
+        self.lock = threading.Lock()
+
+        self.is_running = True
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+        events.info("sharded_lb_created", "Sharded Load Balancer started {shards} shards with {servers} servers",
+                    shards=self.shard_count, servers=len(servers))
+
+    def route_request(self, request_id, key=None):
+        """
+        Pick a shard for the request and queue it for that shard
+
+        Returns True once it is queued, whether it succeeds is only known inside
+        the shard and shows up in get_stats
+        """
+
+        with self.lock:
+            if key is not None:
+                shard = stable_hash(str(key)) % self.shard_count
+            else:
+                shard = self.next_shard
+                self.next_shard = (self.next_shard + 1) % self.shard_count
+
+            batch = self.pending[shard]
+            batch.append((request_id, key))
+            if len(batch) < self.batch_size:
+                return True
+            self.pending[shard] = []
+
+        self.inboxes[shard].put(("route", batch))
+        return True
+
+    def flush(self):
+        """
+        Send every part filled batch now
+        """
+        with self.lock:
+            batches = self.pending
+            self.pending = [[] for _ in range(self.shard_count)]
+
+        for shard, batch in enumerate(batches):
+            if batch:
+                self.inboxes[shard].put(("route", batch))
+
+    def _flush_loop(self):
+        """
+        Send part filled batches every flush_interval so quiet traffic isnt held back
+        """
+        while self.is_running:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def route_local(self, requests_per_shard, prefix="local"):
+        """
+        Have every shard route requests_per_shard requests it makes itself, all at once
+
+        Returns the seconds from sending the command until the slowest shard finished
+        """
+
+        start = time.perf_counter()
+        for index, inbox in enumerate(self.inboxes):
+            inbox.put(("route_local", (requests_per_shard, f"{prefix}-{index}")))
+
+        for _ in range(self.shard_count):
+            self.replies.get()
+        return time.perf_counter() - start
+
+    def start_traffic(self, pattern=TrafficPattern.BURST, seed=0):
+        """
+        Run a traffic generator inside every shard, each shard gets the pattern on its own servers
+        """
+        for inbox in self.inboxes:
+            inbox.put(("traffic", (pattern.name, seed)))
+
+    def stop_traffic(self):
+        """
+        Stop the traffic generators inside the shards
+        """
+        for inbox in self.inboxes:
+            inbox.put(("stop_traffic", None))
+
+    def add_server(self, server_id, max_capacity=3, base_response_time=0.4):
+        """
+        Add a server to the shard with the fewest servers
+        """
+        counts = [self.metrics.read(i)["total_servers"] for i in range(self.shard_count)]
+        shard = counts.index(min(counts))
+        self.server_shards[server_id] = shard
+        self.inboxes[shard].put(("add_server", (server_id, max_capacity, base_response_time)))
+
+    def remove_server(self, server_id):
+        """
+        Remove a server from whichever shard has it
+        """
+        shard = self.server_shards.pop(server_id, None)
+        if shard is None:
+            return False
+        self.inboxes[shard].put(("remove_server", server_id))
+        return True
+
+    def get_stats(self):
+        """
+        Cluster stats added up from every shards shared memory row, no messages sent
+        """
+
+        shards = [self.metrics.read(i) for i in range(self.shard_count)]
+        total = {field: sum(row[field] for row in shards) for field in METRIC_FIELDS}
+
+        return {
+            "shards": self.shard_count,
+            "total_servers": total["total_servers"],
+            "healthy_servers": total["healthy_servers"],
+            "total_requests_routed": total["total_requests_routed"],
+            "failed_requests": total["failed_requests"],
+            "success_rate": ((total["total_requests_routed"] - total["failed_requests"]) / max(1, total["total_requests_routed"])) * 100,
+            "total_capacity": total["total_capacity"],
+            "current_load": total["current_load"],
+            "util": (total["current_load"] / max(1, total["total_capacity"])) * 100,
+            "completed": total["completed"],
+            "queue_depth": total["queue_depth"],
+            # percentiles cant be added up, the worst shard is an upper bound
+            "worst_shard_p99_latency": max(row["p99_latency_us"] for row in shards) / 1_000_000,
+            "per_shard": shards
+        }
+
+    def shutdown(self):
+        """
+        Send what is buffered, stop every shard and free the shared memory
+        """
+        self.is_running = False
+        self.flusher.join()
+        self.flush()
+
+        for inbox in self.inboxes:
+            inbox.put(("stop", None))
+        for _ in range(self.shard_count):
+            self.replies.get()
+        for process in self.processes:
+            process.join()
+
+        self.metrics.close(unlink=True)
+        events.info("sharded_lb_stopped", "Sharded Load Balancer stopped")
@@ -0,0 +1,427 @@
+import heapq
+import random
+import itertools
+from enum import Enum
+from contextlib import contextmanager
+from .server import Server
+from .load_balancer import LoadBalancer, RoutingAlgo
+from .traffic_generator import TrafficGenerator, TrafficPattern
+from .trace_replay import TraceReplayGenerator
+from .arrivals import ArrivalProcess, OpenLoopGenerator, create_arrivals
+from .auto_scaler import AutoScaler
+from .dispatcher import DispatchMode
+from .admission import QueueScope
+from .scaling_policy import ScalingMode, create_policy
+from .event_log import quiet
+from .timeseries import MetricsHistory
+from .health import HealthChecker
+from .provisioning import Provisioner
+
+class EventType(Enum):
+    ARRIVAL = "arrival" # traffic generator sends its next batch
+    COMPLETION = "completion" # a server finishes a request
+    SCALER_TICK = "scaler_tick" # auto scaler checks the load
+    SAMPLE = "sample" # dashboard style stats sample
+    HEALTH_CHECK = "health_check" # health checker looks at every server
+    PROVISION = "provision" # provisioner finishes boots and warms servers up
+    HEDGE = "hedge" # a request ran past the hedge delay, maybe send a copy
+
+
+class SimulatedDispatcher:
+    def __init__(self, simulation):
+        """
+        Starts routed requests right away and schedules their completion on the virtual clock
+
+        Arguments:
+            simulation: The Simulation that owns the event queue
+        """
+
+        self.mode = DispatchMode.SIMULATED
+        self.simulation = simulation
+        self.submitted = 0
+
+    def attach(self, server):
+        """
+        Nothing to set up per server
+        """
+        pass
+
+    def detach(self, server):
+        """
+        Nothing to tear down per server
+        """
+        pass
+
+    def submit(self, server, request_id, queue_wait=0.0):
+        """
+        Start the request on its reserved slot now and finish it processing_time later
+        """
+        self.submitted += 1
+
+        started = self.simulation.now
+        processing_time = server._begin_request(request_id, reserved=True)
+
+        if server.current_requests > self.simulation.max_server_load:
+            self.simulation.max_server_load = server.current_requests
+
+        self.simulation.schedule(started + processing_time, EventType.COMPLETION, (server, request_id, started, queue_wait))
+
+    def shutdown(self):
+        """
+        Nothing to stop
+        """
+        pass
+
+    def get_stats(self):
+        """
+        Get dispatcher stats
+        """
+        return {
+            "mode": self.mode.value,
+            "workers": 0,
+            "submitted": self.submitted,
+            "threads_created": 0,
+            "queue_depth": 0,
+            "peak_queue_depth": 0
+        }
+
+
+class Simulation:
+    def __init__(self, pattern=TrafficPattern.BURST, duration=3600, seed=0, rounting_algo=RoutingAlgo.ROTATING,
+                 initial_servers=None, min_servers=2, max_servers=8, auto_scale=True, scaling=ScalingMode.THRESHOLD,
+                 event_driven_scaling=True, scaler_interval=5, sample_interval=1, sessions=None, queue_size=10, queue_timeout=2.0,
+                 queue_scope=QueueScope.SHARED, trace=None, trace_speed=1.0, arrivals=None, health_checks=False, health_interval=1.0,
+                 boot_time=0.0, warmup_time=0.0, warmup_capacity=0.25, standby=0, server_capacity=3, server_response_time=0.4, retries=0, retry_budget=0.2,
+                 hedge_percentile=None, quiet=True):
+        """
+        Discrete event simulation of the whole system on a virtual clock
+
+        Runs the real LoadBalancer, Server, TrafficGenerator and AutoScaler logic but
+        jumps from event to event instead of sleeping, so an hour of traffic takes seconds.
+        The same seed always gives the same result.
+
+        Arguments:
+            pattern: Which traffic pattern to simulate
+            duration: How many virtual seconds to simulate
+            seed: Seed for the traffic randomness
+            rounting_algo: Routing algorithm for the load balancer
+            initial_servers: List of (server_id, max_capacity, base_response_time), defaults to the main.py setup
+            min_servers: Auto scaler minimum
+            max_servers: Auto scaler maximum
+            auto_scale: Run the auto scaler or keep the server count fixed
+            scaling: Which auto scaler policy decides the server count
+            event_driven_scaling: Check the load when the load balancer publishes a signal instead of on a timer
+            scaler_interval: Virtual seconds between auto scaler checks when not event driven
+            sample_interval: Virtual seconds between stats samples
+            sessions: Number of user sessions the traffic carries as routing keys (None for no keys)
+            queue_size: Requests that may wait per server when every server is full, 0 rejects right away
+            queue_timeout: Virtual seconds a request may wait before it is dropped
+            queue_scope: One waiting queue for the cluster or one per server
+            trace: Trace file to replay instead of the pattern
+            trace_speed: How much faster than recorded to replay the trace
+            arrivals: Arrival model (see create_arrivals) to send open loop traffic from instead of the pattern
+            health_checks: Eject slow or failing servers with a HealthChecker
+            health_interval: Virtual seconds between health checks
+            boot_time: Virtual seconds a server the auto scaler adds takes to boot
+            warmup_time: Virtual seconds it then takes to open all its slots
+            warmup_capacity: Share of its slots open when it joins
+            standby: Warm servers kept ready for the auto scaler to promote
+            server_capacity: max_capacity of the servers the auto scaler adds
+            server_response_time: base_response_time of the servers the auto scaler adds
+            retries: Times a request that fails on its server is retried on another one
+            retry_budget: Retries and hedges allowed per request across the cluster
+            hedge_percentile: Send a copy of requests running longer than this percentile of service time, None for no hedging
+            quiet: Hide the per request output while running
+        """
+
+        if trace:
+            self.pattern = TrafficPattern.TRACE
+        elif arrivals:
+            self.pattern = TrafficPattern.OPEN_LOOP
+        else:
+            self.pattern = pattern
+        self.duration = duration
+        self.seed = seed
+        self.scaler_interval = scaler_interval
+        self.sample_interval = sample_interval
+        self.quiet = quiet
+
+        # virtual clock and event queue
+        self.now = 0.0
+        self.events = [] # heap of (time, sequence, event type, payload)
+        self.sequence = itertools.count() # keeps events at the same time in the order they were scheduled
+        self.events_processed = 0
+
+        self.rng = random.Random(seed)
+        self.max_server_load = 0 # most requests any one server had at once
+
+        with self._output():
+            # routing gets its own random stream so every algorithm sees the same traffic
+            self.load_balancer = LoadBalancer(rounting_algo, dispatcher=SimulatedDispatcher(self), rng=random.Random(f"routing-{seed}"),
+                                              queue_size=queue_size, queue_timeout=queue_timeout, queue_scope=queue_scope, clock=self.clock,
+                                              retries=retries, retry_budget=retry_budget, hedge_percentile=hedge_percentile,
+                                              call_later=self._call_later)
+
+            if initial_servers is None:
+                initial_servers = [("primary-1", 3, 0.4), ("primary-2", 4, 0.5)]
+            for server_id, max_capacity, base_response_time in initial_servers:
+                self.load_balancer.add_server(Server(server_id, max_capacity, base_response_time, clock=self.clock))
+
+            if trace:
+                self.traffic_generator = TraceReplayGenerator(self.load_balancer, trace, speed=trace_speed)
+            elif arrivals:
+                self.traffic_generator = OpenLoopGenerator(self.load_balancer, arrivals, sessions=sessions, rng=self.rng)
+            else:
+                self.traffic_generator = TrafficGenerator(self.load_balancer, pattern, rng=self.rng, sessions=sessions)
+            # servers start ready at once unless there is something to model
+            provisioned = auto_scale and (boot_time > 0 or warmup_time > 0 or standby > 0)
+            self.provisioner = Provisioner(self.load_balancer, boot_time, warmup_time, warmup_capacity, standby, server_capacity,
+                                           server_response_time, clock=self.clock) if provisioned else None
+            self.auto_scaler = AutoScaler(self.load_balancer, min_servers, max_servers, clock=self.clock, policy=create_policy(scaling),
+                                          event_driven=event_driven_scaling, check_interval=scaler_interval, server_capacity=server_capacity,
+                                          server_response_time=server_response_time, provisioner=self.provisioner) if auto_scale else None
+            self.health_checker = HealthChecker(self.load_balancer, health_interval, clock=self.clock) if health_checks else None
+
+        # only the latest scheduled scaler check runs, a signal can move it earlier
+        self.next_scaler_tick = None
+        if self.auto_scaler and event_driven_scaling:
+            self.load_balancer.triggers.subscribe(self._on_load_signal)
+
+        # results, sampled into fixed memory however long the run
+        self.history = MetricsHistory(self.load_balancer, interval=sample_interval, clock=self.clock)
+        self.server_seconds = 0.0 # how much server time we paid for
+        self.peak_servers = len(self.load_balancer.servers)
+        self.last_event_time = 0.0
+
+    def clock(self):
+        """
+        Current virtual time in seconds
+        """
+        return self.now
+
+    def schedule(self, at, event_type, payload=None):
+        """
+        Add an event to the queue
+        """
+        heapq.heappush(self.events, (at, next(self.sequence), event_type, payload))
+
+    def _call_later(self, delay, callback):
+        """
+        Run callback delay virtual seconds from now, how hedges are timed
+        """
+        self.schedule(self.now + delay, EventType.HEDGE, callback)
+
+    @contextmanager
+    def _output(self):
+        """
+        Only log warnings and errors while the simulation runs when quiet is set
+        """
+        if not self.quiet:
+            yield
+            return
+
+        with quiet():
+            yield
+
+    def _schedule_scaler_tick(self, at):
+        """
+        Make the next scaler check happen at at, earlier ones already queued are skipped
+        """
+        self.next_scaler_tick = at
+        self.schedule(at, EventType.SCALER_TICK)
+
+    def _on_load_signal(self, signal, util):
+        """
+        The load balancer crossed a line, check the load now instead of waiting for the next tick
+        """
+        if self.auto_scaler.is_running and (self.next_scaler_tick is None or self.now < self.next_scaler_tick):
+            self._schedule_scaler_tick(self.now)
+
+    def run(self):
+        """
+        Run until the duration is reached, returns the results
+        """
+
+        self.schedule(0.0, EventType.ARRIVAL)
+        self.schedule(0.0, EventType.SAMPLE)
+        if self.health_checker:
+            self.schedule(self.health_checker.interval, EventType.HEALTH_CHECK)
+        if self.provisioner:
+            self.schedule(self.provisioner.interval, EventType.PROVISION)
+        if self.auto_scaler:
+            self.auto_scaler.is_running = True
+            self._schedule_scaler_tick(self.auto_scaler._next_wait())
+
+        self.traffic_generator.is_running = True
+
+        with self._output():
+            while self.events:
+                at, _, event_type, payload = heapq.heappop(self.events)
+                if at > self.duration:
+                    break
+
+                # pay for the servers that were up since the last event
+                self.server_seconds += (at - self.last_event_time) * self._servers_paid()
+                self.last_event_time = at
+                self.now = at
+
+                self._handle(event_type, payload)
+                self.events_processed += 1
+
+            self.server_seconds += (self.duration - self.last_event_time) * self._servers_paid()
+            self.now = self.duration
+
+            self.traffic_generator.is_running = False
+            if self.auto_scaler:
+                self.auto_scaler.is_running = False
+
+        return self.get_results()
+
+    def _servers_paid(self):
+        """
+        Servers costing money right now, standby and booting ones too
+        """
+        if self.provisioner:
+            return len(self.load_balancer.servers) + self.provisioner.servers_paid()
+        return len(self.load_balancer.servers)
+
+    def _handle(self, event_type, payload):
+        """
+        Process one event
+        """
+
+        if event_type == EventType.ARRIVAL:
+            self.traffic_generator._send_batch(self.now)
+            self.schedule(self.now + self.traffic_generator._calculate_sleep_time(self.now), EventType.ARRIVAL)
+
+        elif event_type == EventType.COMPLETION:
+            server, request_id, started, queue_wait = payload
+            server._finish_request(request_id, started, queue_wait)
+
+        elif event_type == EventType.SCALER_TICK:
+            if self.now != self.next_scaler_tick:
+                return # replaced by an earlier check
+
+            self.auto_scaler._check_and_scale()
+            self.peak_servers = max(self.peak_servers, len(self.load_balancer.servers))
+            self._schedule_scaler_tick(self.now + self.auto_scaler._next_wait())
+
+        elif event_type == EventType.SAMPLE:
+            self.history.sample()
+            self.schedule(self.now + self.sample_interval, EventType.SAMPLE)
+
+        elif event_type == EventType.HEALTH_CHECK:
+            self.health_checker.check()
+            self.schedule(self.now + self.health_checker.interval, EventType.HEALTH_CHECK)
+
+        elif event_type == EventType.HEDGE:
+            payload()
+
+        elif event_type == EventType.PROVISION:
+            self.provisioner.tick()
+            self.peak_servers = max(self.peak_servers, len(self.load_balancer.servers))
+            self.schedule(self.now + self.provisioner.interval, EventType.PROVISION)
+
+    def get_results(self):
+        """
+        Summary of the run
+        """
+
+        stats = self.load_balancer.get_stats()
+        util = self.history.summary()["util"]
+        provisioning = self.provisioner.get_stats() if self.provisioner else {}
+
+        return {
+            "pattern": self.pattern.value,
+            "seed": self.seed,
+            "duration": self.duration,
+            "events_processed": self.events_processed,
+            "total_requests": stats["total_requests_routed"],
+            "failed_requests": stats["failed_requests"],
+            "success_rate": stats["success_rate"],
+            "final_servers": stats["total_servers"],
+            "peak_servers": self.peak_servers,
+            "server_seconds": self.server_seconds,
+            "peak_util": util["peak"],
+            "avg_util": util["avg"],
+            "max_server_load": self.max_server_load,
+            "peak_queue_depth": stats["peak_queue_depth"],
+            "shed": stats["shed"],
+            "timed_out": stats["timed_out"],
+            "p99_admission_wait": stats["p99_admission_wait"],
+            "requests_given_up": self.traffic_generator.given_up,
+            "scaler_checks": self.auto_scaler.checks if self.auto_scaler else 0,
+            "ejections": self.health_checker.total_ejections if self.health_checker else 0,
+            "drained": self.load_balancer.drained,
+            "drain_timeouts": self.load_balancer.drain_timeouts,
+            "promotions": provisioning.get("promotions", 0),
+            "cold_starts": provisioning.get("cold_starts", 0),
+            "p50_time_to_capacity": provisioning.get("p50_time_to_capacity", 0.0),
+            "p99_time_to_capacity": provisioning.get("p99_time_to_capacity", 0.0),
+            "p99_time_to_first_slot": provisioning.get("p99_time_to_first_slot", 0.0),
+            "retries": stats.get("retries", 0),
+            "hedges": stats.get("hedges", 0),
+            "hedges_won": stats.get("hedges_won", 0),
+            "retry_budget_denied": stats.get("retry_budget_denied", 0),
+            "p50_latency": stats["p50_latency"],
+            "p95_latency": stats["p95_latency"],
+            "p99_latency": stats["p99_latency"]
+        }
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the system on a virtual clock")
+    parser.add_argument("--pattern", default="burst", choices=["steady", "burst", "gradual_increase", "random"])
+    parser.add_argument("--duration", type=float, default=3600, help="virtual seconds to simulate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--algo", default="rotating", choices=[algo.value for algo in RoutingAlgo])
+    parser.add_argument("--scaler", default="threshold", choices=[mode.value for mode in ScalingMode])
+    parser.add_argument("--poll", action="store_true", help="check the load every 5s instead of on load signals")
+    parser.add_argument("--queue-size", type=int, default=10, help="requests that may wait per server, 0 to reject right away")
+    parser.add_argument("--queue-timeout", type=float, default=2.0, help="virtual seconds a request may wait for a slot")
+    parser.add_argument("--queue-scope", default="shared", choices=[scope.value for scope in QueueScope])
+    parser.add_argument("--trace", help="replay this trace file instead of a pattern")
+    parser.add_argument("--speed", type=float, default=1.0, help="trace replay speed, 10 is ten times faster")
+    parser.add_argument("--arrivals", choices=[p.value for p in ArrivalProcess if p != ArrivalProcess.NON_HOMOGENEOUS],
+                        help="send open loop traffic from this arrival model instead of a pattern")
+    parser.add_argument("--rate", type=float, default=5, help="average requests per second for --arrivals")
+    parser.add_argument("--health", action="store_true", help="eject slow or failing servers with health checks")
+    parser.add_argument("--boot", type=float, default=0.0, help="virtual seconds a new server takes to boot")
+    parser.add_argument("--warmup", type=float, default=0.0, help="virtual seconds a booted server takes to reach full capacity")
+    parser.add_argument("--standby", type=int, default=0, help="warm standby servers kept ready to promote")
+    parser.add_argument("--retries", type=int, default=0, help="retry requests that fail on their server up to this many times")
+    parser.add_argument("--hedge", type=float, default=None, help="send a copy of requests running past this service time percentile")
+    args = parser.parse_args()
+
+    pattern = TrafficPattern[args.pattern.upper()]
+    label = args.trace or (f"{args.arrivals} {args.rate:g}/s" if args.arrivals else args.pattern)
+    arrivals = create_arrivals(ArrivalProcess(args.arrivals), args.rate, rng=random.Random(f"arrivals-{args.seed}")) if args.arrivals else None
+
+    start = time.perf_counter()
+    results = Simulation(pattern, duration=args.duration, seed=args.seed, rounting_algo=RoutingAlgo(args.algo), scaling=ScalingMode(args.scaler),
+                         event_driven_scaling=not args.poll, queue_size=args.queue_size,
+                         queue_timeout=args.queue_timeout, queue_scope=QueueScope(args.queue_scope),
+                         trace=args.trace, trace_speed=args.speed, arrivals=arrivals, health_checks=args.health,
+                         boot_time=args.boot, warmup_time=args.warmup, standby=args.standby, retries=args.retries,
+                         hedge_percentile=args.hedge).run()
+    elapsed = time.perf_counter() - start
+
+    print(f"Simulated {results['duration']:.0f}s of {label} traffic in {elapsed:.2f}s (seed {results['seed']})")
+    print(f" Events: {results['events_processed']}")
+    print(f" Requests: {results['total_requests']} total, {results['failed_requests']} failed")
+    print(f" Success Rate: {results['success_rate']:.1f}%")
+    print(f" Queue: {results['peak_queue_depth']} waiting at peak, {results['shed']} shed, {results['timed_out']} timed out, p99 wait {results['p99_admission_wait']:.3f}s")
+    print(f" Backpressure: {results['requests_given_up']} requests given up by the sender")
+    print(f" Servers: {results['final_servers']} at the end, {results['peak_servers']} at peak, {results['scaler_checks']} scaler checks, {results['ejections']} ejections")
+    print(f" Util: {results['avg_util']:.1f}% average, {results['peak_util']:.1f}% peak")
+    print(f" Latency: p50 {results['p50_latency']:.3f}s, p95 {results['p95_latency']:.3f}s, p99 {results['p99_latency']:.3f}s")
+    if args.boot or args.warmup or args.standby:
+        print(f" Provisioning: {results['promotions']} promoted, {results['cold_starts']} cold starts, "
+              f"time to capacity p50 {results['p50_time_to_capacity']:.1f}s, p99 {results['p99_time_to_capacity']:.1f}s")
+    if args.retries or args.hedge is not None:
+        print(f" Resilience: {results['retries']} retries, {results['hedges']} hedges ({results['hedges_won']} won), "
+              f"{results['retry_budget_denied']} denied by the budget")
+    print(f" Server time: {results['server_seconds'] / 3600:.2f} server hours")
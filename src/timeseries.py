@@ -0,0 +1,277 @@
+import time
+import threading
+from array import array
+
+# metrics sampled from LoadBalancer.get_stats, request_rate is worked out between samples
+CLUSTER_METRICS = ("util", "current_load", "total_servers", "queue_depth", "p99_latency", "success_rate", "request_rate")
+
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
+
+
+class Ring:
+    def __init__(self, capacity):
+        """
+        Fixed size circle of floats, the oldest value is overwritten once it is full
+
+        Arguments:
+            capacity: Values kept
+        """
+
+        self.capacity = capacity
+        self.values = array("d", bytes(8 * capacity))
+        self.start = 0
+        self.count = 0
+
+    def append(self, value):
+        """
+        Add a value, O(1)
+        """
+        if self.count < self.capacity:
+            self.values[(self.start + self.count) % self.capacity] = value
+            self.count += 1
+        else:
+            self.values[self.start] = value
+            self.start = (self.start + 1) % self.capacity
+
+    def to_list(self, last=None):
+        """
+        Values oldest first, only the newest last of them if given
+        """
+        count = self.count if last is None else min(last, self.count)
+        first = self.start + self.count - count
+        return [self.values[(first + i) % self.capacity] for i in range(count)]
+
+    def __len__(self):
+        return self.count
+
+
+class Tier:
+    def __init__(self, capacity, every=1):
+        """
+        One resolution of a MetricSeries, each point is the average and peak of every inputs
+
+        Arguments:
+            capacity: Points kept
+            every: Inputs that make one point, 60 one second samples make a minute
+        """
+
+        self.every = every
+        self.average = Ring(capacity)
+        self.peak = Ring(capacity)
+
+        self.bucket_total = 0.0
+        self.bucket_count = 0
+        self.bucket_peak = None
+
+    def add(self, average, peak):
+        """
+        Add an input, returns the (average, peak) point if this input finished one
+        """
+        self.bucket_total += average
+        self.bucket_count += 1
+        self.bucket_peak = peak if self.bucket_peak is None else max(self.bucket_peak, peak)
+
+        if self.bucket_count < self.every:
+            return None
+
+        point = (self.bucket_total / self.bucket_count, self.bucket_peak)
+        self.average.append(point[0])
+        self.peak.append(point[1])
+        self.bucket_total = 0.0
+        self.bucket_count = 0
+        self.bucket_peak = None
+        return point
+
+
+class MetricSeries:
+    def __init__(self, seconds=300, minutes=120, hours=48, interval=1.0):
+        """
+        History of one metric in fixed memory, every sample plus minute and hour rollups
+
+        Each finished point moves up to the next tier, so the minute tier is the
+        average (and peak) of 60 samples and the hour tier of 60 minutes. Peaks are
+        kept next to averages so a short spike is not averaged away. Peak and
+        average over the whole run are kept exactly, not from the tiers.
+
+        Arguments:
+            seconds: Samples kept at full resolution
+            minutes: Minute points kept
+            hours: Hour points kept
+            interval: Seconds between samples
+        """
+
+        self.tiers = {
+            "second": Tier(seconds),
+            "minute": Tier(minutes, every=max(1, round(60 / interval))),
+            "hour": Tier(hours, every=60)
+        }
+
+        self.last = None
+        self.peak = None
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, value):
+        """
+        Record a sample, O(1)
+        """
+        self.last = value
+        self.peak = value if self.peak is None else max(self.peak, value)
+        self.total += value
+        self.count += 1
+
+        point = (value, value)
+        for tier in self.tiers.values():
+            point = tier.add(*point)
+            if point is None:
+                break
+
+    def recent(self, tier="second", last=None, peaks=False):
+        """
+        Points of one tier oldest first, the peaks instead of the averages if asked
+        """
+        ring = self.tiers[tier].peak if peaks else self.tiers[tier].average
+        return ring.to_list(last)
+
+    def summary(self):
+        """
+        Peak, average and latest value over everything recorded
+        """
+        return {
+            "peak": self.peak or 0.0,
+            "avg": self.total / self.count if self.count else 0.0,
+            "last": self.last or 0.0
+        }
+
+
+class MetricsHistory:
+    def __init__(self, load_balancer, interval=1.0, seconds=300, minutes=120, hours=48, clock=time.perf_counter):
+        """
+        Samples the load balancer and every servers util on a timer into MetricSeries
+
+        Memory is fixed per metric however long it runs. Servers that leave are
+        dropped, so it also stays bounded as the auto scaler adds and removes them.
+
+        Arguments:
+            load_balancer: LoadBalancer to sample
+            interval: Seconds between samples
+            seconds: Samples kept at full resolution
+            minutes: Minute points kept
+            hours: Hour points kept
+            clock: Function returning the time in seconds, the simulation passes its virtual clock
+        """
+
+        self.load_balancer = load_balancer
+        self.interval = interval
+        self.clock = clock
+        self.sizes = {"seconds": seconds, "minutes": minutes, "hours": hours, "interval": interval}
+
+        self.cluster = {metric: MetricSeries(**self.sizes) for metric in CLUSTER_METRICS}
+        self.servers = {} # server_id -> MetricSeries of util
+        self.peak_servers = 0
+
+        self.last_total = None
+        self.last_time = None
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Sample every interval on a background thread
+        """
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop sampling, everything recorded stays readable
+        """
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """
+        Take one sample of every metric
+        """
+
+        stats = self.load_balancer.get_stats()
+        now = self.clock()
+
+        # requests per second since the last sample
+        total = stats["total_requests_routed"]
+        if self.last_time is not None and now > self.last_time:
+            stats["request_rate"] = (total - self.last_total) / (now - self.last_time)
+        else:
+            stats["request_rate"] = 0.0
+        self.last_total = total
+        self.last_time = now
+
+        for metric, series in self.cluster.items():
+            series.add(stats[metric])
+        self.peak_servers = max(self.peak_servers, stats["total_servers"])
+
+        servers = list(self.load_balancer.servers)
+        for server in servers:
+            series = self.servers.get(server.server_id)
+            if series is None:
+                series = self.servers[server.server_id] = MetricSeries(**self.sizes)
+            # plain reads, the servers lock is left to the requests
+            series.add(server.current_requests / server.max_capacity * 100)
+
+        if len(self.servers) > len(servers):
+            current = {server.server_id for server in servers}
+            for server_id in [s for s in self.servers if s not in current]:
+                del self.servers[server_id]
+
+    def trend(self, metric, tier="second", last=None, peaks=False):
+        """
+        Recent points of a cluster metric oldest first
+        """
+        return self.cluster[metric].recent(tier, last, peaks)
+
+    def server_trend(self, server_id, tier="second", last=None):
+        """
+        Recent util points of one server oldest first
+        """
+        series = self.servers.get(server_id)
+        return series.recent(tier, last) if series else []
+
+    def summary(self):
+        """
+        Peak, average and latest of every cluster metric over the whole run
+        """
+        summary = {metric: series.summary() for metric, series in self.cluster.items()}
+        summary["samples"] = self.cluster["util"].count
+        summary["peak_servers"] = self.peak_servers
+        return summary
+
+
+def sparkline(values, width=30, low=None, high=None):
+    """
+    Draw values as a line of block characters, at most width long
+
+    With more values than width each character shows the highest value it covers,
+    so spikes stay visible. low and high fix the scale, like 0 and 100 for util
+    """
+    if not values:
+        return ""
+
+    if len(values) > width:
+        step = len(values) / width
+        values = [max(values[int(i * step):max(int(i * step) + 1, int((i + 1) * step))]) for i in range(width)]
+
+    low = min(values) if low is None else low
+    high = max(values) if high is None else high
+    span = high - low
+    if span <= 0:
+        return SPARK_BLOCKS[0] * len(values)
+
+    top = len(SPARK_BLOCKS) - 1
+    return "".join(SPARK_BLOCKS[max(0, min(top, int((value - low) / span * top + 0.5)))] for value in values)
@@ -0,0 +1,200 @@
+import os
+import mmap
+import time
+import random
+from .traffic_generator import TrafficGenerator, TrafficPattern
+from .event_log import events
+
+
+def parse_line(line):
+    """
+    Parse one trace line of the form timestamp[,key]
+
+    Timestamps are seconds (epoch or from any start), the key is what the request
+    is routed by, like a session or user id. Blank lines, # comments and a header
+    row are skipped by returning None
+    """
+    line = line.strip()
+    if not line or line.startswith(b"#"):
+        return None
+
+    fields = line.split(b",", 2)
+    try:
+        timestamp = float(fields[0])
+    except ValueError:
+        return None
+
+    key = fields[1].strip().decode() if len(fields) > 1 and fields[1].strip() else None
+    return timestamp, key
+
+
+def read_trace(path, parse=parse_line):
+    """
+    Yield (timestamp, key) for every request in a trace file, in file order
+
+    The file is memory mapped and read a line at a time, so a trace of millions of
+    requests uses the same memory as a small one
+
+    Arguments:
+        path: Trace file, sorted by timestamp
+        parse: Turns one line (bytes) into (timestamp, key) or None to skip it
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as trace:
+            for line in iter(trace.readline, b""):
+                entry = parse(line)
+                if entry is not None:
+                    yield entry
+
+
+def write_trace(path, entries):
+    """
+    Write (timestamp, key) pairs as a trace file read_trace can replay
+    """
+    with open(path, "w") as file:
+        file.write("timestamp,key\n")
+        for timestamp, key in entries:
+            file.write(f"{timestamp:.6f},{key or ''}\n")
+
+
+class TraceReplayGenerator(TrafficGenerator):
+    def __init__(self, load_balancer, path, speed=1.0, parse=parse_line, batch_size=1000):
+        """
+        Replays a recorded trace of requests through the load balancer instead of a made up pattern
+
+        Each request is sent when its timestamp comes up, scaled by speed. Requests
+        are sent even while the load balancer pushes back: a replay has to keep the
+        recorded arrivals, so anything it cannot take shows up as shed instead of
+        being held back like TrafficGenerator does.
+
+        Works on a thread with start/stop like TrafficGenerator, and inside the
+        Simulation on its virtual clock.
+
+        Arguments:
+            load_balancer: LoadBalancer instance to send requests to
+            path: Trace file, see parse_line for the format
+            speed: 1 replays in real time, 10 ten times faster, None as fast as possible
+            parse: Turns one line (bytes) into (timestamp, key) or None to skip it
+            batch_size: Most requests sent in one go before checking stop again
+        """
+
+        self.path = path
+        self.speed = speed
+        self.batch_size = batch_size
+
+        self.entries = read_trace(path, parse)
+        self.next_entry = next(self.entries, None)
+        self.first_timestamp = self.next_entry[0] if self.next_entry else 0.0
+        self.finished = self.next_entry is None
+
+        self.max_lag = 0.0 # furthest behind the trace the sends have been, in seconds
+        self.replay_started = None
+        self.replay_elapsed = 0.0
+
+        super().__init__(load_balancer, TrafficPattern.TRACE, rng=random)
+
+        events.info("trace_opened", "Replaying {path} at {speed}", path=path, speed=f"{speed}x" if speed else "full speed")
+
+    def _due(self, timestamp):
+        """
+        Seconds from the start of the replay when a request with this timestamp is sent
+        """
+        if not self.speed:
+            return 0.0
+        return (timestamp - self.first_timestamp) / self.speed
+
+    def _generate_traffic(self):
+        """
+        Replay on the real clock, runs on its own thread
+        """
+        self.replay_started = time.perf_counter()
+
+        while self.is_running and not self.finished:
+            self._send_batch(time.perf_counter() - self.replay_started)
+
+            # short sleeps so stop is quick even with long gaps in the trace
+            wait = self._calculate_sleep_time(time.perf_counter() - self.replay_started)
+            if wait > 0:
+                time.sleep(min(wait, 0.5))
+
+        self.replay_elapsed = time.perf_counter() - self.replay_started
+        if self.finished:
+            self.is_running = False
+            events.info("trace_finished", "Trace replay finished, {sent} requests sent", sent=self.request_counter)
+
+    def _send_batch(self, elapsed_time):
+        """
+        Send every request that is due by elapsed_time, up to batch_size
+        """
+        sent = 0
+        while self.is_running and self.next_entry is not None and sent < self.batch_size:
+            timestamp, key = self.next_entry
+            due = self._due(timestamp)
+            if due > elapsed_time:
+                return
+
+            if self.speed:
+                self.max_lag = max(self.max_lag, elapsed_time - due)
+
+            self.request_counter += 1
+            self.load_balancer.route_request(f"Trace-{self.request_counter:04d}", key)
+
+            self.next_entry = next(self.entries, None)
+            sent += 1
+
+        if self.next_entry is None:
+            self.finished = True
+
+    def _calculate_sleep_time(self, elapsed_time):
+        """
+        Time until the next request is due, infinite once the trace is done
+        """
+        if self.next_entry is None:
+            return float("inf")
+        return max(0.0, self._due(self.next_entry[0]) - elapsed_time)
+
+    def get_stats(self):
+        """
+        Get traffic generator stats plus how the replay is keeping up
+        """
+        stats = super().get_stats()
+
+        elapsed = self.replay_elapsed
+        if self.replay_started and not elapsed:
+            elapsed = time.perf_counter() - self.replay_started
+
+        stats.update({
+            "trace": self.path,
+            "speed": self.speed,
+            "replay_lag": self.max_lag,
+            "replay_rate": self.request_counter / elapsed if elapsed else 0.0,
+            "finished": self.finished
+        })
+        return stats
+
+
+if __name__ == "__main__":
+    import sys
+    import math
+
+    # makes a sample trace to try the replay with: a day shaped rate plus short spikes
+    if len(sys.argv) < 2:
+        print("Usage: python -m src.trace_replay PATH [requests] [sessions]")
+        sys.exit(1)
+
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    sessions = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    rng = random.Random(0)
+
+    def arrivals():
+        now = 0.0
+        for _ in range(requests):
+            rate = 2 + 1.5 * math.sin(now / 600) + (8 if rng.random() < 0.01 else 0)
+            now += rng.expovariate(rate)
+            yield now, f"session-{rng.randrange(sessions)}"
+
+    write_trace(sys.argv[1], arrivals())
+    print(f"Wrote {requests} requests to {sys.argv[1]}")
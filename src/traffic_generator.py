@@ -3,43 +3,56 @@ import threading
 import random
 from datetime import datetime
 from enum import Enum
+from .event_log import events
 
 class TrafficPattern(Enum):
     STEADY = "steady", # consistent traffic
     BURST = "burst", # sudden SPIKE
     GRADUAL_INCREASE = "gradual_increase", # slowly getting busy
     RANDOM = "random" # unpredicted
+    TRACE = "trace" # replayed from a recorded trace (TraceReplayGenerator)
+    OPEN_LOOP = "open_loop" # arrival times from a model like Poisson (OpenLoopGenerator)
 
 class TrafficGenerator:
-    def __init__(self, load_balancer, pattern=TrafficPattern.STEADY):
+    def __init__(self, load_balancer, pattern=TrafficPattern.STEADY, rng=random, sessions=None):
         """
         Generates realistic web traffic and sends it to the load balancer
 
         Arguments:
             load_balancer: LoadBalancer instance to send requests to
             pattern: Which kind of traffic pattern to simulate
+            rng: Source of randomness, pass a seeded random.Random for repeatable traffic
+            sessions: Number of user sessions, each request carries one as its routing key (None for no keys)
         """
         self.load_balancer = load_balancer
         self.pattern = pattern
+        self.rng = rng
+        self.sessions = sessions
         self.request_counter = 0
         self.is_running = False
+
+        # backpressure, requests held back while the load balancers queues are full
+        self.deferred = 0
+        self.max_deferred = 100 # held back requests past this are given up on, like users leaving
+        self.given_up = 0
+        self.backoffs = 0
         self.generator_thread = None
 
-        print(f"Traffic Generator createdwith {pattern.value} pattern")
+        events.info("generator_created", "Traffic Generator created with {pattern} pattern", pattern=pattern.value)
     
     def start(self):
         """
         Start generating the traffic
         """
         if self.is_running:
-            print("Traffic Generator is running")
+            events.info("generator_running", "Traffic Generator is running")
             return
 
         self.is_running = True
         self.generator_thread = threading.Thread(target=self._generate_traffic)
         self.generator_thread.start()
 
-        print("Traffic Generation has started")
+        events.info("generator_started", "Traffic Generation has started")
 
     
     def stop(self):
@@ -49,7 +62,7 @@ class TrafficGenerator:
         self.is_running = False
         if self.generator_thread:
             self.generator_thread.join()
-        print("Traffic Generation stopped")
+        events.info("generator_stopped", "Traffic Generation stopped")
     
     def _generate_traffic(self):
         """
@@ -61,25 +74,44 @@ class TrafficGenerator:
             # calculates how long were running for (gradual increase pattern)
             elapsed_time = time.time() - start_time
 
-            # decides how many requests needed to send based on pattern
-            requests_to_send = self._calculate_request_count(elapsed_time)
-
-            # send the requests
-            for _ in range(requests_to_send):
-                if not self.is_running:
-                    break
+            # send this cycles requests
+            self._send_batch(elapsed_time)
 
-                self.request_counter +=1
-                request_id = f"Traffic-{self.request_counter:04d}" # 4 digit decimal
-
-                # send request to load balancer
-                self.load_balancer.route_request(request_id)
-            
             # wait before next requests
             sleep_time = self._calculate_sleep_time(elapsed_time)
             time.sleep(sleep_time)
-        
-        
+
+    def _send_batch(self, elapsed_time):
+        """
+        Send one cycles worth of requests to the load balancer
+        """
+
+        # decides how many requests needed to send based on pattern, plus any held back last time
+        requests_to_send = self._calculate_request_count(elapsed_time) + self.deferred
+        self.deferred = 0
+
+        # send the requests
+        for sent in range(requests_to_send):
+            if not self.is_running:
+                break
+
+            # load balancer is full and shedding, hold the rest back until the next batch
+            if self.load_balancer.backpressure() >= 1.0:
+                held_back = requests_to_send - sent
+                self.deferred = min(held_back, self.max_deferred)
+                self.given_up += held_back - self.deferred
+                self.backoffs += 1
+                break
+
+            self.request_counter +=1
+            request_id = f"Traffic-{self.request_counter:04d}" # 4 digit decimal
+
+            # pick which users session this request belongs to
+            key = f"session-{self.rng.randrange(self.sessions)}" if self.sessions else None
+
+            # send request to load balancer
+            self.load_balancer.route_request(request_id, key)
+
     def _calculate_request_count(self, elapsed_time):
         """
         Decide how many requests to send this time
@@ -87,24 +119,24 @@ class TrafficGenerator:
     
         if self.pattern == TrafficPattern.STEADY:
             # have 1-2 requests for every cycle
-            return random.randint(1,2)
+            return self.rng.randint(1,2)
         elif self.pattern == TrafficPattern.BURST:
             # quiet with sudden spikes
-            if random.random() < 0.1: # 10% chance burst
-                print("Traffic Spike Happened")
-                return random.randint(5,10) # big burst
+            if self.rng.random() < 0.1: # 10% chance burst
+                events.info("traffic_spike", "Traffic Spike Happened")
+                return self.rng.randint(5,10) # big burst
             else:
-                return random.randint(0, 1) # quiet the rest of the time
+                return self.rng.randint(0, 1) # quiet the rest of the time
 
         elif self.pattern == TrafficPattern.GRADUAL_INCREASE:
             # start slow, gt busier over time
             base_requests = 1
             growth_factor = elapsed_time/30 # this gts busier every 30secs
             max_requests = int(base_requests + growth_factor)
-            return random.randint(1, max(1, max_requests))
+            return self.rng.randint(1, max(1, max_requests))
         
         elif self.pattern == TrafficPattern.RANDOM:
-            return random.randint(0, 5) # unpredictable
+            return self.rng.randint(0, 5) # unpredictable
 
         else:
             return 1
@@ -116,10 +148,10 @@ class TrafficGenerator:
         """
 
         if self.pattern == TrafficPattern.STEADY:
-            return random.uniform(1.0, 2.0) # 102 seconds between batches
+            return self.rng.uniform(1.0, 2.0) # 102 seconds between batches
         
         elif self.pattern == TrafficPattern.BURST:
-            return random.uniform(0.5, 3.0) # more variable and varaible timing
+            return self.rng.uniform(0.5, 3.0) # more variable and varaible timing
         
         elif self.pattern == TrafficPattern.GRADUAL_INCREASE:
             # when traffic incrases, requests come faster
@@ -129,7 +161,7 @@ class TrafficGenerator:
             return sleep_time
         
         elif self.pattern == TrafficPattern.RANDOM:
-            return random.uniform(0.1, 4.0) # unpredictable timing
+            return self.rng.uniform(0.1, 4.0) # unpredictable timing
 
         else:
             return 1.0 # default 1 second
@@ -142,6 +174,9 @@ class TrafficGenerator:
         return {
             "pattern": self.pattern.value,
             "total_requests_sent": self.request_counter,
+            "requests_deferred": self.deferred,
+            "requests_given_up": self.given_up,
+            "backoffs": self.backoffs,
             "is_running": self.is_running
         }
     
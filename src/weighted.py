@@ -0,0 +1,97 @@
+from math import gcd
+from functools import reduce
+
+class WeightedSchedule:
+    def __init__(self, max_length=4096):
+        """
+        Precomputed smooth weighted round robin order of servers
+
+        The order is built once with the smooth weighted round robin algorithm (the one
+        nginx uses) so a server with weight 3 next to one with weight 1 gets A A B A
+        spread out instead of A A A B. Picking the next server is then just moving a
+        cursor, O(1). The order is only rebuilt when a server joins, leaves or has its
+        weight changed.
+
+        Arguments:
+            max_length: Longest the schedule may get, weights are scaled down past this
+        """
+
+        self.max_length = max_length
+        self.schedule = []
+        self.cursor = 0
+        self.weights = {} # server_id -> weight the schedule was built with
+        self.dirty = True
+        self.rebuilds = 0
+
+    def add(self, server):
+        """
+        A server joined
+        """
+        self.weights[server.server_id] = server.get_weight()
+        self.dirty = True
+
+    def remove(self, server):
+        """
+        A server left
+        """
+        self.weights.pop(server.server_id, None)
+        self.dirty = True
+
+    def check(self, server):
+        """
+        Mark the schedule stale if the servers weight changed, O(1)
+        """
+        known = self.weights.get(server.server_id)
+        if known is not None and known != server.get_weight():
+            self.weights[server.server_id] = server.get_weight()
+            self.dirty = True
+
+    def next(self, servers):
+        """
+        Next server in the schedule that can take a request, or None
+        """
+        if self.dirty:
+            self._rebuild(servers)
+
+        length = len(self.schedule)
+        for _ in range(length):
+            server = self.schedule[self.cursor]
+            self.cursor = (self.cursor + 1) % length
+
+            if server.can_handle_request():
+                return server
+
+        return None
+
+    def _rebuild(self, servers):
+        """
+        Build the smooth weighted round robin order for the current servers
+        """
+        self.dirty = False
+        self.rebuilds += 1
+        self.schedule = []
+        self.cursor = 0
+
+        weights = [max(1, int(self.weights.get(s.server_id, s.get_weight()))) for s in servers]
+        if not weights:
+            return
+
+        # smallest schedule with the same proportions
+        divisor = reduce(gcd, weights)
+        weights = [w // divisor for w in weights]
+
+        # too long, scale down but keep every server in it at least once
+        total = sum(weights)
+        if total > self.max_length:
+            weights = [max(1, w * self.max_length // total) for w in weights]
+            total = sum(weights)
+
+        current = [0] * len(servers)
+        for _ in range(total):
+            best = 0
+            for i, weight in enumerate(weights):
+                current[i] += weight
+                if current[i] > current[best]:
+                    best = i
+            current[best] -= total
+            self.schedule.append(servers[best])
@@ -0,0 +1,15 @@
+import pytest
+
+from src.event_log import events
+
+
+@pytest.fixture(autouse=True)
+def flush_event_log():
+    """
+    Write each tests events while pytest is still capturing its output
+
+    The event log writes on a background thread, anything left waiting would be
+    printed after the test session summary
+    """
+    yield
+    events.flush()
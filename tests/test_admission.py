@@ -0,0 +1,121 @@
+from src.server import Server
+from src.admission import AdmissionQueues, QueueScope
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.auto_scaler import AutoScaler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_queues(scope=QueueScope.SHARED, queue_size=2, timeout=2.0, servers=2):
+    clock = FakeClock()
+    queues = AdmissionQueues(queue_size, timeout, scope, clock)
+    members = [Server(f"s{i}") for i in range(servers)]
+    for server in members:
+        queues.add_server(server)
+    return queues, members, clock
+
+
+def test_shared_queue_is_first_in_first_out_and_bounded():
+    queues, servers, clock = make_queues(queue_size=2, servers=2)
+    assert queues.capacity() == 4
+    for i in range(4):
+        assert queues.enqueue(f"r{i}")
+    assert not queues.enqueue("r4")
+    assert queues.shed == 1
+    assert queues.pressure() == 1.0
+
+    clock.now = 0.5
+    assert queues.next_for(servers[1]) == ("r0", 0.5)
+    assert queues.next_for(servers[0]) == ("r1", 0.5)
+    assert queues.depth == 2
+
+
+def test_queueing_off_sheds_everything():
+    queues, _, _ = make_queues(queue_size=0)
+    assert not queues.enabled()
+    assert not queues.enqueue("r0")
+    assert queues.shed == 1
+
+
+def test_requests_time_out_oldest_first():
+    queues, servers, clock = make_queues(timeout=1.0)
+    queues.enqueue("old")
+    clock.now = 0.8
+    queues.enqueue("new")
+
+    clock.now = 1.5
+    assert queues.next_for(servers[0]) == ("new", 0.7)
+    assert queues.timed_out == 1
+    assert queues.depth == 0
+
+
+def test_per_server_queues_prefer_then_shortest():
+    queues, servers, _ = make_queues(QueueScope.PER_SERVER, queue_size=1)
+    assert queues.enqueue("a", preferred=servers[1])
+    # s1 is full, goes to the shortest with room
+    assert queues.enqueue("b", preferred=servers[1])
+    assert not queues.enqueue("c")
+
+    assert queues.next_for(servers[1])[0] == "a"
+    assert queues.next_for(servers[0])[0] == "b"
+
+
+def test_put_back_goes_to_the_front():
+    queues, servers, clock = make_queues()
+    queues.enqueue("first")
+    queues.enqueue("second")
+    clock.now = 1.0
+
+    request_id, waited = queues.next_for(servers[0])
+    queues.put_back(servers[0], request_id, waited)
+    assert queues.next_for(servers[0]) == ("first", 1.0)
+
+
+def test_removed_server_hands_back_its_requests():
+    queues, servers, _ = make_queues(QueueScope.PER_SERVER, queue_size=2)
+    queues.enqueue("a", preferred=servers[0])
+    queues.enqueue("b", preferred=servers[0])
+
+    moved = queues.remove_server(servers[0])
+    assert [request_id for request_id, _ in moved] == ["a", "b"]
+    assert queues.depth == 0
+    assert queues.capacity() == 2
+
+    # moved requests keep their place in time and are not counted twice
+    for request_id, enqueued_at in moved:
+        queues.enqueue(request_id, enqueued_at=enqueued_at)
+    assert queues.queued == 2
+
+
+def test_stats_count_admitted():
+    queues, servers, _ = make_queues()
+    queues.enqueue("a")
+    _, waited = queues.next_for(servers[0])
+    queues.record_admitted(waited)
+
+    stats = queues.get_stats()
+    assert stats["queued"] == 1
+    assert stats["admitted"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_get_stats_leaves_the_queue_alone_and_the_scaler_expires_it():
+    clock = FakeClock()
+    lb = LoadBalancer(RoutingAlgo.ROTATING, queue_timeout=1.0, clock=clock)
+    lb.add_server(Server("s0", max_capacity=1))
+    scaler = AutoScaler(lb, min_servers=1, max_servers=1, clock=clock)
+    lb.admission.enqueue("stuck")
+
+    clock.now = 5
+    assert lb.get_stats()["timed_out"] == 0
+    assert lb.get_stats()["queue_depth"] == 1
+
+    scaler._check_and_scale()
+    assert lb.get_stats()["timed_out"] == 1
+    assert lb.get_stats()["queue_depth"] == 0
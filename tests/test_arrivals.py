@@ -0,0 +1,53 @@
+import math
+import random
+
+import pytest
+
+from src.arrivals import (ArrivalProcess, PoissonArrivals, NonHomogeneousArrivals, DiurnalArrivals, MMPPArrivals,
+                          create_arrivals)
+
+
+def observed_rate(arrivals, count, chunk_size=1000):
+    times = []
+    while len(times) < count:
+        times.extend(arrivals.next_chunk(chunk_size))
+    return len(times) / times[-1], times
+
+
+def test_poisson_mean_rate():
+    rate, times = observed_rate(PoissonArrivals(10, rng=random.Random(1)), 50_000)
+    assert rate == pytest.approx(10, rel=0.03)
+    # chunks carry on from each other
+    assert all(b > a for a, b in zip(times, times[1:]))
+
+
+def test_thinning_keeps_the_given_rate():
+    arrivals = NonHomogeneousArrivals(lambda now: 4, peak_rate=8, rng=random.Random(2))
+    rate, _ = observed_rate(arrivals, 20_000)
+    assert rate == pytest.approx(4, rel=0.03)
+
+
+def test_diurnal_averages_to_rate_and_follows_the_wave():
+    arrivals = DiurnalArrivals(10, amplitude=0.5, period=100, rng=random.Random(3))
+    rate, times = observed_rate(arrivals, 50_000)
+    assert rate == pytest.approx(10, rel=0.03)
+
+    # busiest a quarter of the way through each period, quietest at three quarters
+    busy = sum(1 for t in times if 0 <= t % 100 < 50)
+    quiet = len(times) - busy
+    assert busy / quiet == pytest.approx((1 + 1 / math.pi) / (1 - 1 / math.pi), rel=0.05)
+
+
+def test_mmpp_mean_rate():
+    arrivals = MMPPArrivals(rates=(5, 40), mean_dwell=(60, 10), rng=random.Random(4))
+    assert arrivals.mean_rate() == pytest.approx(10)
+
+    rate, _ = observed_rate(arrivals, 200_000)
+    assert rate == pytest.approx(10, rel=0.1)
+    assert arrivals.state_changes > 100
+
+
+def test_create_arrivals_averages_to_rate():
+    assert create_arrivals(ArrivalProcess.POISSON, 6).rate == 6
+    assert create_arrivals(ArrivalProcess.DIURNAL, 6).rate == 6
+    assert create_arrivals(ArrivalProcess.MMPP, 6).mean_rate() == pytest.approx(6)
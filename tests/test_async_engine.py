@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from src.server import Server
+from src.load_balancer import RoutingAlgo
+from src.async_engine import AsyncLoadBalancer
+
+
+def test_options_reach_the_load_balancer():
+    lb = AsyncLoadBalancer(RoutingAlgo.LEAST_CONNECTIONS, queue_size=7, retries=2, hedge_percentile=95)
+    assert lb.admission.queue_size == 7
+    assert lb.resilience.max_retries == 2
+    assert lb.resilience.hedge_percentile == 95
+    lb.shutdown()
+
+
+def test_dispatcher_and_timer_cannot_be_replaced():
+    with pytest.raises(ValueError):
+        AsyncLoadBalancer(RoutingAlgo.ROTATING, call_later=lambda delay, callback: None)
+
+
+def test_hedges_run_on_the_event_loop():
+    async def run():
+        lb = AsyncLoadBalancer(RoutingAlgo.LEAST_CONNECTIONS, hedge_percentile=50)
+        for i in range(3):
+            lb.add_server(Server(f"s{i}", max_capacity=50, base_response_time=0.005))
+
+        # enough finished requests to know the hedge delay, which is looked up once a second
+        for i in range(30):
+            lb.route_request(f"warm-{i}")
+        await lb.drain()
+        await asyncio.sleep(1.1)
+
+        lb.servers[0].degrade(slowdown=40)
+        for i in range(60):
+            await lb.route_request_async(f"r{i}")
+            await asyncio.sleep(0.002)
+        await asyncio.sleep(0.5)
+        await lb.drain()
+
+        stats = lb.get_stats()
+        submitted = lb.dispatcher.submitted
+        lb.shutdown()
+        return stats, submitted
+
+    stats, submitted = asyncio.run(run())
+    assert stats["hedges"] > 0
+    # every hedge copy was actually started as a task on the loop
+    assert submitted == stats["total_requests_routed"] + stats["hedges"]
+    assert stats["hedges_won"] > 0
@@ -0,0 +1,52 @@
+from src.load_balancer import RoutingAlgo
+from src.traffic_generator import TrafficPattern
+from src.capacity_planner import CapacityPlanner
+
+
+def make_planner(cache_dir, **options):
+    return CapacityPlanner(patterns=(TrafficPattern.BURST,), min_servers=(1, 2), max_servers=(2, 4), capacities=(3,),
+                           algorithms=(RoutingAlgo.LEAST_CONNECTIONS,), seeds=2, duration=60, workers=1,
+                           cache_dir=str(cache_dir), **options)
+
+
+def test_plan_has_a_row_per_config_cheapest_first(tmp_path):
+    planner = make_planner(tmp_path)
+    rows = planner.plan()
+
+    assert planner.ran == 4 * 2 and planner.cached == 0
+    assert sorted((row["min_servers"], row["max_servers"]) for row in rows) == [(1, 2), (1, 4), (2, 2), (2, 4)]
+    assert [row["slot_hours"] for row in rows] == sorted(row["slot_hours"] for row in rows)
+    for row in rows:
+        assert row["capacity"] == 3 and row["algorithm"] == "least_connections"
+        assert 0 <= row["pass_rate"] <= 1
+        assert row["meets_slo"] == (row["pass_rate"] >= planner.confidence)
+        assert row["worst_p99_latency"] >= row["p99_latency"]
+        assert row["min_servers"] <= row["peak_servers"] <= row["max_servers"]
+
+
+def test_second_sweep_comes_from_the_cache(tmp_path):
+    first = make_planner(tmp_path).plan()
+
+    planner = make_planner(tmp_path)
+    assert planner.plan() == first
+    assert planner.ran == 0 and planner.cached == 4 * 2
+
+    # a changed SLO is judged from the same runs
+    strict = make_planner(tmp_path, p99_slo=0.0)
+    rows = strict.plan()
+    assert strict.ran == 0
+    assert not any(row["meets_slo"] for row in rows)
+    assert CapacityPlanner.cheapest(rows) is None
+
+
+def test_cheapest_skips_rows_that_miss_the_slo():
+    rows = [{"slot_hours": 1, "meets_slo": False}, {"slot_hours": 2, "meets_slo": True}, {"slot_hours": 3, "meets_slo": True}]
+    assert CapacityPlanner.cheapest(rows)["slot_hours"] == 2
+
+
+def test_process_pool_gives_the_same_plan(tmp_path):
+    serial = make_planner(tmp_path / "serial").plan()
+    parallel = CapacityPlanner(patterns=(TrafficPattern.BURST,), min_servers=(1, 2), max_servers=(2, 4), capacities=(3,),
+                               algorithms=(RoutingAlgo.LEAST_CONNECTIONS,), seeds=2, duration=60, workers=2, cache_dir=None)
+    assert parallel.plan() == serial
+    assert parallel.ran == 4 * 2
@@ -0,0 +1,94 @@
+from collections import Counter
+
+from src.server import Server
+from src.consistent_hash import HashRing, stable_hash
+
+
+def make_ring(count, vnodes=100, capacity=1000, load_factor=1.25):
+    ring = HashRing(vnodes=vnodes, load_factor=load_factor)
+    servers = [Server(f"s{i}", max_capacity=capacity) for i in range(count)]
+    for server in servers:
+        ring.add(server)
+    return ring, servers
+
+
+def test_stable_hash_is_fixed():
+    assert stable_hash("session-1") == stable_hash("session-1")
+    assert stable_hash("session-1") != stable_hash("session-2")
+
+
+def test_same_key_same_server():
+    ring, _ = make_ring(5)
+    assert ring.lookup("user-42") is ring.lookup("user-42")
+    assert ring.lookup("user-42") is ring.home("user-42")
+
+
+def test_adding_a_server_moves_about_its_share():
+    ring, _ = make_ring(10)
+    keys = [f"key-{i}" for i in range(5000)]
+    before = {key: ring.home(key).server_id for key in keys}
+    ring.last_remap_fraction # the first read is against an empty ring
+
+    ring.add(Server("s10", max_capacity=1000))
+    after = {key: ring.home(key).server_id for key in keys}
+
+    moved = [key for key in keys if before[key] != after[key]]
+    # only keys taken by the new server move, about 1/11 of them
+    assert all(after[key] == "s10" for key in moved)
+    assert 0.04 < len(moved) / len(keys) < 0.15
+    assert 0.04 < ring.last_remap_fraction < 0.15
+
+
+def test_removing_a_server_only_moves_its_keys():
+    ring, servers = make_ring(10)
+    keys = [f"key-{i}" for i in range(5000)]
+    before = {key: ring.home(key).server_id for key in keys}
+
+    ring.remove(servers[3])
+    after = {key: ring.home(key).server_id for key in keys}
+
+    assert all(before[key] == "s3" for key in keys if before[key] != after[key])
+    assert "s3" not in after.values()
+
+
+def test_bounded_load_overflows_to_the_next_server():
+    ring, servers = make_ring(4, load_factor=1.25)
+    key = "hot-key"
+    home = ring.home(key)
+
+    # the home server is well over the average, the key has to walk on
+    home.current_requests = 10
+    ring.update(home)
+    picked = ring.lookup(key)
+    assert picked is not home
+    assert ring.overflows == 1
+
+
+def test_full_ring_returns_none():
+    ring, servers = make_ring(3, capacity=1)
+    for server in servers:
+        server.current_requests = 1
+        ring.update(server)
+    assert ring.lookup("anything") is None
+
+
+def test_updates_after_removal_are_ignored():
+    ring, servers = make_ring(3)
+    servers[0].current_requests = 5
+    ring.update(servers[0])
+    assert ring.total_load == 5
+
+    ring.remove(servers[0])
+    ring.update(servers[0])
+    assert "s0" not in ring.loads
+    assert ring.total_load == 0
+
+
+def test_more_vnodes_split_keys_more_evenly():
+    imbalance = {}
+    for vnodes in (1, 200):
+        ring, _ = make_ring(10, vnodes=vnodes)
+        counts = Counter(ring.home(f"key-{i}").server_id for i in range(10000))
+        imbalance[vnodes] = max(counts.values()) / (10000 / 10)
+    assert imbalance[200] < imbalance[1]
+    assert imbalance[200] < 1.5
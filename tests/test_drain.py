@@ -0,0 +1,108 @@
+import time
+
+from src.server import Server, ServerStatus
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.auto_scaler import AutoScaler
+from src.dispatcher import DispatchMode, create_dispatcher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_lb(servers=2):
+    clock = FakeClock()
+    lb = LoadBalancer(RoutingAlgo.LEAST_CONNECTIONS, dispatcher=create_dispatcher(DispatchMode.INLINE), clock=clock)
+    for i in range(servers):
+        lb.add_server(Server(f"s{i}", max_capacity=4, base_response_time=0.0, clock=clock))
+    return lb, clock
+
+
+def test_idle_server_is_removed_straight_away():
+    lb, _ = make_lb()
+    assert lb.drain_server("s0")
+    assert [s.server_id for s in lb.servers] == ["s1"]
+    assert lb.drained == 1
+
+
+def test_busy_server_stops_taking_requests_until_it_finishes():
+    lb, _ = make_lb()
+    server = lb.servers[0]
+    assert server.reserve_slot()
+
+    assert lb.drain_server("s0")
+    assert server.status == ServerStatus.DRAINING
+    assert not lb.drain_server("s0")
+    assert lb.drain_candidate().server_id == "s1"
+
+    server.current_requests -= 1
+    server._notify()
+    assert server not in lb.servers
+
+
+def test_drain_timeout_is_enforced_by_the_scaler_not_get_stats():
+    lb, clock = make_lb(3)
+    scaler = AutoScaler(lb, min_servers=1, max_servers=3, clock=clock)
+    lb.servers[0].reserve_slot()
+    lb.drain_server("s0", timeout=5)
+    assert lb.time_until_next_drain() == 5
+    assert scaler._next_wait() <= 5
+
+    clock.now = 10
+    lb.get_stats()
+    assert lb.draining
+
+    scaler._check_and_scale()
+    assert "s0" not in [s.server_id for s in lb.servers]
+    assert lb.drain_timeouts == 1
+
+
+def test_cancel_drain_opens_slots_nobody_owns():
+    lb, _ = make_lb()
+    server = lb.servers[0]
+    server.reserve_slot()
+    server.limit_slots(2)
+    lb.drain_server("s0")
+
+    assert lb.cancel_drain("s0")
+    assert server.status == ServerStatus.HEALTHY
+    assert server.slot_limit == server.max_capacity
+    assert not lb.cancel_drain("s0")
+
+
+def test_cancel_drain_leaves_an_owned_limit():
+    lb, _ = make_lb()
+    server = lb.servers[0]
+    server.reserve_slot()
+    owner = object()
+    server.limit_slots(2, owner=owner)
+    lb.drain_server("s0")
+
+    assert lb.cancel_drain("s0")
+    assert server.slot_limit == 2
+    assert server.slot_owner is owner
+
+
+def test_pending_drain_does_not_spin_the_scaler():
+    # real clocks: the load balancer on perf_counter, the scaler on time.time
+    lb = LoadBalancer(RoutingAlgo.LEAST_CONNECTIONS, dispatcher=create_dispatcher(DispatchMode.INLINE))
+    for i in range(3):
+        lb.add_server(Server(f"s{i}", max_capacity=4, base_response_time=0.0))
+    scaler = AutoScaler(lb, min_servers=1, max_servers=3)
+
+    lb.servers[0].reserve_slot()
+    lb.drain_server("s0", timeout=30)
+    assert 29 < lb.time_until_next_drain() <= 30
+
+    scaler.start()
+    try:
+        time.sleep(0.5)
+    finally:
+        scaler.stop()
+
+    # one check on start up and maybe a recheck, not one per loop
+    assert scaler.checks < 5
@@ -0,0 +1,102 @@
+import random
+
+from src.server import Server, ServerStatus
+from src.health import HealthChecker, BreakerState
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import DispatchMode, create_dispatcher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cluster(servers=4):
+    clock = FakeClock()
+    lb = LoadBalancer(RoutingAlgo.ROTATING, dispatcher=create_dispatcher(DispatchMode.INLINE), clock=clock)
+    for i in range(servers):
+        lb.add_server(Server(f"s{i}", max_capacity=4, base_response_time=0))
+    health = HealthChecker(lb, clock=clock, base_ejection=10)
+    health.check()
+    return lb, health, clock
+
+
+def send(lb, count, prefix="r"):
+    for i in range(count):
+        lb.route_request(f"{prefix}-{i}")
+
+
+def test_failing_server_is_ejected_and_readmitted():
+    lb, health, clock = make_cluster()
+    sick = lb.servers[0]
+    sick.degrade(error_rate=1.0, rng=random.Random(0))
+    send(lb, 40)
+
+    health.check()
+    assert health.state_of("s0") == BreakerState.OPEN
+    assert sick.status == ServerStatus.DOWN
+    handled = sick.total_requests_handled
+    send(lb, 20, "ejected")
+    assert sick.total_requests_handled == handled
+
+    # well again, once the ejection is over it is let back on trial
+    sick.degrade()
+    clock.now = 10
+    health.check()
+    assert health.state_of("s0") == BreakerState.HALF_OPEN
+    assert sick.status == ServerStatus.HEALTHY
+    assert sick.slot_limit == 1 and sick.slot_owner is health
+
+    send(lb, 8, "trial")
+    health.check()
+    assert health.state_of("s0") == BreakerState.CLOSED
+    assert sick.slot_limit == sick.max_capacity and sick.slot_owner is None
+    assert health.get_stats()["recoveries"] == 1
+
+
+def test_failed_trial_ejects_for_longer():
+    lb, health, clock = make_cluster()
+    sick = lb.servers[0]
+    sick.degrade(error_rate=1.0, rng=random.Random(0))
+    send(lb, 40)
+    health.check()
+    assert health.records["s0"].ejected_until == 10
+
+    clock.now = 10
+    health.check()
+    assert health.state_of("s0") == BreakerState.HALF_OPEN
+
+    send(lb, 8, "trial")
+    health.check()
+    assert health.state_of("s0") == BreakerState.OPEN
+    assert health.records["s0"].ejected_until == 10 + 20
+    assert sick.slot_owner is None
+
+
+def test_unreachable_server_is_ejected_by_probes():
+    lb, health, clock = make_cluster()
+    lb.servers[1].degrade(reachable=False)
+
+    health.check()
+    assert health.state_of("s1") == BreakerState.CLOSED
+    health.check()
+    assert health.state_of("s1") == BreakerState.OPEN
+
+    # still unreachable when the ejection ends, so it stays out
+    clock.now = 10
+    health.check()
+    assert health.state_of("s1") == BreakerState.OPEN
+    assert health.records["s1"].ejected_until == 10 + 20
+
+
+def test_never_ejects_more_than_the_limit():
+    lb, health, _ = make_cluster(servers=2)
+    for server in lb.servers:
+        server.degrade(reachable=False)
+
+    health.check()
+    health.check()
+    assert health.get_stats()["ejected"] == 1
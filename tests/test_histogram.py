@@ -0,0 +1,87 @@
+import pytest
+
+from src.histogram import LatencyHistogram, RequestTimings
+
+
+def test_empty_histogram_reports_zero():
+    histogram = LatencyHistogram()
+    assert histogram.percentiles((50, 99)) == {50: 0.0, 99: 0.0}
+    assert histogram.mean() == 0.0
+
+
+def test_percentiles_within_bucket_error():
+    histogram = LatencyHistogram()
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000)
+
+    result = histogram.percentiles((50, 95, 99))
+    assert result[50] == pytest.approx(0.5, rel=0.03)
+    assert result[95] == pytest.approx(0.95, rel=0.03)
+    assert result[99] == pytest.approx(0.99, rel=0.03)
+    assert histogram.mean() == pytest.approx(0.5005, rel=1e-6)
+
+
+def test_small_values_are_exact():
+    histogram = LatencyHistogram()
+    histogram.record(0.000010)
+    assert histogram.percentile(50) == 0.000010
+
+
+def test_never_reports_past_the_largest_value():
+    histogram = LatencyHistogram()
+    histogram.record(0.123)
+    assert histogram.percentile(99) <= 0.123
+
+
+def test_values_over_max_land_in_last_bucket():
+    histogram = LatencyHistogram(max_seconds=1)
+    histogram.record(50)
+    assert histogram.percentile(99) == 1.0
+
+
+def test_percentiles_cache_sees_new_records():
+    histogram = LatencyHistogram()
+    histogram.record(0.1)
+    assert histogram.percentile(50) == pytest.approx(0.1, rel=0.03)
+    histogram.record(2.0)
+    histogram.record(2.0)
+    assert histogram.percentile(50) == pytest.approx(2.0, rel=0.03)
+
+
+def test_merge_adds_counts():
+    first = LatencyHistogram()
+    second = LatencyHistogram()
+    first.record(0.1)
+    second.record(0.3)
+    second.record(0.3)
+
+    first.merge(second)
+    assert first.count == 3
+    assert first.percentile(50) == pytest.approx(0.3, rel=0.03)
+    assert first.min_value == 100_000
+
+
+def test_merge_needs_same_settings():
+    with pytest.raises(ValueError):
+        LatencyHistogram(sub_bucket_bits=6).merge(LatencyHistogram(sub_bucket_bits=5))
+
+
+def test_reset_clears_everything():
+    histogram = LatencyHistogram()
+    histogram.record(1.0)
+    histogram.reset()
+    assert histogram.count == 0
+    assert histogram.percentile(99) == 0.0
+
+
+def test_request_timings_record_into_parent():
+    cluster = RequestTimings()
+    server = RequestTimings(parent=cluster)
+    server.record(0.1, 0.4)
+
+    for timings in (server, cluster):
+        stats = timings.get_stats()
+        assert stats["completed"] == 1
+        assert stats["p50_latency"] == pytest.approx(0.5, rel=0.03)
+        assert stats["p99_queue_wait"] == pytest.approx(0.1, rel=0.03)
+        assert stats["mean_service_time"] == pytest.approx(0.4)
@@ -0,0 +1,120 @@
+import json
+import http.client
+import random
+
+from src.server import Server
+from src.auto_scaler import AutoScaler
+from src.http_endpoint import MetricsEndpoint
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import DispatchMode, create_dispatcher
+
+
+def make_endpoint(**options):
+    lb = LoadBalancer(RoutingAlgo.ROTATING, dispatcher=create_dispatcher(DispatchMode.INLINE), **options)
+    for i in range(2):
+        lb.add_server(Server(f"s{i}", max_capacity=4, base_response_time=0.001))
+    scaler = AutoScaler(lb, min_servers=1, max_servers=4)
+    return MetricsEndpoint(lb, None, scaler, port=0), lb, scaler
+
+
+def metric_lines(endpoint):
+    endpoint.refresh()
+    status, content_type, body = endpoint._route("GET", "/metrics", b"")
+    assert status == 200
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in body.decode().splitlines() if line and not line.startswith("#")}
+
+
+def test_summary_sum_and_count_match_its_quantiles_with_retries():
+    endpoint, lb, _ = make_endpoint(retries=2)
+    lb.servers[0].degrade(error_rate=1.0, rng=random.Random(0))
+    for i in range(10):
+        lb.route_request(f"r{i}")
+
+    metrics = metric_lines(endpoint)
+    latency = lb.resilience.latency
+
+    # ten requests answered, more copies than that ran on the servers
+    assert metrics["stc_request_duration_seconds_count"] == latency.count == 10
+    assert lb.timings.total.count > 10
+    assert metrics["stc_request_duration_seconds_sum"] == latency.total / 1_000_000
+
+
+def test_read_endpoints():
+    endpoint, lb, _ = make_endpoint()
+    lb.route_request("r0")
+    metrics = metric_lines(endpoint)
+    assert metrics["stc_servers"] == 2
+    assert endpoint.scrapes == 1
+
+    status, content_type, body = endpoint._route("GET", "/stats", b"")
+    assert (status, content_type) == (200, "application/json")
+    assert json.loads(body)["load_balancer"]["total_servers"] == 2
+
+    assert endpoint._route("GET", "/healthz", b"") == (200, "text/plain", b"ok\n")
+
+
+def test_wrong_method_and_unknown_path():
+    endpoint, _, _ = make_endpoint()
+    endpoint.refresh()
+    assert endpoint._route("POST", "/metrics", b"")[0] == 405
+    assert endpoint._route("GET", "/control/scaler", b"")[0] == 405
+    assert endpoint._route("GET", "/nothing", b"")[0] == 404
+
+
+def test_controls_change_the_system():
+    endpoint, lb, scaler = make_endpoint()
+    endpoint.refresh()
+
+    status, _, body = endpoint._route("POST", "/control/algorithm?name=least_connections", b"")
+    assert status == 200
+    assert json.loads(body) == {"algorithm": "least_connections"}
+    assert lb.rounting_algo == RoutingAlgo.LEAST_CONNECTIONS
+
+    status, _, body = endpoint._route("POST", "/control/scaler", b'{"min": 2, "max": 6}')
+    assert status == 200
+    assert (scaler.min_servers, scaler.max_servers) == (2, 6)
+
+    # form bodies work too, and an unset bound is left alone
+    assert endpoint._route("POST", "/control/scaler", b"max=5")[0] == 200
+    assert (scaler.min_servers, scaler.max_servers) == (2, 5)
+
+
+def test_bad_control_requests_are_400s():
+    endpoint, lb, scaler = make_endpoint()
+    endpoint.refresh()
+
+    for target, body in (("/control/algorithm", b""),
+                         ("/control/algorithm", b'{"name": "fastest"}'),
+                         ("/control/algorithm", b'{"name": null}'),
+                         ("/control/scaler", b'{"min": null}'),
+                         ("/control/scaler", b"min=two"),
+                         ("/control/scaler", b"[1, 2]"),
+                         ("/control/scaler", b"{not json")):
+        status, content_type, payload = endpoint._route("POST", target, body)
+        assert (status, content_type) == (400, "application/json"), body
+        assert "error" in json.loads(payload)
+
+    assert lb.rounting_algo == RoutingAlgo.ROTATING
+    assert (scaler.min_servers, scaler.max_servers) == (1, 4)
+
+
+def test_serves_over_http():
+    endpoint, _, _ = make_endpoint()
+    endpoint.start()
+    try:
+        connection = http.client.HTTPConnection(endpoint.host, endpoint.port, timeout=5)
+        connection.request("GET", "/metrics")
+        response = connection.getresponse()
+        assert response.status == 200
+        assert b"stc_servers 2" in response.read()
+        connection.close()
+
+        connection = http.client.HTTPConnection(endpoint.host, endpoint.port, timeout=5)
+        connection.request("POST", "/control/algorithm", body=b'{"name": 1}', headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        assert response.status == 400
+        response.read()
+        connection.close()
+    finally:
+        endpoint.stop()
@@ -0,0 +1,95 @@
+import random
+
+from src.server import Server, ServerStatus
+from src.indexed_heap import ServerHeap
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import DispatchMode, create_dispatcher
+
+
+def make_servers(count, capacity=4):
+    return [Server(f"s{i}", max_capacity=capacity) for i in range(count)]
+
+
+def test_peek_is_least_loaded_and_ties_go_to_first_added():
+    heap = ServerHeap()
+    servers = make_servers(3)
+    for server in servers:
+        heap.push(server)
+
+    assert heap.peek() is servers[0]
+
+    servers[0].current_requests = 2
+    heap.update(servers[0])
+    assert heap.peek() is servers[1]
+
+
+def test_full_and_down_servers_sink():
+    heap = ServerHeap()
+    servers = make_servers(2, capacity=1)
+    for server in servers:
+        heap.push(server)
+
+    servers[0].current_requests = 1
+    heap.update(servers[0])
+    servers[1].status = ServerStatus.DOWN
+    heap.update(servers[1])
+
+    # nobody can take a request, the least loaded of them is on top
+    assert not heap.peek().can_handle_request()
+    assert heap.peek() is servers[1]
+
+
+def test_push_twice_and_remove_missing_are_ignored():
+    heap = ServerHeap()
+    server = make_servers(1)[0]
+    heap.push(server)
+    heap.push(server)
+    assert len(heap) == 1
+
+    heap.remove(server)
+    heap.remove(server)
+    assert len(heap) == 0
+    assert heap.peek() is None
+
+
+def test_matches_a_scan_under_random_changes():
+    rng = random.Random(7)
+    heap = ServerHeap()
+    servers = make_servers(30, capacity=10)
+    for server in servers:
+        heap.push(server)
+    live = list(servers)
+
+    for _ in range(2000):
+        action = rng.random()
+        if action < 0.1 and len(live) > 1:
+            server = live.pop(rng.randrange(len(live)))
+            heap.remove(server)
+        elif action < 0.2 and len(live) < len(servers):
+            server = rng.choice([s for s in servers if s not in live])
+            heap.push(server)
+            live.append(server)
+        else:
+            server = rng.choice(live)
+            server.current_requests = rng.randrange(11)
+            heap.update(server)
+
+        best = min(live, key=lambda s: (not s.can_handle_request(), s.current_requests, heap.order[s.server_id]))
+        assert heap.peek() is best
+        assert len(heap) == len(live)
+        assert all(heap.heap[index][1].server_id == server_id for server_id, index in heap.positions.items())
+
+
+def test_removed_server_leaves_the_heap_with_the_pool():
+    lb = LoadBalancer(RoutingAlgo.LEAST_CONNECTIONS, dispatcher=create_dispatcher(DispatchMode.INLINE))
+    servers = make_servers(3)
+    for server in servers:
+        lb.add_server(server)
+
+    lb.remove_server("s0")
+    assert "s0" not in lb.connection_heap.positions
+    assert lb._select_server() is servers[1]
+
+    # a late load change on the removed server does not put it back
+    lb.connection_heap.update(servers[0])
+    assert len(lb.connection_heap) == 2
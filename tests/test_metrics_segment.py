@@ -0,0 +1,69 @@
+import pytest
+
+from src.server import Server
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import DispatchMode, create_dispatcher
+from src.metrics_segment import SeqlockBlock, MetricsPublisher, MetricsReader
+
+
+def test_seqlock_reads_back_the_last_write():
+    block = SeqlockBlock("qd")
+    buf = bytearray(block.size)
+    assert block.read(buf, 0) == (0, (0, 0.0))
+
+    block.write(buf, 0, (3, 1.5))
+    block.write(buf, 0, (4, 2.5))
+    assert block.read(buf, 0) == (4, (4, 2.5))
+
+
+def test_seqlock_read_gives_up_on_an_unfinished_write():
+    block = SeqlockBlock("q")
+    buf = bytearray(block.size)
+    block.write(buf, 0, (1,))
+
+    # leave the sequence odd, as if the writer stopped half way
+    block.sequence.pack_into(buf, 0, 3)
+    assert block.read(buf, 0, retries=10) is None
+
+
+def test_blocks_at_an_offset_are_separate():
+    block = SeqlockBlock("q")
+    buf = bytearray(block.size * 2)
+    block.write(buf, block.size, (9,))
+    assert block.read(buf, 0) == (0, (0,))
+    assert block.read(buf, block.size) == (2, (9,))
+
+
+def test_reader_sees_what_the_publisher_wrote(tmp_path):
+    lb = LoadBalancer(RoutingAlgo.ROTATING, dispatcher=create_dispatcher(DispatchMode.INLINE))
+    for i in range(2):
+        lb.add_server(Server(f"s{i}", max_capacity=4, base_response_time=0))
+    for i in range(6):
+        lb.route_request(f"r{i}")
+
+    path = str(tmp_path / "metrics")
+    publisher = MetricsPublisher(lb, path, max_servers=4)
+    publisher.publish()
+
+    reader = MetricsReader(path)
+    try:
+        assert reader.algorithm == RoutingAlgo.ROTATING.value
+        stats = reader.get_stats()
+        assert stats["total_servers"] == 2
+        assert stats["total_requests_routed"] == 6
+        assert stats["published_servers"] == 2
+
+        servers = reader.server_stats()
+        assert [server["server_id"] for server in servers] == ["s0", "s1"]
+        assert sum(server["total_handled"] for server in servers) == 6
+        assert servers[0]["status"] == "Healthy"
+    finally:
+        reader.close()
+        publisher.stop()
+
+
+def test_reader_refuses_other_files(tmp_path):
+    path = tmp_path / "other"
+    path.write_bytes(bytes(128))
+    with pytest.raises(ValueError):
+        MetricsReader(str(path))
@@ -0,0 +1,105 @@
+import pytest
+
+from src.provisioning import Provisioner
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import DispatchMode, create_dispatcher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_provisioner(**options):
+    clock = FakeClock()
+    lb = LoadBalancer(RoutingAlgo.ROTATING, dispatcher=create_dispatcher(DispatchMode.INLINE), clock=clock)
+    provisioner = Provisioner(lb, boot_time=10, warmup_time=20, warmup_capacity=0.25, server_capacity=8, clock=clock, **options)
+    return lb, provisioner, clock
+
+
+def test_cold_start_boots_then_warms_up():
+    lb, provisioner, clock = make_provisioner()
+    assert provisioner.request_server("new") is None
+    assert provisioner.pending() == 1
+    assert provisioner.next_due() == 10
+
+    clock.now = 9
+    provisioner.tick()
+    assert not lb.servers
+
+    clock.now = 10
+    provisioner.tick()
+    server = lb.servers[0]
+    assert provisioner.pending() == 0
+    assert server.slot_limit == 2
+
+    # slots open in a straight line over the warm-up
+    clock.now = 20
+    provisioner.tick()
+    assert server.slot_limit == 5
+
+    clock.now = 30
+    provisioner.tick()
+    assert server.slot_limit == 8 and server.slot_owner is None
+
+    stats = provisioner.get_stats()
+    assert stats["cold_starts"] == 1 and stats["warming"] == 0
+    assert stats["p50_time_to_first_slot"] == pytest.approx(10, rel=0.03)
+    assert stats["p50_time_to_capacity"] == pytest.approx(30, rel=0.03)
+
+
+def test_no_warm_up_joins_at_full_capacity():
+    lb, provisioner, clock = make_provisioner()
+    provisioner.warmup_time = 0
+    provisioner.request_server("new")
+    clock.now = 10
+    provisioner.tick()
+    assert lb.servers[0].slot_limit == 8
+    assert provisioner.time_to_capacity.count == 1
+
+
+def test_standby_is_promoted_and_replaced():
+    lb, provisioner, clock = make_provisioner(standby=1)
+    assert provisioner.servers_paid() == 1
+
+    server = provisioner.request_server("new")
+    assert server in lb.servers
+    assert server.slot_limit == 8
+    assert provisioner.promotions == 1
+
+    # the replacement boots and warms outside the load balancer, the scaler doesnt wait for it
+    assert provisioner.pending() == 0
+    assert provisioner.servers_paid() == 1
+
+    clock.now = 10
+    provisioner.tick()
+    assert not provisioner.pool
+    clock.now = 30
+    provisioner.tick()
+    assert len(provisioner.pool) == 1
+    assert len(lb.servers) == 1
+
+    # with the pool empty the next one is a cold start
+    assert provisioner.request_server("second") is not None
+    assert provisioner.request_server("third") is None
+    assert provisioner.cold_starts == 1
+
+
+def test_cancel_boot_gives_up_the_latest():
+    lb, provisioner, clock = make_provisioner()
+    provisioner.request_server("first")
+    clock.now = 5
+    provisioner.request_server("second")
+
+    assert provisioner.cancel_boot()
+    assert provisioner.pending() == 1
+
+    clock.now = 20
+    provisioner.tick()
+    assert [server.server_id for server in lb.servers] == ["first"]
+
+    assert not provisioner.cancel_boot()
+    assert provisioner.boots_cancelled == 1
@@ -0,0 +1,77 @@
+import random
+
+from src.server import Server
+from src.resilience import RetryBudget
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import DispatchMode, create_dispatcher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_budget_starts_full_and_runs_out():
+    budget = RetryBudget(ratio=0.2, min_per_second=0.0, max_tokens=3, clock=FakeClock())
+    assert [budget.try_spend() for _ in range(4)] == [True, True, True, False]
+    assert budget.spent == 3
+    assert budget.denied == 1
+
+
+def test_requests_earn_their_ratio():
+    budget = RetryBudget(ratio=0.25, min_per_second=0.0, max_tokens=10, clock=FakeClock())
+    budget.tokens = 0
+    for _ in range(8):
+        budget.deposit()
+
+    # eight requests pay for two retries
+    assert [budget.try_spend() for _ in range(3)] == [True, True, False]
+
+
+def test_floor_refills_with_time_up_to_max():
+    clock = FakeClock()
+    budget = RetryBudget(ratio=0.2, min_per_second=0.5, max_tokens=2, clock=clock)
+    budget.tokens = 0
+    assert not budget.try_spend()
+
+    clock.now = 2.0
+    assert budget.try_spend()
+
+    clock.now = 100.0
+    assert budget.try_spend()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+
+
+def test_keep_leaves_tokens_for_others():
+    budget = RetryBudget(ratio=0.2, min_per_second=0.0, max_tokens=10, clock=FakeClock())
+    budget.tokens = 5.5
+    assert not budget.try_spend(keep=5)
+    assert budget.try_spend(keep=4)
+    assert budget.tokens == 4.5
+
+
+def test_refund_gives_the_token_back():
+    budget = RetryBudget(ratio=0.2, min_per_second=0.0, max_tokens=1, clock=FakeClock())
+    assert budget.try_spend()
+    budget.refund()
+    assert budget.spent == 0
+    assert budget.try_spend()
+
+
+def test_inline_retry_while_routing_does_not_deadlock():
+    lb = LoadBalancer(RoutingAlgo.ROTATING, dispatcher=create_dispatcher(DispatchMode.INLINE), retries=2)
+    for i in range(3):
+        lb.add_server(Server(f"s{i}", max_capacity=3, base_response_time=0.001))
+    lb.servers[0].degrade(error_rate=1.0, rng=random.Random(0))
+
+    # reserving a slot for r1 admits the waiting request, which fails on s0 and is retried under the routing lock
+    lb.admission.enqueue("waiting")
+    assert lb.route_request("r1")
+
+    stats = lb.get_stats()
+    assert stats["retries"] >= 1
+    assert stats["failed_requests"] == 0
@@ -0,0 +1,21 @@
+from src.server import Server, ServerStatus
+
+
+def test_get_stats_does_not_change_the_status():
+    server = Server("s0", max_capacity=4)
+    for _ in range(4):
+        assert server.reserve_slot()
+
+    # a full server read from a dashboard must not be marked out of service
+    assert server.get_stats()["status"] == ServerStatus.HEALTHY.value
+    assert server.status == ServerStatus.HEALTHY
+    str(server)
+
+    server.current_requests -= 1
+    assert server.can_handle_request()
+
+
+def test_get_stats_leaves_a_set_status():
+    server = Server("s0")
+    server.set_status(ServerStatus.DOWN)
+    assert server.get_stats()["status"] == ServerStatus.DOWN.value
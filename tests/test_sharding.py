@@ -0,0 +1,42 @@
+from src.sharding import ShardMetrics, METRIC_FIELDS
+
+
+def stats(value):
+    return {field: value for field in METRIC_FIELDS}
+
+
+def test_rows_are_read_back():
+    metrics = ShardMetrics(2)
+    try:
+        metrics.write(1, stats(7))
+        metrics.write(1, stats(8))
+        row = metrics.read(1)
+        assert row["current_load"] == 8
+        assert row["publishes"] == 2
+        assert metrics.read(0)["publishes"] == 0
+    finally:
+        metrics.close(unlink=True)
+
+
+def test_row_stuck_mid_write_returns_the_last_good_read():
+    metrics = ShardMetrics(1)
+    try:
+        metrics.write(0, stats(5))
+        assert metrics.read(0)["current_load"] == 5
+
+        # leave the sequence odd, as if a writer never finished
+        metrics.row.sequence.pack_into(metrics.memory.buf, 0, 3)
+        row = metrics.read(0)
+        assert row["current_load"] == 5
+        assert row["publishes"] == 1
+    finally:
+        metrics.close(unlink=True)
+
+
+def test_row_stuck_before_any_good_read_is_zeros():
+    metrics = ShardMetrics(1)
+    try:
+        metrics.row.sequence.pack_into(metrics.memory.buf, 0, 1)
+        assert metrics.read(0)["current_load"] == 0
+    finally:
+        metrics.close(unlink=True)
@@ -0,0 +1,28 @@
+from src.simulation import Simulation
+from src.load_balancer import RoutingAlgo
+from src.traffic_generator import TrafficPattern
+
+
+def run(seed, **options):
+    return Simulation(TrafficPattern.BURST, duration=300, seed=seed, **options).run()
+
+
+def test_same_seed_same_results():
+    assert run(1) == run(1)
+
+
+def test_same_seed_same_results_with_everything_on():
+    options = {"rounting_algo": RoutingAlgo.POWER_OF_TWO, "health_checks": True, "boot_time": 10, "warmup_time": 20,
+               "standby": 1, "retries": 2, "hedge_percentile": 90}
+    assert run(3, **options) == run(3, **options)
+
+
+def test_different_seeds_differ():
+    assert run(1) != run(2)
+
+
+def test_results_add_up():
+    results = run(1)
+    assert results["total_requests"] > 0
+    assert 0 <= results["failed_requests"] <= results["total_requests"]
+    assert results["p50_latency"] <= results["p95_latency"] <= results["p99_latency"]
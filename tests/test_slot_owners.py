@@ -0,0 +1,70 @@
+from src.server import Server
+from src.health import HealthChecker, BreakerState
+from src.provisioning import Provisioner
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import DispatchMode, create_dispatcher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_only_the_owner_changes_a_limit():
+    server = Server("s0", max_capacity=8)
+    owner, other = object(), object()
+
+    assert server.limit_slots(2, owner=owner)
+    assert not server.limit_slots(5, owner=other)
+    assert not server.limit_slots(None)
+    assert server.slot_limit == 2
+
+    assert server.limit_slots(None, owner=owner)
+    assert server.slot_limit == 8
+    assert server.slot_owner is None
+
+    # a limit nobody owns can be changed by anyone
+    assert server.limit_slots(3)
+    assert server.limit_slots(4, owner=other)
+
+
+def make_system():
+    clock = FakeClock()
+    lb = LoadBalancer(RoutingAlgo.ROTATING, dispatcher=create_dispatcher(DispatchMode.INLINE), clock=clock)
+    provisioner = Provisioner(lb, boot_time=10, warmup_time=20, warmup_capacity=0.25, server_capacity=8, clock=clock)
+    health = HealthChecker(lb, clock=clock)
+
+    provisioner.request_server("new")
+    clock.now = 10
+    provisioner.tick()
+    health.check()
+    return lb.servers[0], clock, provisioner, health, health.records["new"]
+
+
+def test_health_trial_does_not_undo_a_warm_up():
+    server, clock, provisioner, health, record = make_system()
+    assert server.slot_limit == 2 and server.slot_owner is provisioner
+
+    health._eject(record, "test", clock.now)
+    assert server.slot_limit == 2
+
+    # back on trial while still warming, the warm-up limit stays
+    health._try_recover(record, clock.now)
+    assert record.state == BreakerState.HALF_OPEN
+    assert server.slot_owner is provisioner
+
+    clock.now = 20
+    provisioner.tick()
+    assert server.slot_limit == 5
+
+    health._close(record, clock.now)
+    assert server.slot_limit == 5
+
+    clock.now = 30
+    provisioner.tick()
+    assert server.slot_limit == 8
+    assert provisioner.time_to_capacity.count == 1
+
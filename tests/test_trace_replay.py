@@ -0,0 +1,76 @@
+import pytest
+
+from src.server import Server
+from src.load_balancer import LoadBalancer, RoutingAlgo
+from src.dispatcher import DispatchMode, create_dispatcher
+from src.trace_replay import parse_line, read_trace, write_trace, TraceReplayGenerator
+
+
+def test_parse_line():
+    assert parse_line(b"12.5,user-1\n") == (12.5, "user-1")
+    assert parse_line(b"3\n") == (3.0, None)
+    assert parse_line(b"3,\n") == (3.0, None)
+    assert parse_line(b"4, spaced ,extra,fields\n") == (4.0, "spaced")
+
+
+def test_parse_line_skips_what_is_not_a_request():
+    for line in (b"\n", b"   \n", b"# recorded yesterday\n", b"timestamp,key\n", b"soon,user-1\n"):
+        assert parse_line(line) is None
+
+
+def test_read_trace_gives_back_what_was_written(tmp_path):
+    path = str(tmp_path / "trace.csv")
+    write_trace(path, [(1.0, "a"), (1.5, None), (2.25, "b")])
+    assert list(read_trace(path)) == [(1.0, "a"), (1.5, None), (2.25, "b")]
+
+
+def test_read_trace_of_an_empty_file(tmp_path):
+    path = tmp_path / "empty.csv"
+    path.write_bytes(b"")
+    assert list(read_trace(str(path))) == []
+
+
+def test_read_trace_with_no_newline_at_the_end(tmp_path):
+    path = tmp_path / "trace.csv"
+    path.write_bytes(b"# comment\r\n1,a\r\n2,b")
+    assert list(read_trace(str(path))) == [(1.0, "a"), (2.0, "b")]
+
+
+def make_replay(tmp_path, entries, speed):
+    path = str(tmp_path / "trace.csv")
+    write_trace(path, entries)
+    lb = LoadBalancer(RoutingAlgo.ROTATING, dispatcher=create_dispatcher(DispatchMode.INLINE))
+    lb.add_server(Server("s0", max_capacity=10, base_response_time=0))
+    replay = TraceReplayGenerator(lb, path, speed=speed)
+    replay.is_running = True
+    return replay
+
+
+def test_replay_sends_requests_when_they_are_due(tmp_path):
+    replay = make_replay(tmp_path, [(100.0, "a"), (101.0, "b"), (104.0, "c")], speed=2)
+
+    replay._send_batch(0.0)
+    assert replay.request_counter == 1
+    assert replay._calculate_sleep_time(0.0) == pytest.approx(0.5)
+
+    replay._send_batch(0.6)
+    assert replay.request_counter == 2
+    assert replay.max_lag == pytest.approx(0.1)
+    assert not replay.finished
+
+    replay._send_batch(2.0)
+    assert replay.request_counter == 3
+    assert replay.finished
+    assert replay._calculate_sleep_time(2.0) == float("inf")
+
+
+def test_full_speed_replay_sends_in_batches(tmp_path):
+    replay = make_replay(tmp_path, [(float(i), None) for i in range(25)], speed=None)
+    replay.batch_size = 10
+
+    replay._send_batch(0.0)
+    assert replay.request_counter == 10
+    replay._send_batch(0.0)
+    replay._send_batch(0.0)
+    assert replay.request_counter == 25
+    assert replay.finished
@@ -0,0 +1,62 @@
+from collections import Counter
+
+from src.server import Server
+from src.weighted import WeightedSchedule
+
+
+def make_schedule(*weights):
+    servers = [Server(f"s{i}", max_capacity=100, weight=weight) for i, weight in enumerate(weights)]
+    schedule = WeightedSchedule()
+    for server in servers:
+        schedule.add(server)
+    return schedule, servers
+
+
+def test_smooth_order():
+    schedule, servers = make_schedule(3, 1)
+    picks = [schedule.next(servers).server_id for _ in range(8)]
+    assert picks == ["s0", "s0", "s1", "s0"] * 2
+
+
+def test_shares_follow_weights_and_gcd_shortens_schedule():
+    schedule, servers = make_schedule(50, 30, 20)
+    counts = Counter(schedule.next(servers).server_id for _ in range(100))
+    assert counts == {"s0": 50, "s1": 30, "s2": 20}
+    assert len(schedule.schedule) == 10
+
+
+def test_full_servers_are_skipped():
+    schedule, servers = make_schedule(1, 1)
+    servers[0].current_requests = servers[0].max_capacity
+    assert {schedule.next(servers).server_id for _ in range(4)} == {"s1"}
+
+    servers[1].current_requests = servers[1].max_capacity
+    assert schedule.next(servers) is None
+
+
+def test_rebuilds_only_on_changes():
+    schedule, servers = make_schedule(2, 1)
+    schedule.next(servers)
+    schedule.next(servers)
+    assert schedule.rebuilds == 1
+
+    schedule.check(servers[0])
+    schedule.next(servers)
+    assert schedule.rebuilds == 1
+
+    servers[1].set_weight(2)
+    schedule.check(servers[1])
+    counts = Counter(schedule.next(servers).server_id for _ in range(4))
+    assert schedule.rebuilds == 2
+    assert counts == {"s0": 2, "s1": 2}
+
+
+def test_long_schedules_are_scaled_down():
+    schedule = WeightedSchedule(max_length=100)
+    servers = [Server("big", max_capacity=10, weight=10_000), Server("small", max_capacity=10, weight=1)]
+    for server in servers:
+        schedule.add(server)
+    schedule.next(servers)
+
+    assert len(schedule.schedule) <= 101
+    assert "small" in {server.server_id for server in schedule.schedule}